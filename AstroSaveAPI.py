@@ -0,0 +1,362 @@
+"""Embeddable API of AstroSaveConverter.
+
+Lists, converts and backs up saves without prompts nor console output, so
+that other tools can run conversions in-process::
+
+    import AstroSaveAPI
+
+    for save in AstroSaveAPI.list_saves(wgs_folder):
+        print(save.name, save.date, save.size)
+    for result in AstroSaveAPI.export_to_steam(wgs_folder, steam_folder, overwrite=AstroSaveAPI.SKIP):
+        print(result.name, result.status, result.path)
+
+Progress callbacks are called with the number of bytes done and the total
+number of bytes of the call. The interactive command line is a client of this
+module.
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import utils
+import AstroSaveScenario as Scenario
+from cogs import AstroCompression
+from cogs import AstroSaveStorage
+from cogs import AstroTeePipeline
+from cogs.AstroConversionManifest import AstroConversionManifest
+from cogs.AstroSave import AstroSave, MICROSOFT, STEAM
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+
+# What to do when an exported file already exists
+OVERWRITE = 'overwrite'
+SKIP = 'skip'
+FAIL = 'fail'
+
+# Status of an ``ExportResult``
+EXPORTED = 'exported'
+UNCHANGED = 'unchanged'
+EXISTING = 'existing'
+
+ProgressCallback = Callable[[int, int], None]
+
+# File marking a folder written by ``backup``, which a new backup may replace
+BACKUP_MARKER = '.astrosaveconverter_backup'
+
+
+class SaveInfo:
+    """A save found by ``list_saves``."""
+
+    def __init__(self, save: AstroSave, platform: str, folder: str, size: int, container: str = None) -> None:
+        """Describe a save.
+
+        Args:
+            save: The save itself, which can be passed to the exports.
+            platform: ``MICROSOFT`` or ``STEAM``.
+            folder: Folder holding the save.
+            size: Size of the save in the Steam format, in bytes.
+            container: Name of the container referencing a Microsoft save.
+        """
+        self.save = save
+        self.name = save.name
+        self.platform = platform
+        self.folder = folder
+        self.size = size
+        self.container = container
+        self.chunk_count = save.chunk_count
+        try:
+            self.date: Optional[datetime] = save.get_date()
+        except ValueError:
+            self.date = None
+
+
+class ExportResult:
+    """Outcome of the export of one save."""
+
+    def __init__(self, name: str, status: str, path: str, size: int, sha256: str = None,
+                 duration: float = 0.0) -> None:
+        """Describe an export.
+
+        Args:
+            name: Name of the exported save.
+            status: ``EXPORTED``, or why the save was not exported:
+                ``UNCHANGED`` since its last export or ``EXISTING`` file.
+            path: Exported Steam file, or Microsoft folder holding the chunks.
+            size: Size of the save, in bytes.
+            sha256: Digest of the Steam content of an exported Microsoft save.
+            duration: Seconds spent exporting the save.
+        """
+        self.name = name
+        self.status = status
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.duration = duration
+
+
+class BackupResult:
+    """Outcome of ``backup``."""
+
+    def __init__(self, source: str, path: str, size: int, duration: float) -> None:
+        self.source = source
+        self.path = path
+        self.size = size
+        self.duration = duration
+
+
+def open_container(path: str) -> Container:
+    """Parse a container file, which may be inside a zip or tar backup."""
+    return Container(path)
+
+
+def list_saves(path: str) -> List[SaveInfo]:
+    """List the saves of a container, a Microsoft save folder or a Steam save folder.
+
+    Args:
+        path: Container file, or save folder which may be inside a backup
+            archive for Microsoft saves.
+
+    Raises:
+        FileNotFoundError: If ``path`` holds no save.
+    """
+    if 'container' in os.path.basename(path) and not utils.is_folder_a_dir(path):
+        folder, container_names = utils.get_dir_name(path), [os.path.basename(path)]
+        storage = AstroSaveStorage.open_storage(folder)
+    else:
+        folder = path
+        storage = AstroSaveStorage.open_storage(path)
+        container_names = sorted(name for name in storage.list_files() if 'container' in name)
+
+    if not container_names:
+        steam_files = sorted(AstroSave.get_steamsaves_list(path))
+        return [SaveInfo(save, STEAM, path, storage.get_size(save.get_file_name()))
+                for save in AstroSave.init_saves_list_from(steam_files)]
+
+    files = set(storage.list_files())
+    saves = []
+    for container_name in container_names:
+        for save in open_container(utils.join_paths(storage.path, container_name)).save_list:
+            # A missing chunk is left out, see ``AstroSaveCheck`` to find them
+            size = sum(storage.get_size(name) for name in save.chunks_names if name in files)
+            saves.append(SaveInfo(save, MICROSOFT, folder, size, container_name))
+    return saves
+
+
+def find_saves(source: str, names: List[str]) -> List[AstroSave]:
+    """Return the Microsoft saves with the given full names (with their date).
+
+    Only the container records needed to find the saves are read, see
+    ``AstroSaveContainer.find_save``. Like ``select_saves``, the last container
+    holding a save wins.
+
+    Raises:
+        KeyError: If a save is not found.
+    """
+    storage = AstroSaveStorage.open_storage(source)
+    containers = [open_container(utils.join_paths(storage.path, name))
+                  for name in sorted(storage.list_files(), reverse=True) if 'container' in name]
+    saves = []
+    for name in names:
+        for container in containers:
+            try:
+                saves.append(container.find_save(name))
+                break
+            except KeyError:
+                continue
+        else:
+            raise KeyError(f'Save {name} not found')
+    return saves
+
+
+def select_saves(available: List[SaveInfo], saves) -> List[AstroSave]:
+    """Return the saves of ``available`` designated by ``saves``.
+
+    Args:
+        available: Saves of the source.
+        saves: Saves, ``SaveInfo`` or save names (with or without date),
+            every available save if ``None``.
+
+    Raises:
+        KeyError: If a save name is not found.
+    """
+    if saves is None:
+        return [info.save for info in available]
+
+    selected = []
+    for save in saves:
+        if isinstance(save, SaveInfo):
+            save = save.save
+        if isinstance(save, str):
+            matches = [info.save for info in available if save in (info.name, info.save.get_base_name())]
+            if not matches:
+                raise KeyError(f'Save {save} not found')
+            save = matches[-1]
+        selected.append(save)
+    return selected
+
+
+def export_to_steam(source: str, target: str, saves: Iterable[Union[AstroSave, SaveInfo, str]] = None,
+                    overwrite: Union[str, Callable[[AstroSave, str], bool]] = FAIL,
+                    skip_unchanged: bool = True, progress: ProgressCallback = None,
+                    backup=None, compression: str = None, level: int = None) -> List[ExportResult]:
+    """Export Microsoft saves to Steam ``.savegame`` files.
+
+    Args:
+        source: Microsoft save folder, which may be inside a backup archive.
+        target: Steam save folder.
+        saves: Saves to export, every save of ``source`` if ``None``. Saves
+            can be renamed before being exported.
+        overwrite: ``OVERWRITE``, ``SKIP`` or ``FAIL`` when a Steam file
+            already exists, or function called with the save and the path of
+            the existing file, returning ``True`` to overwrite it. The
+            function may rename the save instead.
+        skip_unchanged: Don't export again the saves that are unchanged since
+            their last export, according to the manifest of ``target``.
+        progress: Progress callback.
+        backup: Backup receiving a copy of the chunks of the exported saves
+            while they are read, see ``AstroTeePipeline.open_backup``. It
+            is neither completed with the other files nor closed.
+        compression: One of ``AstroCompression.COMPRESSIONS`` to export
+            ``.savegame.<compression>`` files, ``None`` for plain ones.
+        level: Compression level, the codec default if ``None``.
+
+    Returns:
+        List[ExportResult]: One result per save, in the order of ``saves``.
+
+    Raises:
+        FileExistsError: If a file exists and ``overwrite`` is ``FAIL``,
+            nothing being exported.
+        ValueError: If ``overwrite`` or ``compression`` is unknown.
+    """
+    if not (callable(overwrite) or overwrite in (OVERWRITE, SKIP, FAIL)):
+        raise ValueError(f'Unknown overwrite policy {overwrite}')
+    if compression is not None and compression not in AstroCompression.COMPRESSIONS:
+        raise ValueError(f'Unknown compression: {compression}')
+    saves = None if saves is None else list(saves)
+    if saves is not None and all(isinstance(save, AstroSave) for save in saves):
+        selected = saves
+    elif saves is not None and all(isinstance(save, str) and '$' in save for save in saves):
+        selected = find_saves(source, saves)
+    else:
+        selected = select_saves(list_saves(source), saves)
+    os.makedirs(target, exist_ok=True)
+    manifest = AstroConversionManifest(target)
+
+    results = {}
+    to_export = []
+    for save in selected:
+        size = save.get_steam_size(source)
+        path = get_steam_export_path(save, target, compression)
+        if skip_unchanged and manifest.is_steam_export_up_to_date(save, source, compression):
+            results[id(save)] = ExportResult(save.name, UNCHANGED, path, size)
+            continue
+        if utils.is_path_exists(path) and overwrite != OVERWRITE:
+            if overwrite == FAIL:
+                raise FileExistsError(f'{path} already exists')
+            if overwrite == SKIP or not overwrite(save, path):
+                results[id(save)] = ExportResult(save.name, EXISTING, path, size)
+                continue
+        to_export.append((save, size))
+
+    progress_sink = AstroTeePipeline.ProgressSink(sum(size for _, size in to_export), progress or (lambda *_: None))
+    for save, size in to_export:
+        start = time.perf_counter()
+        digest = AstroTeePipeline.HashSink()
+        path = Scenario.export_save_to_steam(save, source, target, [digest, progress_sink], backup,
+                                             compression, level)
+        manifest.record_steam_export(save, source, digest.hexdigest(), compression)
+        manifest.save()
+        results[id(save)] = ExportResult(save.name, EXPORTED, path, size, digest.hexdigest(),
+                                         time.perf_counter() - start)
+    return [results[id(save)] for save in selected]
+
+
+def get_steam_export_path(save: AstroSave, target: str, compression: str = None) -> str:
+    """Return the path of the Steam file ``save`` is exported to with ``compression``."""
+    return utils.join_paths(target, AstroCompression.get_export_file_name(save, compression))
+
+
+def export_to_xbox(source: str, target: str, saves: Iterable[str] = None, renames: Dict[str, str] = None,
+                   skip_unchanged: bool = True, progress: ProgressCallback = None) -> List[ExportResult]:
+    """Export Steam saves into a Microsoft save folder.
+
+    Every written chunk is checkpointed, an interrupted export can be
+    finished with ``AstroSaveScenario.resume_xbox_export``.
+
+    Args:
+        source: Steam save folder, or a single ``.savegame`` file.
+        target: Microsoft save folder.
+        saves: Names of the saves to export, every save of ``source`` if
+            ``None``.
+        renames: New name of some saves, by current name.
+        skip_unchanged: Don't export again the saves that are unchanged since
+            their last export, according to the manifest of ``target``.
+        progress: Progress callback, called after each save.
+
+    Returns:
+        List[ExportResult]: One result per save.
+
+    Raises:
+        FileNotFoundError: If a save is not found in ``source``.
+    """
+    if utils.is_a_file(source):
+        source, file_names = utils.get_dir_name(source), [os.path.basename(source)]
+    else:
+        file_names = sorted(AstroSave.get_steamsaves_list(source))
+    if saves is not None:
+        file_names = [save + '.savegame' for save in saves]
+    renames = renames or {}
+
+    files = []
+    for file_name in file_names:
+        from_file = utils.join_paths(source, file_name)
+        save = AstroSave.init_saves_list_from([file_name])[0]
+        save.name = renames.get(save.name, save.name)
+        files.append((save, from_file, os.path.getsize(from_file)))
+
+    os.makedirs(target, exist_ok=True)
+    manifest = AstroConversionManifest(target, xbox=True)
+    total = sum(size for _, _, size in files)
+    done = 0
+    results = []
+    for save, from_file, size in files:
+        start = time.perf_counter()
+        if skip_unchanged and manifest.is_xbox_export_up_to_date(save, from_file):
+            results.append(ExportResult(save.name, UNCHANGED, target, size))
+        else:
+            Scenario.export_save_to_xbox(save, from_file, target)
+            manifest.record_xbox_export(save, from_file)
+            manifest.save()
+            results.append(ExportResult(save.name, EXPORTED, target, size, duration=time.perf_counter() - start))
+        done += size
+        if progress:
+            progress(done, total)
+    return results
+
+
+def backup(source: str, target: str, archive_format: str = 'folder', level: int = None) -> BackupResult:
+    """Back up a save folder.
+
+    Args:
+        source: Save folder to back up.
+        target: Backup folder, or archive path without extension.
+        archive_format: One of ``AstroCompression.BACKUP_FORMATS``.
+        level: Compression level of an archive, the codec default if ``None``.
+
+    Returns:
+        BackupResult: Path and size of the backup.
+
+    Raises:
+        FileExistsError: If the backup folder already holds files which
+            aren't a backup, that it would replace.
+    """
+    start = time.perf_counter()
+    if archive_format == 'folder' and os.path.isdir(target) and os.listdir(target) \
+            and not os.path.isfile(utils.join_paths(target, BACKUP_MARKER)):
+        raise FileExistsError(f'{target} is not a backup folder, it will not be replaced')
+    path, size = AstroCompression.backup_folder(source, target, archive_format, level)
+    if archive_format == 'folder':
+        # Lets the next backup replace this folder
+        open(utils.join_paths(target, BACKUP_MARKER), 'wb').close()
+    return BackupResult(source, path, size, time.perf_counter() - start)
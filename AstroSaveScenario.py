@@ -2,15 +2,23 @@
 
 import os
 import glob
+import uuid
 import utils
 from io import BytesIO
-from typing import List
+from contextlib import closing
+from typing import Iterable, List, Optional, Tuple
 from cogs import AstroLogging as Logger
 from cogs import AstroMicrosoftSaveFolder
 from cogs import AstroSteamSaveFolder
 from cogs.AstroSaveContainer import AstroSaveContainer as Container
+from cogs.AstroSaveContainer import CHUNK_METADATA_SIZE
 from cogs.AstroSave import AstroSave
 from cogs.AstroConvType import AstroConvType
+from cogs.AstroConversionManifest import AstroConversionManifest
+from cogs import AstroCompression
+from cogs import AstroMetrics
+from cogs import AstroTeePipeline
+from cogs.AstroExportJournal import AstroExportJournal
 
 
 def ask_for_containers_to_convert(containers: List[str]) -> str:
@@ -83,7 +91,7 @@ def verify_choice_input(choice: int, min_value: int, max_value: int) -> None:
         raise ValueError
 
 
-def ask_for_save_folder(conversion_type: AstroConvType) -> str:
+def ask_for_save_folder(conversion_type: AstroConvType) -> Tuple[str, Optional[object]]:
     """Determine which folder should be used for conversion.
 
     Depending on ``conversion_type`` the user can automatically copy the
@@ -93,12 +101,15 @@ def ask_for_save_folder(conversion_type: AstroConvType) -> str:
         conversion_type: Desired conversion direction.
 
     Returns:
-        str: Path to work with.
+        Path to work with, and the backup of the detected Microsoft folder,
+        opened with ``AstroTeePipeline.open_backup``, that the conversion
+        must complete and close. The backup is ``None`` for the other folders.
 
     Raises:
         FileNotFoundError: If no save folder can be located automatically.
     """
     while 1:
+        backup = None
         try:
             Logger.logPrint("Which folder would you like to work with ?")
             Logger.logPrint("\t1) Automatically detect and copy my save folder (Please close Astroneer first)")
@@ -115,13 +126,14 @@ def ask_for_save_folder(conversion_type: AstroConvType) -> str:
                     try:
                         astroneer_save_folder = AstroMicrosoftSaveFolder.get_microsoft_save_folder()
                         Logger.logPrint(f'Microsoft folder path: {astroneer_save_folder}', 'debug')
+                        save_path = astroneer_save_folder
                         while True:
-                            save_path = ask_copy_target('MicrosoftAstroneerSavesBackup', 'Microsoft')
+                            backup_path = ask_copy_target('MicrosoftAstroneerSavesBackup', 'Microsoft')
                             try:
-                                utils.copy_files(astroneer_save_folder, save_path)
-                                Logger.logPrint(f'Save files copied to: {save_path}')
+                                # The chunks are backed up while they are converted, reading the folder once
+                                backup = AstroTeePipeline.open_backup(backup_path)
                                 break
-                            except (OSError, FileNotFoundError):
+                            except OSError:
                                 Logger.logPrint('Invalid path; please choose another backup location')
                     except FileNotFoundError:
                         Logger.logPrint('No Microsoft folder detected. If you think this is a bug, please visit github.com/Tignus/AstroSaveConverter/')
@@ -133,8 +145,11 @@ def ask_for_save_folder(conversion_type: AstroConvType) -> str:
                     while True:
                         save_path = ask_copy_target('SteamAstroSaveBackup', 'Steam')
                         try:
-                            utils.copy_files(astroneer_save_folder, save_path)
-                            Logger.logPrint(f'Save files copied to: {save_path}')
+                            backup_path, _ = AstroCompression.backup_folder(astroneer_save_folder, save_path)
+                            Logger.logPrint(f'Save files copied to: {backup_path}')
+                            if backup_path != save_path:
+                                # Steam saves are converted from the live folder when archived
+                                save_path = astroneer_save_folder
                             break
                         except (OSError, FileNotFoundError):
                             Logger.logPrint('Invalid path; please choose another backup location')
@@ -142,7 +157,7 @@ def ask_for_save_folder(conversion_type: AstroConvType) -> str:
             elif work_choice == '2':
                 save_path = ask_custom_folder_path()
 
-            return save_path
+            return save_path, backup
 
         except FileNotFoundError as e:
             Logger.logPrint('\nNo container found in path: ' + save_path)
@@ -372,26 +387,52 @@ def ask_overwrite_if_file_exists(filename: str, target: str) -> bool:
     return True
 
 
-def export_save_to_steam(save: AstroSave, from_path: str, to_path: str) -> str:
+def export_save_to_steam(save: AstroSave, from_path: str, to_path: str, sinks: Iterable = (),
+                         backup=None, compression: str = None, level: int = None) -> str:
     """Export a Microsoft/Xbox save to the Steam format.
 
+    The chunks are read only once, even when they are also hashed or backed
+    up through ``sinks`` and ``backup``.
+
     Args:
         save: ``AstroSave`` instance to export.
         from_path: Directory where the chunk files are located.
         to_path: Destination directory for the Steam save.
+        sinks: Sinks also receiving the content of the Steam save, see
+            ``AstroTeePipeline``.
+        backup: Backup receiving a copy of the chunk files, see
+            ``AstroTeePipeline.open_backup``.
+        compression: One of ``AstroCompression.COMPRESSIONS`` to compress
+            the Steam save, ``None`` to write it as is.
+        level: Compression level, the codec default if ``None``.
 
     Returns:
         str: Full path to the exported save file.
     """
-    target_full_path = utils.join_paths(to_path, save.get_file_name())
-    converted_save = save.convert_to_steam(from_path)
-    utils.write_buffer_to_file(target_full_path, converted_save)
+    with AstroMetrics.measure(AstroMetrics.CONVERSION, AstroMetrics.MICROSOFT_TO_STEAM, save.name) as metrics:
+        with metrics.phase('prepare'):
+            target_full_path = utils.join_paths(to_path, AstroCompression.get_export_file_name(save, compression))
+            save_size = save.get_steam_size(from_path)
+            utils.ensure_free_space(to_path, save_size, target_full_path)
+        metrics.size, metrics.chunk_count = save_size, save.chunk_count
+
+        # Closed right away on failure, so that a backup archive is released for the other saves
+        with closing(AstroTeePipeline.iter_save_blocks(save, from_path, sinks, backup)) as blocks, \
+                metrics.phase('write'):
+            blocks = metrics.timed_blocks(blocks, 'read')
+            if compression:
+                AstroCompression.write_blocks_compressed(target_full_path, blocks, compression, level)
+            else:
+                utils.write_blocks_to_file(target_full_path, blocks, save_size)
     return target_full_path
 
 
 def export_save_to_xbox(save: AstroSave, from_file: str, to_path: str) -> str:
     """Export a Steam save into multiple Xbox chunk files.
 
+    Every written chunk is checkpointed in the export journal of ``to_path``
+    so that an interrupted export can be finished by ``resume_xbox_export``.
+
     Args:
         save: ``AstroSave`` instance to convert.
         from_file: Path to the Steam ``.savegame`` file.
@@ -399,45 +440,102 @@ def export_save_to_xbox(save: AstroSave, from_file: str, to_path: str) -> str:
 
     Returns:
         str: Directory where the chunks and container are written.
+    """
+    with AstroMetrics.measure(AstroMetrics.CONVERSION, AstroMetrics.STEAM_TO_MICROSOFT, save.name) as metrics:
+        with metrics.phase('prepare'):
+            prepare_xbox_export(save, from_file, to_path)
+        metrics.size, metrics.chunk_count = os.path.getsize(from_file), save.chunk_count
 
-    Raises:
-        FileExistsError: If generated chunk names already exist and cannot be
-            regenerated.
+        journal = AstroExportJournal(to_path)
+        journal.begin_save(save, from_file)
+
+        with metrics.phase('chunks'):
+            write_xbox_chunks(save, from_file, to_path, journal)
+
+        # Container is updated only after all the chunks of the save have been written successfully
+        with metrics.phase('container'):
+            append_save_to_container(save, to_path)
+            journal.commit_save(save.name)
+
+    return to_path
+
+
+def prepare_xbox_export(save: AstroSave, from_file: str, to_path: str) -> None:
+    """Name the chunks of ``save`` after UUIDs unused in ``to_path`` and check the free space.
+
+    Args:
+        save: ``AstroSave`` instance to convert.
+        from_file: Path to the Steam ``.savegame`` file.
+        to_path: Destination directory for the Xbox chunks.
     """
-    chunk_uuids, converted_chunks = save.convert_to_xbox(from_file)
+    chunk_uuids = save.prepare_xbox_chunks(from_file)
 
     chunk_count = len(chunk_uuids)
 
     utils.make_dir_if_doesnt_exists(to_path)
+    utils.ensure_free_space(to_path, os.path.getsize(from_file) + chunk_count * CHUNK_METADATA_SIZE)
 
     if chunk_count >= 10:
         Logger.logPrint(
-            f'The selected save contains {chunk_count} which is over the 9 chunks limit AstroSaveconverter can handle yet')
-        Logger.logPrint(f'Congrats for having such a huge save, please open an issue on the GitHub :D')
+            f'The selected save contains {chunk_count} which is over the 9 chunks limit AstroSaveconverter can handle yet',
+            'debug')
+        Logger.logPrint(f'Congrats for having such a huge save, please open an issue on the GitHub :D', 'debug')
 
     for i in range(chunk_count):
 
         # The file name is the HEX upper form of the uuid
-        chunk_name = save.chunks_names[i]
+        chunk_name = save.get_chunk_name(i)
         Logger.logPrint(f'UUID as file name: {chunk_name}', "debug")
 
         target_full_path = utils.join_paths(to_path, chunk_name)
-        Logger.logPrint(f'Chunk file written to: {target_full_path}', "debug")
 
         # Regenerating chunk name if it already exists. Very, very unlikely
         while utils.is_path_exists(target_full_path):
             Logger.logPrint(f'UUID: {chunk_name} already exists ! (omg)', "debug")
 
             chunk_uuids[i] = save.regenerate_uuid(i)
-            chunk_name = save.chunks_names[i]
+            chunk_name = save.get_chunk_name(i)
 
             Logger.logPrint(f'Regenerated UUID: {chunk_name}', "debug")
             target_full_path = utils.join_paths(to_path, chunk_name)
 
-        # TODO [enhance] raise exception if can't write, catch it then delete all the chunks already written and exit
-        utils.write_buffer_to_file(target_full_path, converted_chunks[i])
 
-    # Container is updated only after all the chunks of the save have been written successfully
+def write_xbox_chunks(save: AstroSave, from_file: str, to_path: str, journal: AstroExportJournal) -> None:
+    """Write the chunks of ``save`` that are not durably written yet.
+
+    Args:
+        save: Save whose chunk names are recorded in ``journal``.
+        from_file: Path to the Steam ``.savegame`` file.
+        to_path: Destination directory for the Xbox chunks.
+        journal: Export journal of ``to_path``.
+    """
+    for i, chunk_name in enumerate(save.chunks_names):
+        if journal.is_chunk_written(save.name, i):
+            Logger.logPrint(f'Chunk {chunk_name} already written, skipping it', "debug")
+            continue
+
+        target_full_path = utils.join_paths(to_path, chunk_name)
+        Logger.logPrint(f'Chunk file written to: {target_full_path}', "debug")
+
+        utils.write_buffer_to_file(target_full_path, save.read_xbox_chunk(from_file, i), durable=True)
+        journal.mark_chunk_written(save.name, i)
+
+
+def append_save_to_container(save: AstroSave, to_path: str) -> str:
+    """Reference the chunks of ``save`` in the container of ``to_path``.
+
+    The container is rewritten atomically so that it never references only a
+    part of the save, even if the process is interrupted.
+
+    Args:
+        save: Save whose chunks have all been written in ``to_path``.
+        to_path: Microsoft save folder.
+
+    Returns:
+        str: Path to the updated container.
+    """
+    chunk_count = save.chunk_count
+
     try:
         container_file_name = Container.get_containers_list(to_path)[0]
     except FileNotFoundError:
@@ -446,15 +544,14 @@ def export_save_to_xbox(save: AstroSave, from_file: str, to_path: str) -> str:
 
     container_full_path = utils.join_paths(to_path, container_file_name)
 
-    with open(container_full_path, "r+b") as container:
-        container.read(4)
+    with open(container_full_path, "rb") as container:
+        container_content = bytearray(container.read())
 
-        current_container_chunk_count = int.from_bytes(container.read(4), byteorder='little')
+    current_container_chunk_count = int.from_bytes(container_content[4:8], byteorder='little')
 
-        new_container_chunk_count = current_container_chunk_count + chunk_count
+    new_container_chunk_count = current_container_chunk_count + chunk_count
 
-        container.seek(-4, 1)
-        container.write(new_container_chunk_count.to_bytes(4, byteorder='little'))
+    container_content[4:8] = new_container_chunk_count.to_bytes(4, byteorder='little')
 
     chunks_buffer = BytesIO()
     for i in range(chunk_count):
@@ -473,24 +570,91 @@ def export_save_to_xbox(save: AstroSave, from_file: str, to_path: str) -> str:
 
         chunks_buffer.write(b"\00" * (144 - total_written_len))
 
-        chunks_buffer.write(chunk_uuids[i].bytes_le)
+        chunks_buffer.write(uuid.UUID(hex=save.get_chunk_name(i)).bytes_le)
 
     Logger.logPrint(f'Editing container: {container_full_path}', "debug")
-    utils.append_buffer_to_file(container_full_path, chunks_buffer)
+    utils.write_file_atomically(container_full_path, bytes(container_content) + chunks_buffer.getvalue())
+
+    return container_full_path
 
-    return to_path
 
+def resume_xbox_export(to_path: str) -> Optional[List[str]]:
+    """Finish the Steam to Microsoft exports interrupted in ``to_path``.
+
+    Chunks already written are kept, the missing or partial ones are written
+    again and the container is updated. Saves whose Steam file changed since
+    the interruption are cleaned up and must be exported again, unless the
+    container already references them.
+
+    Args:
+        to_path: Microsoft save folder holding the export journal.
 
-def ask_overwrite_save_while_file_exists(save: AstroSave, target: str) -> None:
+    Returns:
+        Optional[List[str]]: Names of the saves whose export has been
+            completed, ``None`` if the journal is damaged and the saves
+            must be exported again.
+    """
+    journal = AstroExportJournal(to_path)
+    if journal.damaged:
+        Logger.logPrint(f'The interrupted export in {to_path} can\'t be resumed, the saves will be exported again',
+                        'warning')
+        return None
+    manifest = AstroConversionManifest(to_path, xbox=True)
+    pending_saves = journal.get_pending_saves()
+    if not pending_saves:
+        Logger.logPrint(f'No interrupted export found in {to_path}')
+        return []
+
+    try:
+        container_chunks = set()
+        for container_name in Container.get_containers_list(to_path):
+            container = Container(utils.join_paths(to_path, container_name))
+            for container_save in container.save_list:
+                container_chunks.update(container_save.chunks_names)
+    except FileNotFoundError:
+        pass
+
+    resumed_saves = []
+    for save, from_file in pending_saves:
+        if set(save.chunks_names) <= container_chunks:
+            # Interrupted right after the container was updated
+            Logger.logPrint(f'Save {save.name} was already completed', 'debug')
+            source_unchanged = journal.is_source_unchanged(save.name)
+            journal.commit_save(save.name)
+            if source_unchanged:
+                manifest.record_xbox_export(save, from_file)
+                manifest.save()
+            resumed_saves.append(save.name)
+            continue
+
+        if not journal.is_source_unchanged(save.name):
+            Logger.logPrint(f'{from_file} changed since the interrupted export of {save.name}, please export it again')
+            journal.discard_save(save.name)
+            continue
+
+        Logger.logPrint(f'Resuming the export of {save.name}')
+        write_xbox_chunks(save, from_file, to_path, journal)
+        append_save_to_container(save, to_path)
+        journal.commit_save(save.name)
+        manifest.record_xbox_export(save, from_file)
+        manifest.save()
+        resumed_saves.append(save.name)
+        Logger.logPrint(f'Save {save.name} has been exported successfully to {to_path}')
+
+    return resumed_saves
+
+
+def ask_overwrite_save_while_file_exists(save: AstroSave, target: str, compression: str = None) -> None:
     """Prompt to overwrite a save file, renaming if necessary.
 
     Args:
         save: Save to potentially overwrite.
         target: Directory where the save would be written.
+        compression: Codec of the export, ``None`` for none.
     """
     do_overwrite = None
     while not do_overwrite:
-        do_overwrite = ask_overwrite_if_file_exists(save.get_file_name(), target)
+        do_overwrite = ask_overwrite_if_file_exists(AstroCompression.get_export_file_name(save, compression), target)
         if not do_overwrite:
             rename_save(save)
 
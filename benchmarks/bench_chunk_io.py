@@ -0,0 +1,102 @@
+"""Benchmark the chunk read/write paths with several I/O buffer sizes.
+
+Creates a synthetic multi-chunk save in a temporary folder (or in the folder
+given with ``--dir``, which should be on the disk to measure) and times its
+conversion to the Steam format and its backup, both with the chunks already
+in the page cache and with a cold cache.
+
+Usage:
+    python benchmarks/bench_chunk_io.py [--size-mb 256] [--runs 3] [--dir PATH]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils
+import AstroSaveScenario as Scenario
+from cogs.AstroSave import AstroSave, XBOX_CHUNK_SIZE
+
+BUFFER_SIZES = [64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024]
+
+
+def create_chunks(folder: str, size: int) -> AstroSave:
+    """Write random chunk files totalling ``size`` bytes."""
+    chunks_names = []
+    while size > 0:
+        chunk_name = f'{len(chunks_names):032X}'
+        with open(os.path.join(folder, chunk_name), 'wb') as chunk_file:
+            chunk_file.write(os.urandom(min(size, XBOX_CHUNK_SIZE)))
+        chunks_names.append(chunk_name)
+        size -= XBOX_CHUNK_SIZE
+    return AstroSave('BENCH$2024.01.01-00.00.00', chunks_names)
+
+
+def evict(folder: str) -> None:
+    """Drop the files of ``folder`` from the page cache."""
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), 'rb') as file:
+            os.fsync(file.fileno())
+            utils.advise_file(file, 'POSIX_FADV_DONTNEED')
+
+
+def time_run(function, source: str, cold: bool) -> float:
+    """Return the duration of ``function()``, evicting ``source`` first if ``cold``."""
+    if cold:
+        evict(source)
+    else:
+        for name in os.listdir(source):
+            with open(os.path.join(source, name), 'rb') as file:
+                while file.read(XBOX_CHUNK_SIZE):
+                    pass
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--dir', default=None)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(dir=args.dir)
+    source = os.path.join(work_dir, 'wgs')
+    target = os.path.join(work_dir, 'SaveGames')
+    backup = os.path.join(work_dir, 'backup')
+    os.makedirs(source)
+    os.makedirs(target)
+    save = create_chunks(source, args.size_mb * 1024 * 1024)
+    size_mb = args.size_mb
+
+    cases = [('cache-resident', False)]
+    if hasattr(os, 'posix_fadvise'):
+        cases.append(('cold-cache', True))
+    else:
+        print('posix_fadvise is not available, skipping the cold-cache case')
+
+    print(f'{"case":<16}{"operation":<10}{"buffer":>10}{"drop cache":>12}{"MB/s":>10}')
+    try:
+        for case, cold in cases:
+            for drop_page_cache in (False, True):
+                for buffer_size in BUFFER_SIZES:
+                    utils.configure_io(buffer_size, drop_page_cache)
+                    operations = [
+                        ('export', lambda: Scenario.export_save_to_steam(save, source, target)),
+                        ('backup', lambda: utils.copy_files(source, backup)),
+                    ]
+                    for operation, function in operations:
+                        best = min(time_run(function, source, cold) for _ in range(args.runs))
+                        print(f'{case:<16}{operation:<10}{buffer_size // 1024:>8}KB'
+                              f'{str(utils.DROP_PAGE_CACHE):>12}{size_mb / best:>10.1f}')
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark the memory used by parsed containers.
+
+Writes synthetic containers in a temporary folder, then parses all of them
+at once with the current ``AstroSaveContainer`` and with a copy of the
+previous representation (one object per save holding a list of hexadecimal
+chunk names, without ``__slots__``). For each, prints the memory allocated
+(``tracemalloc``), the number of objects tracked by the garbage collector and
+the parsing time.
+
+Usage:
+    python benchmarks/bench_memory.py [--containers 2000] [--saves 20] [--chunks 3]
+"""
+
+import gc
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cogs.AstroSaveContainer import AstroSaveContainer, CHUNK_METADATA_SIZE
+
+
+class LegacySave:
+    """Save as it was represented before: a name and a list of hexadecimal names."""
+
+    def __init__(self, save_name, chunks_names):
+        self.name = save_name
+        self.chunks_names = chunks_names
+
+
+class LegacyContainer:
+    """Container parsed into ``LegacySave`` objects, as it was before."""
+
+    def __init__(self, path):
+        self.full_path = path
+        self.save_list = []
+        with open(path, 'rb') as container:
+            self.header = container.read(4)
+            self.chunk_count = int.from_bytes(container.read(4), byteorder='little')
+            current_save_name = None
+            for _ in range(self.chunk_count):
+                chunk = container.read(CHUNK_METADATA_SIZE)
+                text = chunk[0:CHUNK_METADATA_SIZE - 32].decode('utf-16le', errors='ignore')
+                chunk_name = re.split('[$]{2}|[\\x00]', text)[0]
+                if chunk_name != current_save_name:
+                    current_chunks_names = []
+                    self.save_list.append(LegacySave(chunk_name, current_chunks_names))
+                    current_save_name = chunk_name
+                current_chunks_names.append(uuid.UUID(bytes_le=chunk[-16:]).hex.upper())
+
+
+def write_container(path: str, saves: int, chunks: int) -> None:
+    """Write a container of ``saves`` saves of ``chunks`` chunks each."""
+    records = []
+    for save_index in range(saves):
+        for chunk_index in range(chunks):
+            text = f'SAVE{save_index}$2024.01.01-00.00.00$${chunk_index}${chunks}$1'.encode('utf-16le')
+            records.append(text.ljust(CHUNK_METADATA_SIZE - 16, b'\x00') + uuid.uuid4().bytes_le)
+    with open(path, 'wb') as container:
+        container.write(b'\x04\x00\x00\x00' + len(records).to_bytes(4, byteorder='little') + b''.join(records))
+
+
+def measure(container_class, paths):
+    """Parse every container and return the memory, object count and time it took."""
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    tracemalloc.start()
+    start = time.perf_counter()
+    containers = [container_class(path) for path in paths]
+    for container in containers:
+        container.save_list
+    duration = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    objects = len(gc.get_objects()) - objects_before
+    del containers
+    return allocated, objects, duration
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('--containers', type=int, default=2000)
+    parser.add_argument('--saves', type=int, default=20)
+    parser.add_argument('--chunks', type=int, default=3)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for index in range(args.containers):
+            path = os.path.join(work_dir, f'container.{index}')
+            write_container(path, args.saves, args.chunks)
+            paths.append(path)
+
+        print(f'{args.containers} containers of {args.saves} saves of {args.chunks} chunks')
+        print(f'{"representation":<16}{"MB":>10}{"gc objects":>12}{"seconds":>10}')
+        for label, container_class in (('legacy', LegacyContainer), ('current', AstroSaveContainer)):
+            allocated, objects, duration = measure(container_class, paths)
+            print(f'{label:<16}{allocated / 1024 / 1024:>10.1f}{objects:>12}{duration:>10.2f}')
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
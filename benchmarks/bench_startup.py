@@ -0,0 +1,99 @@
+"""Benchmark the start-up latency of the command line tool.
+
+Measures, over several runs, the time from the interpreter launch to:
+    - the end of ``main.py --help``,
+    - the end of a ``check`` command on an empty folder,
+    - the first prompt of the interactive conversion,
+then lists the modules taking the most time to import for each case.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--top 15]
+"""
+
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+FIRST_PROMPT = 'Which conversion do you want to do ?'
+IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def time_command(arguments, work_dir: str) -> float:
+    """Return the duration of ``main.py`` run with ``arguments``."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, MAIN_PATH] + arguments, cwd=work_dir, stdin=subprocess.DEVNULL,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def time_first_prompt(work_dir: str) -> float:
+    """Return the time until the interactive mode asks its first question."""
+    environment = dict(os.environ, PYTHONUNBUFFERED='1')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, MAIN_PATH], cwd=work_dir, env=environment,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               text=True)
+    try:
+        for line in process.stdout:
+            if FIRST_PROMPT in line:
+                return time.perf_counter() - start
+        raise RuntimeError('The interactive mode exited without asking anything')
+    finally:
+        process.kill()
+        process.wait()
+
+
+def get_import_times(arguments, work_dir: str):
+    """Return the self and cumulative import time of every module, in microseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', MAIN_PATH] + arguments, cwd=work_dir,
+                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True)
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            times.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) == 1))
+    return times
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    empty_folder = os.path.join(work_dir, 'empty')
+    os.makedirs(empty_folder)
+    cases = [
+        ('--help', ['--help']),
+        ('check', ['check', empty_folder]),
+    ]
+    try:
+        print(f'{"case":<16}{"median ms":>10}{"min ms":>10}')
+        for case, arguments in cases:
+            durations = [time_command(arguments, work_dir) for _ in range(args.runs)]
+            print(f'{case:<16}{statistics.median(durations) * 1000:>10.1f}{min(durations) * 1000:>10.1f}')
+        durations = [time_first_prompt(work_dir) for _ in range(args.runs)]
+        print(f'{"first prompt":<16}{statistics.median(durations) * 1000:>10.1f}{min(durations) * 1000:>10.1f}')
+
+        for case, arguments in cases:
+            times = get_import_times(arguments, work_dir)
+            total = sum(cumulative for _, _, cumulative, top_level in times if top_level)
+            print(f'\nImports of {case}: {len(times)} modules, {total / 1000:.1f} ms')
+            print(f'{"module":<40}{"self ms":>10}{"cumulative ms":>15}')
+            for module, self_time, cumulative, _ in sorted(times, key=lambda t: -t[2])[:args.top]:
+                print(f'{module:<40}{self_time / 1000:>10.1f}{cumulative / 1000:>15.1f}')
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+"""Compressed targets for exported saves and backups.
+
+Steam saves can be exported as ``.savegame.xz``/``.gz``/``.bz2`` files and
+backups written as ``zip`` or ``tar.*`` archives instead of plain copies.
+Compression runs in a worker thread fed through a bounded queue, so that it
+overlaps with the reading of the next blocks, and the data is read only once.
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+import utils
+from cogs import AstroLogging as Logger
+from cogs import AstroMetrics
+from cogs.AstroSave import AstroSave
+
+COMPRESSIONS = ('xz', 'gz', 'bz2')
+BACKUP_FORMATS = ('folder', 'zip', 'tar.gz', 'tar.xz', 'tar.bz2')
+
+# Defaults used by the exports and backups, see ``configure``
+export_compression = None
+backup_format = 'folder'
+compression_level = None
+
+
+def configure(compression: str = None, backup: str = None, level: int = None) -> None:
+    """Select how exported saves and backups are compressed.
+
+    Args:
+        compression: Codec of the exported Steam saves, ``None`` for none.
+        backup: Format of the backups, one of ``BACKUP_FORMATS``.
+        level: Compression level, the codec default if ``None``.
+    """
+    global export_compression, backup_format, compression_level
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown compression: {compression}')
+    if backup is not None and backup not in BACKUP_FORMATS:
+        raise ValueError(f'Unknown backup format: {backup}')
+    export_compression = compression
+    backup_format = backup or 'folder'
+    compression_level = level
+
+
+class ThrottledFile:
+    """File wrapper routing writes through the I/O bandwidth limit."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self.raw = raw
+
+    def write(self, data) -> int:
+        return utils.write_throttled(self.raw, data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class BackgroundWriter:
+    """Write blocks to a file object from a worker thread.
+
+    Compressors release the GIL, so the caller can read the next blocks while
+    the previous ones are being compressed.
+    """
+
+    def __init__(self, file: BinaryIO, queue_size: int = 4) -> None:
+        self.file = file
+        self.written = 0
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self) -> None:
+        while True:
+            block = self.__queue.get()
+            if block is None:
+                return
+            if self.__error is None:
+                try:
+                    self.file.write(block)
+                except BaseException as e:
+                    # Keep draining the queue so that the producer never blocks
+                    self.__error = e
+
+    def write(self, block: bytes) -> int:
+        """Queue ``block`` for writing."""
+        if self.__error is not None:
+            raise self.__error
+        self.__queue.put(bytes(block))
+        self.written += len(block)
+        return len(block)
+
+    def close(self) -> None:
+        """Wait for every queued block to be written."""
+        self.__queue.put(None)
+        self.__thread.join()
+        if self.__error is not None:
+            raise self.__error
+
+
+class CompressedFile:
+    """Writable file compressed with one of the ``COMPRESSIONS`` codecs."""
+
+    def __init__(self, target: str, compression: str, level: int = None) -> None:
+        """Create ``target`` and prepare its compressor.
+
+        Args:
+            target: Path of the compressed file.
+            compression: One of ``COMPRESSIONS``.
+            level: Compression level, the codec default if ``None``.
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown compression: {compression}')
+
+        self.raw = open(target, 'wb')
+        output = ThrottledFile(self.raw)
+        if compression == 'xz':
+            self.compressor = lzma.LZMAFile(output, 'wb', preset=level)
+        elif compression == 'gz':
+            self.compressor = gzip.GzipFile(fileobj=output, mode='wb',
+                                            compresslevel=9 if level is None else level)
+        else:
+            self.compressor = bz2.BZ2File(output, 'wb', compresslevel=9 if level is None else level)
+
+    def write(self, data) -> int:
+        return self.compressor.write(data)
+
+    def close(self) -> None:
+        """Flush the compressor and close the target file."""
+        try:
+            self.compressor.close()
+        finally:
+            self.raw.close()
+
+
+def write_blocks_compressed(target: str, blocks: Iterator[bytes], compression: str, level: int = None) -> int:
+    """Compress a stream of blocks into ``target``.
+
+    Returns:
+        int: Number of uncompressed bytes written.
+    """
+    compressed_file = CompressedFile(target, compression, level)
+    try:
+        writer = BackgroundWriter(compressed_file)
+        try:
+            for block in blocks:
+                writer.write(block)
+        finally:
+            writer.close()
+    finally:
+        compressed_file.close()
+    return writer.written
+
+
+def get_export_file_name(save: AstroSave, compression: str = None) -> str:
+    """Return the name of the file a Steam save is exported to with ``compression``."""
+    return save.get_file_name() + (f'.{compression}' if compression else '')
+
+
+def get_file_compression(file_name: str) -> Optional[str]:
+    """Return the codec of an exported save file, ``None`` if it isn't compressed."""
+    extension = file_name.rsplit('.', 1)[-1]
+    return extension if extension in COMPRESSIONS else None
+
+
+def read_blocks_decompressed(path: str, compression: str) -> Iterator[bytes]:
+    """Read a file compressed with one of the ``COMPRESSIONS`` codecs, block by block.
+
+    Yields:
+        bytes: Consecutive blocks of the uncompressed content.
+    """
+    opener = {'xz': lzma.open, 'gz': gzip.open, 'bz2': bz2.open}[compression]
+    with opener(path, 'rb') as compressed_file:
+        while True:
+            block = compressed_file.read(utils.IO_BUFFER_SIZE)
+            if not block:
+                return
+            yield block
+
+
+class ArchiveMember:
+    """Writable member of an ``ArchiveWriter``, see ``ArchiveWriter.open_member``."""
+
+    def __init__(self, archive: 'ArchiveWriter', name: str, output, size: int,
+                 member_file: BinaryIO = None) -> None:
+        self.archive = archive
+        self.name = name
+        self.output = output
+        self.size = size
+        self.written = 0
+        self.__member_file = member_file
+
+    def write(self, block: bytes) -> int:
+        if self.written + len(block) > self.size:
+            raise OSError(f'Archive member larger than its declared size of {self.size} bytes')
+        self.written += self.output.write(block)
+        return len(block)
+
+    @property
+    def complete(self) -> bool:
+        """``True`` once the member has received its declared size."""
+        return self.written == self.size
+
+    def close(self) -> None:
+        """Finish the member, padding it with zeros if it is incomplete.
+
+        The callers must check ``complete``: an incomplete member only logs
+        a warning here, since the archive must be finished anyway.
+        """
+        if not self.complete:
+            Logger.logPrint(f'{self.archive.path}: member {self.name} is incomplete, '
+                            f'{self.written} of {self.size} bytes written', 'warning')
+        try:
+            if self.archive.is_tar:
+                # Keep the archive readable even if the source shrank while being read
+                self.output.write(bytes(self.size - self.written))
+                self.output.write(bytes(-self.size % tarfile.BLOCKSIZE))
+            else:
+                try:
+                    self.output.close()
+                finally:
+                    self.__member_file.close()
+        finally:
+            self.archive.lock.release()
+
+
+class ArchiveWriter:
+    """Streaming writer of a zip or compressed tar archive.
+
+    Members are written one at a time: ``open_member`` waits until the member
+    opened by another thread is closed.
+    """
+
+    def __init__(self, target: str, archive_format: str, level: int = None) -> None:
+        """Create the archive.
+
+        Args:
+            target: Path of the archive without extension.
+            archive_format: ``zip`` or ``tar.gz``/``tar.xz``/``tar.bz2``.
+            level: Compression level, the codec default if ``None``.
+        """
+        if archive_format not in BACKUP_FORMATS[1:]:
+            raise ValueError(f'Unknown archive format: {archive_format}')
+
+        self.path = f'{target}.{archive_format}'
+        self.is_tar = archive_format != 'zip'
+        self.level = level
+        self.names = set()
+        self.lock = threading.Lock()
+
+        if utils.is_path_exists(self.path):
+            os.remove(self.path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self.is_tar:
+            self.__compressed_file = CompressedFile(self.path, archive_format.split('.')[1], level)
+            self.__output = BackgroundWriter(self.__compressed_file)
+        else:
+            self.__raw = open(self.path, 'wb')
+            self.__zip = zipfile.ZipFile(ThrottledFile(self.__raw), 'w', zipfile.ZIP_DEFLATED, compresslevel=level)
+
+    def open_member(self, name: str, size: int, mtime_ns: int = None) -> ArchiveMember:
+        """Start a new member of the archive.
+
+        Args:
+            name: Path of the member inside the archive.
+            size: Size of the member, in bytes.
+            mtime_ns: Modification time of the member, now if ``None``.
+
+        Returns:
+            ArchiveMember: Member to write ``size`` bytes to, then close.
+        """
+        mtime = time.time() if mtime_ns is None else mtime_ns / 10**9
+        self.lock.acquire()
+        try:
+            self.names.add(name)
+            if self.is_tar:
+                info = tarfile.TarInfo(name)
+                info.size = size
+                info.mtime = int(mtime)
+                self.__output.write(info.tobuf(tarfile.PAX_FORMAT))
+                return ArchiveMember(self, name, self.__output, size)
+
+            info = zipfile.ZipInfo(name, time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            if hasattr(info, 'compress_level'):
+                info.compress_level = self.level
+            else:
+                # Before Python 3.13, members opened from a ZipInfo ignore the compresslevel of the archive
+                info._compresslevel = self.level
+            member = self.__zip.open(info, 'w', force_zip64=True)
+            return ArchiveMember(self, name, BackgroundWriter(member), size, member)
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def close(self) -> str:
+        """Finish the archive.
+
+        Returns:
+            str: Path to the archive.
+        """
+        if self.is_tar:
+            try:
+                try:
+                    self.__output.write(bytes(2 * tarfile.BLOCKSIZE))
+                finally:
+                    self.__output.close()
+            finally:
+                self.__compressed_file.close()
+        else:
+            try:
+                self.__zip.close()
+            finally:
+                self.__raw.close()
+        return self.path
+
+
+def archive_folder(source: str, target: str, archive_format: str, level: int = None) -> Tuple[str, int, int]:
+    """Write the files of ``source`` into a compressed archive.
+
+    Args:
+        source: Folder to archive, its sub-folders included.
+        target: Path of the archive without extension.
+        archive_format: ``zip`` or ``tar.gz``/``tar.xz``/``tar.bz2``.
+        level: Compression level, the codec default if ``None``.
+
+    Returns:
+        The path to the written archive, and the number of bytes and of
+        files archived.
+    """
+    archive = ArchiveWriter(target, archive_format, level)
+    archived_bytes = archived_files = 0
+    try:
+        for root, _, names in os.walk(source):
+            for name in sorted(names):
+                path = utils.join_paths(root, name)
+                stat = os.stat(path)
+                member = archive.open_member(os.path.relpath(path, source).replace(os.sep, '/'),
+                                             stat.st_size, stat.st_mtime_ns)
+                try:
+                    for block in utils.read_file_blocks(path):
+                        member.write(block)
+                finally:
+                    member.close()
+                if not member.complete:
+                    raise OSError(f'{path} changed while being archived')
+                archived_bytes += stat.st_size
+                archived_files += 1
+    finally:
+        archive_path = archive.close()
+    return archive_path, archived_bytes, archived_files
+
+
+def backup_folder(source: str, target: str, archive_format: str = None, level: int = None) -> Tuple[str, int]:
+    """Back up ``source`` as a folder copy or a compressed archive.
+
+    Args:
+        source: Folder to back up.
+        target: Backup folder, or archive path without extension.
+        archive_format: One of ``BACKUP_FORMATS``. The configured
+            ``backup_format`` and ``compression_level`` are used if ``None``.
+        level: Compression level of an archive, the codec default if ``None``.
+
+    Returns:
+        The path to the backup folder or archive, and its size.
+    """
+    if archive_format is None:
+        archive_format, level = backup_format, compression_level
+    with AstroMetrics.measure(AstroMetrics.BACKUP, archive_format, source) as metrics:
+        if archive_format == 'folder':
+            metrics.size, metrics.chunk_count = utils.copy_files(source, target)
+            return target, metrics.size
+        path, metrics.size, metrics.chunk_count = archive_folder(source, target, archive_format, level)
+        return path, os.path.getsize(path)
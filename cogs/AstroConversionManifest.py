@@ -0,0 +1,161 @@
+"""Sidecar manifest recording the saves exported to a folder.
+
+The manifest remembers, for every exported save, the identity (name, size
+and modification time) of the files it was built from and of the files that
+were written. A later run can then skip the saves whose source and output are
+both unchanged. The manifest of a Steam folder lives next to the exported
+files; the game owns the Microsoft save folders, so their manifests are kept
+next to the logs, keyed by the path of the folder.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import utils
+from cogs import AstroLogging as Logger
+from cogs import AstroSaveStorage
+from cogs import AstroCompression
+from cogs.AstroSave import AstroSave
+
+MANIFEST_FILE_NAME = '.astrosaveconverter_manifest.json'
+MANIFEST_VERSION = 1
+XBOX_MANIFESTS_FOLDER = os.path.join('logs', 'manifests')  # Relative to the working directory, like the logs
+
+
+def get_file_identity(path: str) -> Optional[List]:
+    """Return ``[name, size, mtime_ns]`` for ``path`` or ``None`` if missing."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+
+
+def get_xbox_manifest_path(folder: str) -> str:
+    """Return the path of the manifest of a Microsoft save folder."""
+    key = hashlib.sha256(os.path.normcase(os.path.abspath(folder)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(os.path.abspath(XBOX_MANIFESTS_FOLDER), f'xbox_{key}.json')
+
+
+class AstroConversionManifest:
+    """Manifest of the saves exported into ``folder``."""
+
+    def __init__(self, folder: str, xbox: bool = False) -> None:
+        """Load the manifest of ``folder``, starting empty if there is none.
+
+        Args:
+            folder: Export target folder.
+            xbox: ``folder`` is a Microsoft save folder, whose manifest is
+                kept in ``XBOX_MANIFESTS_FOLDER`` rather than in it.
+        """
+        self.folder = folder
+        if xbox:
+            self.full_path = get_xbox_manifest_path(folder)
+        else:
+            self.full_path = utils.join_paths(folder, MANIFEST_FILE_NAME)
+        self.entries: Dict[str, Dict[str, dict]] = {'steam': {}, 'xbox': {}}
+        self.skipped_saves: List[str] = []
+        self.skipped_bytes = 0
+
+        try:
+            with open(self.full_path, 'r', encoding='utf-8') as manifest_file:
+                content = json.load(manifest_file)
+            if content.get('version') == MANIFEST_VERSION:
+                for direction in self.entries:
+                    self.entries[direction] = content.get(direction, {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            Logger.logPrint(f'Ignoring unreadable manifest {self.full_path}: {e}', 'warning')
+
+    def save(self) -> None:
+        """Write the manifest to disk, replacing the previous one atomically."""
+        os.makedirs(utils.get_dir_name(self.full_path), exist_ok=True)
+        content = json.dumps({'version': MANIFEST_VERSION, 'folder': os.path.abspath(self.folder), **self.entries},
+                             indent=1)
+        utils.write_file_atomically(self.full_path, content.encode('utf-8'))
+
+    def get_steam_source_identity(self, save: AstroSave, from_path) -> dict:
+        """Return the identity of the chunk files of a Microsoft save."""
+        storage = AstroSaveStorage.open_storage(from_path)
+        files = []
+        for chunk_name in save.chunks_names:
+            try:
+                files.append([chunk_name, storage.get_size(chunk_name), storage.get_mtime_ns(chunk_name)])
+            except FileNotFoundError:
+                files.append(None)
+        return {'folder': os.path.abspath(storage.path), 'files': files}
+
+    def is_steam_export_up_to_date(self, save: AstroSave, from_path: str, compression: str = None) -> bool:
+        """Return ``True`` if exporting ``save`` to Steam would rewrite the same file.
+
+        Args:
+            save: Microsoft save about to be exported.
+            from_path: Folder holding the chunk files of the save.
+            compression: Codec of the export, ``None`` for none.
+        """
+        file_name = AstroCompression.get_export_file_name(save, compression)
+        entry = self.entries['steam'].get(file_name)
+        if entry is None:
+            return False
+
+        output = get_file_identity(utils.join_paths(self.folder, file_name))
+        return (output is not None and entry['output'] == [output]
+                and entry['source'] == self.get_steam_source_identity(save, from_path))
+
+    def record_steam_export(self, save: AstroSave, from_path: str, sha256: str = None,
+                            compression: str = None) -> None:
+        """Remember that ``save`` has been exported from ``from_path``.
+
+        Args:
+            save: Exported Microsoft save.
+            from_path: Folder holding the chunks of the save.
+            sha256: Digest of the uncompressed Steam save, if computed.
+            compression: Codec of the export, ``None`` for none.
+        """
+        file_name = AstroCompression.get_export_file_name(save, compression)
+        self.entries['steam'][file_name] = {
+            'source': self.get_steam_source_identity(save, from_path),
+            'output': [get_file_identity(utils.join_paths(self.folder, file_name))],
+        }
+        if sha256:
+            self.entries['steam'][file_name]['sha256'] = sha256
+
+    def is_xbox_export_up_to_date(self, save: AstroSave, from_file: str) -> bool:
+        """Return ``True`` if ``from_file`` was already exported as ``save``.
+
+        Args:
+            save: Steam save about to be exported.
+            from_file: Path to the Steam ``.savegame`` file.
+        """
+        entry = self.entries['xbox'].get(save.name)
+        if entry is None:
+            return False
+
+        source = [os.path.abspath(from_file)] + (get_file_identity(from_file) or [])[1:]
+        output = [get_file_identity(utils.join_paths(self.folder, chunk[0]))
+                  for chunk in entry['output']]
+        return entry['source'] == source and entry['output'] == output
+
+    def record_xbox_export(self, save: AstroSave, from_file: str) -> None:
+        """Remember that ``from_file`` has been exported as ``save`` chunks."""
+        self.entries['xbox'][save.name] = {
+            'source': [os.path.abspath(from_file)] + get_file_identity(from_file)[1:],
+            'output': [get_file_identity(utils.join_paths(self.folder, chunk_name))
+                       for chunk_name in save.chunks_names],
+        }
+
+    def skip(self, save: AstroSave, size: int) -> None:
+        """Account for a save that does not need to be exported again."""
+        Logger.logPrint(f'Save {save.name} is unchanged since its last export, skipping it')
+        self.skipped_saves.append(save.name)
+        self.skipped_bytes += size
+
+    def log_summary(self) -> None:
+        """Log how much work was avoided thanks to the manifest."""
+        if self.skipped_saves:
+            Logger.logPrint(
+                f'\n{len(self.skipped_saves)} unchanged save(s) skipped, '
+                f'{self.skipped_bytes / 1024 / 1024:.2f} MB not converted again')
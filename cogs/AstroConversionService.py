@@ -0,0 +1,487 @@
+"""Long-running local service converting and backing up saves on request.
+
+Automation converting saves all day pays for the interpreter start-up, the
+discovery of the save folders and the parsing of the containers on every
+run. The service keeps those warm: the saves of a folder are parsed again only
+when one of its containers changes, and the discovered save folders are kept
+for ``discovery_ttl`` seconds. Jobs are put in a bounded queue served by a
+pool of workers, jobs writing to the same folder running one at a time.
+
+It listens on a Unix socket, only usable by the user running the service, or
+on localhost. On localhost, every request must carry the token that the
+service writes in a file only readable by that user, as an
+``Authorization: Bearer <token>`` header, so that web pages can't submit
+jobs. Jobs must be posted as ``application/json``. It speaks JSON over HTTP:
+
+    - ``GET /folders[?refresh=1]``: the Microsoft save folders of the computer,
+    - ``GET /saves?path=<folder or container>``: the saves of a folder,
+    - ``POST /jobs``: queue an ``export_to_steam``, ``export_to_xbox`` or
+      ``backup`` job, whose arguments are those of ``AstroSaveAPI``,
+    - ``GET /jobs`` and ``GET /jobs/<id>``: status, progress and result of the
+      jobs,
+    - ``GET /metrics``: job counts, throughput and cache hits.
+
+See ``AstroServiceClient`` for the clients.
+"""
+
+import hmac
+import itertools
+import json
+import os
+import queue
+import secrets
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import utils
+import AstroSaveAPI as API
+from cogs import AstroCompression
+from cogs import AstroLogging as Logger
+from cogs import AstroSaveStorage
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Options of every job type, on top of its source and target, see ``AstroSaveAPI``
+JOB_TYPES = {
+    'export_to_steam': ('saves', 'overwrite', 'skip_unchanged', 'compression', 'level'),
+    'export_to_xbox': ('saves', 'renames', 'skip_unchanged'),
+    'backup': ('archive_format', 'level'),
+}
+FINISHED_JOBS_KEPT = 1000
+
+
+class ServiceError(Exception):
+    """Error returned to the client with an HTTP status."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class AstroJob:
+    """A conversion or backup requested to the service."""
+
+    def __init__(self, job_id: int, job_type: str, arguments: dict) -> None:
+        self.id = job_id
+        self.type = job_type
+        self.arguments = arguments
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.done_bytes = 0
+        self.total_bytes = 0
+        self.result = None
+        self.error: Optional[str] = None
+
+    def on_progress(self, done: int, total: int) -> None:
+        """Progress callback given to ``AstroSaveAPI``."""
+        self.done_bytes = done
+        self.total_bytes = total
+
+    def get_target(self) -> str:
+        """Return the folder written by the job."""
+        return os.path.abspath(self.arguments['target'])
+
+    def to_dict(self) -> dict:
+        """Return the job as sent to the clients."""
+        return {
+            'id': self.id, 'type': self.type, 'arguments': self.arguments, 'status': self.status,
+            'submitted': self.submitted, 'started': self.started, 'finished': self.finished,
+            'done_bytes': self.done_bytes, 'total_bytes': self.total_bytes,
+            'result': self.result, 'error': self.error,
+        }
+
+
+class AstroConversionService:
+    """Job queue, worker pool and caches of the service, without the HTTP layer."""
+
+    def __init__(self, workers: int = 2, queue_size: int = 16, discovery_ttl: float = 60.0) -> None:
+        """Create the service, its workers only start with ``start``.
+
+        Args:
+            workers: Number of jobs run at the same time.
+            queue_size: Number of jobs waiting for a worker, beyond which new
+                jobs are refused.
+            discovery_ttl: Seconds the discovered save folders are kept.
+        """
+        self.workers = workers
+        self.discovery_ttl = discovery_ttl
+        self.jobs: Dict[int, AstroJob] = {}
+        self.__queue: 'queue.Queue[Optional[AstroJob]]' = queue.Queue(maxsize=queue_size)
+        self.__job_ids = itertools.count(1)
+        self.__lock = threading.Lock()
+        self.__target_locks: Dict[str, threading.Lock] = {}
+        self.__threads: List[threading.Thread] = []
+        self.__saves_cache: Dict[str, Tuple[tuple, List[API.SaveInfo]]] = {}
+        self.__folders: Optional[Tuple[float, List[str]]] = None
+        self.started = time.time()
+        self.metrics = {'cache_hits': 0, 'cache_misses': 0, 'rejected_jobs': 0,
+                        'converted_bytes': 0, 'busy_seconds': 0.0}
+
+    def start(self) -> None:
+        """Start the workers."""
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.__work, name=f'AstroConversionService-{index}', daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self) -> None:
+        """Let the workers finish their job and stop them."""
+        for _ in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def get_save_folders(self, refresh: bool = False) -> List[str]:
+        """Return the Microsoft save folders of the computer, discovered at most every ``discovery_ttl`` seconds."""
+        with self.__lock:
+            if not refresh and self.__folders and time.monotonic() - self.__folders[0] < self.discovery_ttl:
+                self.metrics['cache_hits'] += 1
+                return self.__folders[1]
+            self.metrics['cache_misses'] += 1
+
+        from cogs import AstroMicrosoftSaveFolder
+        folders = AstroMicrosoftSaveFolder.find_microsoft_save_folders()
+        with self.__lock:
+            self.__folders = (time.monotonic(), folders)
+        return folders
+
+    def list_saves(self, path: str) -> List[API.SaveInfo]:
+        """Return ``AstroSaveAPI.list_saves(path)``, parsed again only if a container changed."""
+        folder = path
+        if 'container' in os.path.basename(path) and not utils.is_folder_a_dir(path):
+            folder = utils.get_dir_name(path)
+        storage = AstroSaveStorage.open_storage(folder)
+        identity = tuple((name, storage.get_size(name), storage.get_mtime_ns(name))
+                         for name in sorted(storage.list_files()) if 'container' in name or name.endswith('.savegame'))
+
+        key = os.path.abspath(path)
+        with self.__lock:
+            cached = self.__saves_cache.get(key)
+            if cached and cached[0] == identity:
+                self.metrics['cache_hits'] += 1
+                return cached[1]
+            self.metrics['cache_misses'] += 1
+
+        saves = API.list_saves(path)
+        with self.__lock:
+            self.__saves_cache[key] = (identity, saves)
+        return saves
+
+    def submit(self, job_type: str, arguments: dict) -> AstroJob:
+        """Queue a job.
+
+        Raises:
+            ServiceError: If the job is invalid, or the queue is full.
+        """
+        if job_type not in JOB_TYPES:
+            raise ServiceError(400, f'Unknown job type {job_type}, expected one of {", ".join(JOB_TYPES)}')
+        if 'source' not in arguments or 'target' not in arguments:
+            raise ServiceError(400, 'A job needs a source and a target')
+        unknown = set(arguments) - {'source', 'target'} - set(JOB_TYPES[job_type])
+        if unknown:
+            raise ServiceError(400, f'Unknown {job_type} option(s): {", ".join(sorted(unknown))}')
+        check_job_arguments(arguments)
+
+        with self.__lock:
+            job = AstroJob(next(self.__job_ids), job_type, arguments)
+            try:
+                self.__queue.put_nowait(job)
+            except queue.Full:
+                self.metrics['rejected_jobs'] += 1
+                raise ServiceError(503, 'Too many jobs waiting, retry later')
+            self.jobs[job.id] = job
+            self.__forget_finished_jobs()
+        return job
+
+    def get_job(self, job_id: int) -> AstroJob:
+        """Return a job.
+
+        Raises:
+            ServiceError: If there is no such job.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ServiceError(404, f'No job {job_id}')
+        return job
+
+    def wait(self, job_id: int, timeout: float = None) -> AstroJob:
+        """Wait for a job to finish, for tests and scripts."""
+        job = self.get_job(job_id)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while job.status in (QUEUED, RUNNING):
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f'Job {job_id} is still {job.status}')
+            time.sleep(0.01)
+        return job
+
+    def get_metrics(self) -> dict:
+        """Return the job counts, throughput and cache efficiency of the service."""
+        with self.__lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+            for job in self.jobs.values():
+                counts[job.status] += 1
+            metrics = dict(self.metrics)
+        busy = metrics['busy_seconds']
+        return dict(metrics, jobs=counts, queue_depth=self.__queue.qsize(), workers=self.workers,
+                    uptime_seconds=time.time() - self.started,
+                    throughput_mb_per_second=metrics['converted_bytes'] / 1024 / 1024 / busy if busy else 0.0)
+
+    def __forget_finished_jobs(self) -> None:
+        """Bound the memory used by the history of the jobs."""
+        finished = [job.id for job in self.jobs.values() if job.status in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self.jobs[job_id]
+
+    def __get_target_lock(self, job: AstroJob) -> threading.Lock:
+        with self.__lock:
+            return self.__target_locks.setdefault(job.get_target(), threading.Lock())
+
+    def __work(self) -> None:
+        while True:
+            job = self.__queue.get()
+            if job is None:
+                return
+            start = None
+            try:
+                # Jobs writing to the same folder would race on its manifest and container
+                with self.__get_target_lock(job):
+                    job.status = RUNNING
+                    job.started = time.time()
+                    start = time.perf_counter()
+                    job.result = self.run(job)
+                    job.status = DONE
+            except Exception as e:
+                # Whatever the job does, the worker goes on with the next one
+                Logger.logPrint(f'Job {job.id} ({job.type}) failed: {e}', 'warning')
+                job.error = f'{type(e).__name__}: {e}'
+                job.status = FAILED
+            job.finished = time.time()
+            with self.__lock:
+                if start is not None:
+                    self.metrics['busy_seconds'] += time.perf_counter() - start
+                self.metrics['converted_bytes'] += job.done_bytes
+
+    def run(self, job: AstroJob):
+        """Run a job through ``AstroSaveAPI`` and return its JSON result."""
+        arguments = dict(job.arguments)
+        source, target = arguments.pop('source'), arguments.pop('target')
+        if job.type == 'backup':
+            result = API.backup(source, target, **arguments)
+            job.on_progress(result.size, result.size)
+            return vars(result)
+
+        if job.type == 'export_to_steam':
+            # The saves come from the warm cache, the API then doesn't parse the containers again
+            saves = API.select_saves(self.list_saves(source), arguments.pop('saves', None))
+            results = API.export_to_steam(source, target, saves, progress=job.on_progress, **arguments)
+        else:
+            results = API.export_to_xbox(source, target, progress=job.on_progress, **arguments)
+        return [vars(result) for result in results]
+
+    def handle(self, method: str, url: str, body: bytes = b'') -> Tuple[int, object]:
+        """Answer a request of the JSON API.
+
+        Returns:
+            The HTTP status and the JSON content of the answer.
+        """
+        parts = urlsplit(url)
+        path = parts.path.rstrip('/')
+        parameters = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+        try:
+            if method == 'GET' and path == '/folders':
+                return 200, self.get_save_folders(parameters.get('refresh') == '1')
+            if method == 'GET' and path == '/saves':
+                if 'path' not in parameters:
+                    raise ServiceError(400, 'The path parameter is required')
+                return 200, [get_save_info_dict(save) for save in self.list_saves(parameters['path'])]
+            if method == 'GET' and path == '/metrics':
+                return 200, self.get_metrics()
+            if method == 'GET' and path == '/jobs':
+                return 200, [job.to_dict() for job in list(self.jobs.values())]
+            if method == 'GET' and path.startswith('/jobs/'):
+                job_id = path[len('/jobs/'):]
+                if not job_id.isdigit():
+                    raise ServiceError(404, f'No job {job_id}')
+                return 200, self.get_job(int(job_id)).to_dict()
+            if method == 'POST' and path == '/jobs':
+                try:
+                    request = json.loads(body or b'{}')
+                except ValueError as e:
+                    raise ServiceError(400, f'Invalid JSON: {e}')
+                if not isinstance(request, dict):
+                    raise ServiceError(400, 'A job must be a JSON object')
+                job = self.submit(request.pop('type', None), request)
+                return 202, job.to_dict()
+            raise ServiceError(404, f'Unknown endpoint {method} {path}')
+        except ServiceError as e:
+            return e.status, {'error': str(e)}
+        except (FileNotFoundError, KeyError) as e:
+            return 404, {'error': str(e)}
+        except Exception as e:
+            Logger.logPrint(f'{method} {url} failed', 'exception')
+            return 500, {'error': f'{type(e).__name__}: {e}'}
+
+
+def check_job_arguments(arguments: dict) -> None:
+    """Check the types and values of the arguments of a job.
+
+    Raises:
+        ServiceError: If an argument is invalid.
+    """
+    def is_list_of_str(value) -> bool:
+        return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+    checks = {
+        'source': (lambda value: isinstance(value, str) and value != '', 'a path'),
+        'target': (lambda value: isinstance(value, str) and value != '', 'a path'),
+        'saves': (lambda value: value is None or is_list_of_str(value), 'a list of save names'),
+        'overwrite': (lambda value: value in (API.OVERWRITE, API.SKIP, API.FAIL),
+                      f'one of {API.OVERWRITE}, {API.SKIP}, {API.FAIL}'),
+        'skip_unchanged': (lambda value: isinstance(value, bool), 'a boolean'),
+        'renames': (lambda value: value is None or (isinstance(value, dict) and is_list_of_str(list(value.values()))),
+                    'an object of new save names'),
+        'compression': (lambda value: value is None or value in AstroCompression.COMPRESSIONS,
+                        f'one of {", ".join(AstroCompression.COMPRESSIONS)}'),
+        'archive_format': (lambda value: value in AstroCompression.BACKUP_FORMATS,
+                           f'one of {", ".join(AstroCompression.BACKUP_FORMATS)}'),
+        'level': (lambda value: value is None or (isinstance(value, int) and not isinstance(value, bool)
+                                                  and 0 <= value <= 9), 'a compression level from 0 to 9'),
+    }
+    for name, value in arguments.items():
+        is_valid, expected = checks[name]
+        if not is_valid(value):
+            raise ServiceError(400, f'Invalid {name} {value!r}, expected {expected}')
+
+
+def get_save_info_dict(save: API.SaveInfo) -> dict:
+    """Return a ``SaveInfo`` as sent to the clients."""
+    return {'name': save.name, 'platform': save.platform, 'folder': save.folder, 'container': save.container,
+            'size': save.size, 'chunk_count': save.chunk_count,
+            'date': save.date.isoformat() if save.date else None}
+
+
+class AstroServiceRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front of ``AstroConversionService``."""
+
+    server_version = 'AstroSaveConverter'
+
+    def do_GET(self) -> None:
+        self.answer()
+
+    def do_POST(self) -> None:
+        self.answer()
+
+    def answer(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if not self.is_authorized():
+            status, content = 401, {'error': 'Missing or invalid service token'}
+        elif self.command == 'POST' and content_type != 'application/json':
+            # Web pages can only post other content types without the consent of the service
+            status, content = 415, {'error': 'Requests must be sent as application/json'}
+        else:
+            status, content = self.server.service.handle(self.command, self.path, body)
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def is_authorized(self) -> bool:
+        """Return ``True`` if the request carries the token of the server, when it has one."""
+        token = getattr(self.server, 'token', None)
+        if token is None:
+            return True
+        return hmac.compare_digest(self.headers.get('Authorization') or '', f'Bearer {token}')
+
+    def address_string(self) -> str:
+        # The client address of a Unix socket is empty
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format: str, *args) -> None:
+        Logger.logPrint(f'{self.address_string()} {format % args}', 'debug')
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server listening on a Unix socket."""
+
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+def write_token_file(path: str) -> str:
+    """Write a new random service token in a file only readable by the current user, and return it."""
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as token_file:
+        token_file.write(token)
+    # The mode given to os.open doesn't apply to an existing file
+    os.chmod(path, 0o600)
+    return token
+
+
+def create_server(service: AstroConversionService, host: str = '127.0.0.1', port: int = 8765,
+                  socket_path: str = None, token_path: str = None) -> socketserver.BaseServer:
+    """Create the HTTP server of ``service``.
+
+    Args:
+        service: Service answering the requests.
+        host: Address to listen on.
+        port: Port to listen on, ``0`` for any free port.
+        socket_path: Unix socket to listen on instead of ``host`` and ``port``.
+        token_path: File receiving the token required by a server listening
+            on a port, see ``write_token_file``.
+
+    Raises:
+        ValueError: If the server listens on a port without ``token_path``.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, AstroServiceRequestHandler)
+        # Only the user running the service may submit jobs
+        os.chmod(socket_path, 0o600)
+        server.token = None
+    else:
+        if not token_path:
+            raise ValueError('A token file is required to listen on a port')
+        server = ThreadingHTTPServer((host, port), AstroServiceRequestHandler)
+        server.daemon_threads = True
+        server.token = write_token_file(token_path)
+    server.service = service
+    return server
+
+
+def serve(host: str = '127.0.0.1', port: int = 8765, socket_path: str = None, workers: int = 2,
+          queue_size: int = 16, token_path: str = None) -> None:
+    """Run the service until interrupted, see ``create_server``."""
+    service = AstroConversionService(workers, queue_size)
+    server = create_server(service, host, port, socket_path, token_path)
+    service.start()
+    address = socket_path or f'http://{host}:{server.server_address[1]} (token in {token_path})'
+    Logger.logPrint(f'Conversion service listening on {address}, press Ctrl+C to stop it')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        Logger.logPrint('Stopping the conversion service, waiting for the running jobs')
+    finally:
+        server.server_close()
+        service.stop()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,121 @@
+"""Checkpoint journal of the Steam to Microsoft exports in progress.
+
+Before the chunks of a save are written, the journal records the source file
+and the names of the chunks it will be split into. Each chunk is then marked
+as written once it has been flushed to the disk, and the save is removed from
+the journal when the container references it. An interrupted export can thus
+be resumed from the last durable chunk.
+"""
+
+import json
+import os
+from typing import Dict, List, Tuple
+
+import utils
+from cogs import AstroLogging as Logger
+from cogs.AstroSave import AstroSave, XBOX_CHUNK_SIZE
+
+JOURNAL_FILE_NAME = '.astrosaveconverter_journal.json'
+ENTRY_KEYS = {'source', 'size', 'mtime_ns', 'chunks', 'written'}
+
+
+class AstroExportJournal:
+    """Journal of the saves being exported into a Microsoft save folder."""
+
+    def __init__(self, folder: str) -> None:
+        """Load the journal of ``folder``, starting empty if there is none.
+
+        A journal that can't be read is ignored and ``damaged`` is set, the
+        exports it recorded can't be resumed.
+
+        Args:
+            folder: Microsoft save folder receiving the exported chunks.
+        """
+        self.folder = folder
+        self.full_path = utils.join_paths(folder, JOURNAL_FILE_NAME)
+        self.saves: Dict[str, dict] = {}
+        self.damaged = False
+
+        try:
+            with open(self.full_path, 'r', encoding='utf-8') as journal_file:
+                saves = json.load(journal_file)
+            if not isinstance(saves, dict) or not all(
+                    isinstance(entry, dict) and ENTRY_KEYS <= entry.keys() for entry in saves.values()):
+                raise ValueError('unexpected content')
+            self.saves = saves
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            Logger.logPrint(f'Damaged export journal {self.full_path}: {e}', 'warning')
+            self.damaged = True
+
+    def save(self) -> None:
+        """Flush the journal to the disk, deleting it once nothing is pending."""
+        if self.saves:
+            content = json.dumps(self.saves, indent=1).encode('utf-8')
+            utils.write_file_atomically(self.full_path, content)
+        elif utils.is_path_exists(self.full_path):
+            os.remove(self.full_path)
+
+    def begin_save(self, save: AstroSave, from_file: str) -> None:
+        """Record that the chunks of ``save`` are about to be written.
+
+        Args:
+            save: Save whose ``chunks_names`` have already been generated.
+            from_file: Path to the Steam ``.savegame`` file being exported.
+        """
+        stat = os.stat(from_file)
+        self.saves[save.name] = {
+            'source': os.path.abspath(from_file),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'chunks': list(save.chunks_names),
+            'written': [],
+        }
+        self.save()
+
+    def mark_chunk_written(self, save_name: str, chunk_index: int) -> None:
+        """Record that a chunk of ``save_name`` is durably written."""
+        self.saves[save_name]['written'].append(chunk_index)
+        self.save()
+
+    def commit_save(self, save_name: str) -> None:
+        """Forget ``save_name`` once it is referenced by the container."""
+        del self.saves[save_name]
+        self.save()
+
+    def is_chunk_written(self, save_name: str, chunk_index: int) -> bool:
+        """Return ``True`` if the chunk is complete on the disk."""
+        entry = self.saves[save_name]
+        if chunk_index not in entry['written']:
+            return False
+
+        expected_size = min(XBOX_CHUNK_SIZE, entry['size'] - chunk_index * XBOX_CHUNK_SIZE)
+        chunk_path = utils.join_paths(self.folder, entry['chunks'][chunk_index])
+        try:
+            return os.path.getsize(chunk_path) == expected_size
+        except FileNotFoundError:
+            return False
+
+    def is_source_unchanged(self, save_name: str) -> bool:
+        """Return ``True`` if the Steam file of ``save_name`` is still the journaled one."""
+        entry = self.saves[save_name]
+        try:
+            stat = os.stat(entry['source'])
+        except FileNotFoundError:
+            return False
+        return stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']
+
+    def get_pending_saves(self) -> List[Tuple[AstroSave, str]]:
+        """Return the saves not committed yet with their Steam source file."""
+        return [(AstroSave(name, list(entry['chunks'])), entry['source'])
+                for name, entry in self.saves.items()]
+
+    def discard_save(self, save_name: str) -> None:
+        """Delete the chunks already written for ``save_name`` and forget it."""
+        for chunk_name in self.saves[save_name]['chunks']:
+            chunk_path = utils.join_paths(self.folder, chunk_name)
+            if utils.is_path_exists(chunk_path):
+                Logger.logPrint(f'Removing partial chunk: {chunk_path}', 'debug')
+                os.remove(chunk_path)
+        self.commit_save(save_name)
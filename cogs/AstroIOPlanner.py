@@ -0,0 +1,327 @@
+"""Dry-run planning of migrations, from file metadata only.
+
+A plan resolves the saves a migration would convert, like ``migrate-all`` or a
+Steam to Microsoft export, and lists every operation it would do: backups,
+chunk reads, file writes and container edits, with their sizes. The sizes come
+from the containers and ``os.stat``, no save content is read and nothing is
+written. The plan then tells how many bytes are read and written, how many
+files are created, how much free space each disk needs and, from the
+throughput of the disks, how long the migration should take. The throughput
+is assumed to be that of a slow disk unless measured, which reads a sample
+of the saves and writes a temporary file.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import utils
+from cogs import AstroCompression
+from cogs import AstroLogging as Logger
+from cogs import AstroSaveMigration
+from cogs import AstroSaveStorage
+from cogs.AstroConversionManifest import AstroConversionManifest
+from cogs.AstroSave import AstroSave, XBOX_CHUNK_SIZE
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+from cogs.AstroSaveContainer import CHUNK_METADATA_SIZE
+
+BACKUP = 'backup'
+READ = 'read'
+WRITE = 'write'
+CONTAINER_EDIT = 'container'
+SKIP = 'skip'
+
+THROUGHPUT_SAMPLE_SIZE = 32 * 1024 * 1024
+# Throughputs of a slow hard disk, assumed when not measured, in bytes per second
+DEFAULT_READ_THROUGHPUT = 100 * 1024 * 1024
+DEFAULT_WRITE_THROUGHPUT = 50 * 1024 * 1024
+
+
+class AstroOperation:
+    """A file operation of a migration."""
+
+    def __init__(self, kind: str, path: str, read_bytes: int = 0, written_bytes: int = 0,
+                 creates_file: bool = False, save_name: str = None) -> None:
+        """Describe an operation.
+
+        Args:
+            kind: ``BACKUP``, ``READ``, ``WRITE``, ``CONTAINER_EDIT`` or
+                ``SKIP`` for a save unchanged since its last export.
+            path: File read, or written.
+            read_bytes: Bytes read by the operation.
+            written_bytes: Bytes written by the operation.
+            creates_file: Whether a new file is created.
+            save_name: Save the operation is done for.
+        """
+        self.kind = kind
+        self.path = path
+        self.read_bytes = read_bytes
+        self.written_bytes = written_bytes
+        self.creates_file = creates_file
+        self.save_name = save_name
+
+
+class AstroIOPlan:
+    """Operations of a migration and their cost."""
+
+    def __init__(self) -> None:
+        self.operations: List[AstroOperation] = []
+        self.replaced_bytes: Dict[str, int] = {}  # Size of the overwritten files, by target folder
+
+    def add(self, kind: str, path: str, read_bytes: int = 0, written_bytes: int = 0,
+            save_name: str = None) -> AstroOperation:
+        """Add an operation, a written file that already exists being replaced."""
+        creates_file = False
+        if written_bytes and kind != CONTAINER_EDIT:
+            if os.path.isfile(path):
+                folder = utils.get_dir_name(path)
+                self.replaced_bytes[folder] = self.replaced_bytes.get(folder, 0) + os.path.getsize(path)
+            else:
+                creates_file = True
+        operation = AstroOperation(kind, path, read_bytes, written_bytes, creates_file, save_name)
+        self.operations.append(operation)
+        return operation
+
+    def get_read_bytes(self) -> int:
+        """Return the number of bytes read by the migration."""
+        return sum(operation.read_bytes for operation in self.operations)
+
+    def get_written_bytes(self) -> int:
+        """Return the number of bytes written by the migration."""
+        return sum(operation.written_bytes for operation in self.operations)
+
+    def get_created_files(self) -> int:
+        """Return the number of files created by the migration."""
+        return sum(operation.creates_file for operation in self.operations)
+
+    def get_required_space(self) -> Dict[str, int]:
+        """Return the free space needed on every disk, by its first written folder.
+
+        The files replaced by the migration give their space back.
+        """
+        required: Dict[int, List] = {}
+        for operation in self.operations:
+            if not operation.written_bytes:
+                continue
+            folder = utils.get_dir_name(operation.path)
+            device = os.stat(get_existing_parent(folder)).st_dev
+            required.setdefault(device, [folder, 0])[1] += operation.written_bytes
+        for folder, replaced in self.replaced_bytes.items():
+            device = os.stat(get_existing_parent(folder)).st_dev
+            required[device][1] -= replaced
+        return {folder: max(0, size) for folder, size in required.values()}
+
+    def estimate_duration(self, read_throughput: float, write_throughput: float) -> float:
+        """Return the expected duration of the migration in seconds.
+
+        Reads and writes are counted one after the other, as a single save is.
+
+        Args:
+            read_throughput: Bytes read per second.
+            write_throughput: Bytes written per second.
+        """
+        return self.get_read_bytes() / read_throughput + self.get_written_bytes() / write_throughput
+
+    def to_dict(self) -> dict:
+        """Return the plan as JSON-ready data."""
+        return {
+            'read_bytes': self.get_read_bytes(),
+            'written_bytes': self.get_written_bytes(),
+            'created_files': self.get_created_files(),
+            'required_space': self.get_required_space(),
+            'operations': [vars(operation) for operation in self.operations],
+        }
+
+
+def get_existing_parent(path: str) -> str:
+    """Return ``path``, or its closest existing parent folder."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def plan_backup(plan: AstroIOPlan, source_folder: str, backup_path: str, shared_chunks=()) -> None:
+    """Add the backup of a save folder to ``plan``.
+
+    Args:
+        plan: Plan to complete.
+        source_folder: Save folder to back up.
+        backup_path: Backup folder, or archive path without extension.
+        shared_chunks: Files read anyway for the conversion, backed up
+            without being read again.
+    """
+    storage = AstroSaveStorage.open_storage(source_folder)
+    sizes = {name: storage.get_size(name) for name in storage.list_files()}
+    if AstroCompression.backup_format == 'folder':
+        for name, size in sorted(sizes.items()):
+            plan.add(BACKUP, utils.join_paths(backup_path, name), 0 if name in shared_chunks else size, size)
+    else:
+        # The archive is compressed, its uncompressed size is an upper bound
+        archive_path = f'{backup_path}.{AstroCompression.backup_format}'
+        read_bytes = sum(size for name, size in sizes.items() if name not in shared_chunks)
+        plan.add(BACKUP, archive_path, read_bytes, sum(sizes.values()))
+
+
+def plan_steam_migration(source_folders: List[str], target_path: str, backup_path: str = None) -> AstroIOPlan:
+    """Plan the export of every save of ``source_folders`` to the Steam format, like ``migrate-all``.
+
+    Args:
+        source_folders: Microsoft save folders.
+        target_path: Folder receiving the Steam saves.
+        backup_path: Folder receiving the backups of the source folders.
+
+    Returns:
+        AstroIOPlan: The operations of the migration.
+    """
+    plan = AstroIOPlan()
+    manifests: Dict[str, AstroConversionManifest] = {}
+    exported_chunks: Dict[str, set] = {folder: set() for folder in source_folders}
+    compression = AstroCompression.export_compression
+    for task in AstroSaveMigration.list_migration_tasks(source_folders, target_path):
+        if task.target_folder not in manifests:
+            manifests[task.target_folder] = AstroConversionManifest(task.target_folder)
+        export_path = utils.join_paths(task.target_folder,
+                                       AstroCompression.get_export_file_name(task.save, compression))
+        if manifests[task.target_folder].is_steam_export_up_to_date(task.save, task.source_folder, compression):
+            plan.add(SKIP, export_path, save_name=task.save.name)
+            continue
+
+        storage = AstroSaveStorage.open_storage(task.source_folder)
+        for chunk_name in task.save.chunks_names:
+            plan.add(READ, utils.join_paths(task.source_folder, chunk_name), storage.get_size(chunk_name),
+                     save_name=task.save.name)
+        exported_chunks[task.source_folder].update(task.save.chunks_names)
+        # A compressed save is smaller, its uncompressed size is an upper bound
+        plan.add(WRITE, export_path, written_bytes=task.size, save_name=task.save.name)
+
+    if backup_path:
+        for source_folder in source_folders:
+            backup_name = os.path.basename(os.path.normpath(source_folder))
+            plan_backup(plan, source_folder, utils.join_paths(backup_path, backup_name), exported_chunks[source_folder])
+    return plan
+
+
+def plan_xbox_export(steam_folder: str, target_folder: str, backup_path: str = None) -> AstroIOPlan:
+    """Plan the export of every Steam save of ``steam_folder`` to a Microsoft save folder.
+
+    Args:
+        steam_folder: Folder holding the ``.savegame`` files.
+        target_folder: Microsoft save folder receiving the chunks.
+        backup_path: Folder receiving a backup of ``target_folder`` first.
+
+    Returns:
+        AstroIOPlan: The operations of the export.
+    """
+    plan = AstroIOPlan()
+    if backup_path and utils.is_folder_a_dir(target_folder):
+        plan_backup(plan, target_folder, backup_path)
+
+    manifest = AstroConversionManifest(target_folder, xbox=True)
+    try:
+        container_name = Container.get_containers_list(target_folder)[0]
+        container_size = os.path.getsize(utils.join_paths(target_folder, container_name))
+    except FileNotFoundError:
+        container_name, container_size = 'container.1', 8
+
+    for save in AstroSave.init_saves_list_from(sorted(AstroSave.get_steamsaves_list(steam_folder))):
+        from_file = utils.join_paths(steam_folder, save.get_file_name())
+        if manifest.is_xbox_export_up_to_date(save, from_file):
+            plan.add(SKIP, from_file, save_name=save.name)
+            continue
+
+        size = os.path.getsize(from_file)
+        plan.add(READ, from_file, size, save_name=save.name)
+        # A file whose size is a multiple of XBOX_CHUNK_SIZE ends with an empty chunk
+        chunk_count = size // XBOX_CHUNK_SIZE + 1
+        for index in range(chunk_count):
+            chunk_size = min(XBOX_CHUNK_SIZE, size - index * XBOX_CHUNK_SIZE)
+            plan.add(WRITE, utils.join_paths(target_folder, f'<chunk {index + 1} of {save.name}>'),
+                     written_bytes=chunk_size, save_name=save.name)
+        # The container is rewritten with the records of the save added
+        container_size += chunk_count * CHUNK_METADATA_SIZE
+        plan.add(CONTAINER_EDIT, utils.join_paths(target_folder, container_name), container_size,
+                 container_size, save_name=save.name)
+    return plan
+
+
+def measure_read_throughput(paths: List[str], sample_size: int = THROUGHPUT_SAMPLE_SIZE) -> float:
+    """Measure the read throughput of the disk holding ``paths``, in bytes per second.
+
+    Up to ``sample_size`` bytes of the files are read after being evicted
+    from the system file cache when possible.
+
+    Raises:
+        ValueError: If ``paths`` hold nothing to read.
+    """
+    read_bytes = 0
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb') as file:
+            utils.advise_file(file, 'POSIX_FADV_DONTNEED')
+            while read_bytes < sample_size:
+                block = file.read(min(utils.IO_BUFFER_SIZE, sample_size - read_bytes))
+                if not block:
+                    break
+                read_bytes += len(block)
+        if read_bytes >= sample_size:
+            break
+    duration = time.perf_counter() - start
+    if not read_bytes:
+        raise ValueError('Nothing to read to measure the read throughput')
+    return read_bytes / max(duration, 1e-6)
+
+
+def measure_write_throughput(folder: str, sample_size: int = THROUGHPUT_SAMPLE_SIZE) -> float:
+    """Measure the write throughput of the disk holding ``folder``, in bytes per second.
+
+    A temporary file of ``sample_size`` bytes is written, synced and removed.
+    """
+    temp_fd, temp_path = tempfile.mkstemp(prefix='.astrosaveconverter-', suffix='.tmp',
+                                          dir=get_existing_parent(folder))
+    block = os.urandom(min(utils.IO_BUFFER_SIZE, sample_size))
+    try:
+        start = time.perf_counter()
+        with os.fdopen(temp_fd, 'wb') as file:
+            written = 0
+            while written < sample_size:
+                written += file.write(block[:sample_size - written])
+            utils.sync_file(file)
+        return written / max(time.perf_counter() - start, 1e-6)
+    finally:
+        os.remove(temp_path)
+
+
+def log_plan(plan: AstroIOPlan, read_throughput: float, write_throughput: float) -> None:
+    """Log the operations of ``plan`` by save, and their cost."""
+    megabytes = 1024 * 1024
+    by_save: Dict[str, List[AstroOperation]] = {}
+    for operation in plan.operations:
+        by_save.setdefault(operation.save_name, []).append(operation)
+
+    for save_name, operations in by_save.items():
+        if save_name is None:
+            continue
+        if operations[0].kind == SKIP:
+            Logger.logPrint(f'  {save_name}: unchanged since its last export, skipped')
+            continue
+        counts = {kind: sum(operation.kind == kind for operation in operations) for kind in (READ, WRITE)}
+        Logger.logPrint(f'  {save_name}: {counts[READ]} file(s) read '
+                        f'({sum(op.read_bytes for op in operations if op.kind == READ) / megabytes:.2f} MB), '
+                        f'{counts[WRITE]} file(s) written '
+                        f'({sum(op.written_bytes for op in operations if op.kind == WRITE) / megabytes:.2f} MB)'
+                        + (', container edited' if any(op.kind == CONTAINER_EDIT for op in operations) else ''))
+    for operation in by_save.get(None, []):
+        Logger.logPrint(f'  backup {operation.path} ({operation.written_bytes / megabytes:.2f} MB)')
+
+    Logger.logPrint(f'{plan.get_read_bytes() / megabytes:.2f} MB read, {plan.get_written_bytes() / megabytes:.2f} MB '
+                    f'written, {plan.get_created_files()} file(s) created')
+    for folder, required in plan.get_required_space().items():
+        free = shutil.disk_usage(get_existing_parent(folder)).free
+        state = 'OK' if required <= free else 'NOT ENOUGH FREE SPACE'
+        Logger.logPrint(f'{required / megabytes:.2f} MB needed on the disk of {folder}, '
+                        f'{free / megabytes:.2f} MB free: {state}')
+    Logger.logPrint(f'Estimated duration: {plan.estimate_duration(read_throughput, write_throughput):.1f} s '
+                    f'(read {read_throughput / megabytes:.0f} MB/s, write {write_throughput / megabytes:.0f} MB/s)')
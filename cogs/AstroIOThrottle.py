@@ -0,0 +1,117 @@
+"""Process-wide limit of the disk bandwidth used by conversions and backups.
+
+Every block read from or written to a save file goes through ``consume``,
+which waits as needed to keep the overall throughput under the configured
+rate. Conversions can then run next to a live server with a predictable
+impact on its disk. ``configure`` registers it as the I/O hook of ``utils``.
+"""
+
+import os
+import threading
+import time
+
+import utils
+from cogs import AstroLogging as Logger
+
+# ioprio_set syscall numbers of the architectures Linux servers usually run on
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289,
+                       'aarch64': 30, 'arm64': 30, 'armv7l': 314}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_SHIFT = 13
+WINDOWS_PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+
+
+class TokenBucket:
+    """Token bucket allowing bursts of ``burst`` bytes and ``rate`` bytes/s on average."""
+
+    def __init__(self, rate: float, burst: float = None, clock=time.monotonic, sleep=time.sleep) -> None:
+        """Create a full bucket.
+
+        Args:
+            rate: Sustained throughput, in bytes per second.
+            burst: Bytes that can be transferred at once after an idle period,
+                one second worth of ``rate`` by default.
+            clock: Monotonic clock used to refill the bucket.
+            sleep: Function used to wait for tokens.
+        """
+        if rate <= 0:
+            raise ValueError(f'Invalid I/O rate: {rate}')
+        self.rate = rate
+        self.burst = burst or rate
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__tokens = self.burst
+        self.__last_refill = clock()
+        self.__lock = threading.Lock()
+
+    def consume(self, amount: int) -> float:
+        """Take ``amount`` bytes from the bucket, waiting until they are available.
+
+        Tokens are reserved before waiting, so concurrent callers are served
+        in order and the bucket never exceeds the configured rate.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        with self.__lock:
+            now = self.__clock()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__last_refill) * self.rate)
+            self.__last_refill = now
+            self.__tokens -= amount
+            wait = -self.__tokens / self.rate if self.__tokens < 0 else 0.0
+
+        if wait > 0:
+            self.__sleep(wait)
+        return wait
+
+
+io_bucket = None
+
+
+def configure(rate: float = None, burst: float = None) -> None:
+    """Limit the bandwidth of every copy and conversion of the process.
+
+    Args:
+        rate: Sustained throughput in bytes per second, ``None`` for no limit.
+        burst: Size in bytes of the bursts allowed above ``rate``.
+    """
+    global io_bucket
+    io_bucket = TokenBucket(rate, burst) if rate else None
+    utils.set_io_hook(consume if io_bucket else None)
+    if io_bucket:
+        Logger.logPrint(f'I/O limited to {rate / 1024 / 1024:.2f} MB/s '
+                        f'(bursts of {io_bucket.burst / 1024 / 1024:.2f} MB)', 'debug')
+
+
+def consume(amount: int) -> None:
+    """Account for ``amount`` bytes read or written, waiting if over the limit."""
+    if io_bucket is not None:
+        io_bucket.consume(amount)
+
+
+def lower_io_priority() -> None:
+    """Lower the CPU and disk priority of the process, as far as the OS allows."""
+    import ctypes
+    import platform
+
+    if os.name == 'nt':
+        kernel32 = ctypes.windll.kernel32
+        # Background mode lowers both the CPU and the I/O priority
+        if kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), WINDOWS_PROCESS_MODE_BACKGROUND_BEGIN):
+            Logger.logPrint('Process switched to background mode', 'debug')
+        return
+
+    os.nice(10)
+
+    syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+    if platform.system() != 'Linux' or syscall_number is None:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        # Lowest priority of the best-effort class, the idle class could starve forever
+        priority = (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | 7
+        if libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0, priority) == 0:
+            Logger.logPrint('I/O priority lowered', 'debug')
+    except (OSError, AttributeError) as e:
+        Logger.logPrint(f'Unable to lower the I/O priority: {e}', 'debug')
@@ -2,7 +2,6 @@
 
 import logging
 import os
-from logging.handlers import TimedRotatingFileHandler
 
 
 def logPrint(message, msgType="info"):
@@ -31,21 +30,29 @@ def logPrint(message, msgType="info"):
 def setup_logging(astroPath: str, console_print: bool = True) -> None:
     """Configure the logging subsystem.
 
+    The ``logs`` folder and the log file are only created when the first
+    message is logged.
+
     Args:
         astroPath: Base directory where log files should be stored.
         console_print: Unused legacy flag to enable console output.
     """
+    from logging.handlers import TimedRotatingFileHandler
+
+    class LazyFileHandler(TimedRotatingFileHandler):
+        """Log file handler creating its folder along with the file."""
+
+        def _open(self):
+            os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+            return super()._open()
+
     formatter = logging.Formatter(
         '%(asctime)s - %(levelname)-6s %(message)s', datefmt="%Y-%m-%d %H:%M:%S")
     rootLogger = logging.getLogger()
     rootLogger.setLevel(logging.DEBUG)
 
-    logsPath = os.path.join(astroPath, 'logs')
-    if not os.path.exists(logsPath):
-        os.makedirs(logsPath)
-
-    fileLogHandler = TimedRotatingFileHandler(
-        os.path.join(astroPath, 'logs', "astro_converter.log"), 'midnight', 1)
+    fileLogHandler = LazyFileHandler(
+        os.path.join(astroPath, 'logs', "astro_converter.log"), 'midnight', 1, delay=True)
     fileLogHandler.setFormatter(formatter)
 
     rootLogger.addHandler(fileLogHandler)
@@ -0,0 +1,287 @@
+"""Ledger of the performance of conversions, backups and scans.
+
+Once ``configure``d, every save conversion, backup and ``check`` run appends
+one JSON line to the ledger, next to the log file: operation, direction, save
+size, chunk count, wall time of every phase, throughput, peak memory of the
+process and version of AstroSaveConverter. ``summarize`` aggregates a ledger
+into percentiles per operation and version, so that a performance regression
+between two releases shows up.
+
+Nothing is recorded until a ledger is configured, so embedding the
+conversion API writes no file.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from cogs import AstroLogging as Logger
+
+LEDGER_FILE_NAME = 'metrics.jsonl'
+
+CONVERSION = 'conversion'
+BACKUP = 'backup'
+SCAN = 'scan'
+
+MICROSOFT_TO_STEAM = 'microsoft_to_steam'
+STEAM_TO_MICROSOFT = 'steam_to_microsoft'
+
+OK = 'ok'
+FAILED = 'failed'
+
+PERCENTILES = (50, 90, 99)
+
+# Ledger receiving the records, see ``configure``
+ledger_path = None
+app_version = None
+ledger_lock = threading.Lock()
+
+
+def configure(path: str = None, version: str = None) -> None:
+    """Record the metrics of the process in a ledger.
+
+    Args:
+        path: JSONL ledger, created with its folder on the first record.
+            ``None`` to stop recording.
+        version: Version of AstroSaveConverter written in every record.
+    """
+    global ledger_path, app_version
+    ledger_path = path
+    app_version = version
+
+
+def get_peak_rss() -> Optional[int]:
+    """Return the peak resident memory of the process in bytes, ``None`` if unknown."""
+    try:
+        import resource
+    except ImportError:
+        return get_windows_peak_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # In bytes on macOS, in KiB elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_windows_peak_rss() -> Optional[int]:
+    """Return the peak working set of the process on Windows, ``None`` elsewhere."""
+    if os.name != 'nt':
+        return None
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+class AstroMetricsRecord:
+    """Measures of one operation."""
+
+    def __init__(self, operation: str, direction: str = None, name: str = None) -> None:
+        """Start measuring an operation.
+
+        Args:
+            operation: ``CONVERSION``, ``BACKUP`` or ``SCAN``.
+            direction: Conversion direction, or backup format.
+            name: Save, folder or container concerned.
+        """
+        self.operation = operation
+        self.direction = direction
+        self.name = name
+        self.size = None
+        self.chunk_count = None
+        self.phases: Dict[str, float] = {}
+        self.status = OK
+        self.start = time.perf_counter()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        """Add ``seconds`` to the wall time of a phase."""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure the wall time of a phase.
+
+        The time spent in the phases nested in it is not counted twice.
+        """
+        start, nested = time.perf_counter(), sum(self.phases.values())
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start - (sum(self.phases.values()) - nested))
+
+    def timed_blocks(self, blocks: Iterable[bytes], phase: str) -> Iterator[bytes]:
+        """Yield ``blocks``, adding the time spent producing them to ``phase``."""
+        iterator = iter(blocks)
+        while True:
+            start = time.perf_counter()
+            try:
+                block = next(iterator)
+            except StopIteration:
+                self.add_phase(phase, time.perf_counter() - start)
+                return
+            self.add_phase(phase, time.perf_counter() - start)
+            yield block
+
+    def to_dict(self, duration: float) -> dict:
+        """Return the record as a JSON-serializable dictionary."""
+        return {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'version': app_version,
+            'operation': self.operation,
+            'direction': self.direction,
+            'name': self.name,
+            'status': self.status,
+            'size': self.size,
+            'chunk_count': self.chunk_count,
+            'duration': round(duration, 6),
+            'phases': {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            'mb_per_s': round(self.size / duration / 1024 / 1024, 3) if self.size and duration > 0 else None,
+            'peak_rss': get_peak_rss(),
+        }
+
+
+@contextmanager
+def measure(operation: str, direction: str = None, name: str = None) -> Iterator[AstroMetricsRecord]:
+    """Measure an operation and append its record to the ledger.
+
+    The record of an operation raising an exception is ``FAILED``.
+
+    Args:
+        operation: ``CONVERSION``, ``BACKUP`` or ``SCAN``.
+        direction: Conversion direction, or backup format.
+        name: Save, folder or container concerned.
+
+    Yields:
+        AstroMetricsRecord: Record to fill with the size, chunk count and phases.
+    """
+    record = AstroMetricsRecord(operation, direction, name)
+    try:
+        yield record
+    except BaseException:
+        record.status = FAILED
+        raise
+    finally:
+        if ledger_path is not None:
+            append_record(record.to_dict(time.perf_counter() - record.start))
+
+
+def append_record(record: dict) -> None:
+    """Append a record to the ledger, never failing the measured operation."""
+    line = json.dumps(record) + '\n'
+    try:
+        with ledger_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(ledger_path)), exist_ok=True)
+            with open(ledger_path, 'a+b') as ledger:
+                # Ending a line cut by a crash, not to lose this record with it
+                if ledger.seek(0, os.SEEK_END) > 0:
+                    ledger.seek(-1, os.SEEK_END)
+                    if ledger.read(1) != b'\n':
+                        line = '\n' + line
+                ledger.write(line.encode('utf-8'))
+    except OSError as e:
+        Logger.logPrint(f'Metrics not recorded in {ledger_path}: {e}', 'warning')
+
+
+def read_ledger(path: str) -> List[dict]:
+    """Return the records of a ledger, skipping the lines that can't be parsed.
+
+    Raises:
+        FileNotFoundError: If the ledger doesn't exist.
+    """
+    records = []
+    with open(path, encoding='utf-8') as ledger:
+        for line in ledger:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Line cut by a crash
+                continue
+    return records
+
+
+def get_percentile(values: List[float], percent: float) -> float:
+    """Return a percentile of sorted values, interpolating between the closest ones."""
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def get_percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    """Return the ``PERCENTILES`` of values, ``None`` if there is none."""
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    return {f'p{percent}': round(get_percentile(values, percent), 6) for percent in PERCENTILES}
+
+
+def summarize(records: List[dict]) -> List[dict]:
+    """Aggregate records into percentiles per operation, direction and version.
+
+    Returns:
+        List[dict]: One summary per group, with the number of operations and
+            of failures, the bytes processed and the percentiles of the
+            duration, throughput, phases and peak memory of the operations
+            that succeeded.
+    """
+    groups: Dict[tuple, List[dict]] = {}
+    for record in records:
+        key = (record.get('operation'), record.get('direction'), record.get('version'))
+        groups.setdefault(key, []).append(record)
+
+    summaries = []
+    for (operation, direction, version), group in sorted(groups.items(), key=lambda item: str(item[0])):
+        succeeded = [record for record in group if record.get('status') == OK]
+        phases = sorted({phase for record in succeeded for phase in record.get('phases', {})})
+        summaries.append({
+            'operation': operation,
+            'direction': direction,
+            'version': version,
+            'count': len(group),
+            'failed': len(group) - len(succeeded),
+            'total_bytes': sum(record.get('size') or 0 for record in succeeded),
+            'duration': get_percentiles([record.get('duration') for record in succeeded]),
+            'mb_per_s': get_percentiles([record.get('mb_per_s') for record in succeeded]),
+            'phases': {phase: get_percentiles([record.get('phases', {}).get(phase) for record in succeeded])
+                       for phase in phases},
+            'peak_rss': get_percentiles([record.get('peak_rss') for record in succeeded]),
+        })
+    return summaries
+
+
+def format_percentiles(percentiles: Optional[Dict[str, float]], unit: str, scale: float = 1) -> str:
+    """Format percentiles as ``p50/p90/p99`` values."""
+    if percentiles is None:
+        return '-'
+    return '/'.join(f'{percentiles[f"p{percent}"] / scale:.3f}' for percent in PERCENTILES) + f' {unit}'
+
+
+def format_summary(summaries: List[dict]) -> List[str]:
+    """Format summaries as text lines."""
+    lines = [f'Percentiles {"/".join(f"p{percent}" for percent in PERCENTILES)} of the successful operations']
+    for summary in summaries:
+        direction = f" {summary['direction']}" if summary['direction'] else ''
+        lines.append(f"{summary['operation']}{direction} (version {summary['version'] or '-'}): "
+                     f"{summary['count']} operation(s), {summary['failed']} failed, "
+                     f"{summary['total_bytes'] / 1024 / 1024:.2f} MB")
+        lines.append(f"    duration    {format_percentiles(summary['duration'], 's')}")
+        lines.append(f"    throughput  {format_percentiles(summary['mb_per_s'], 'MB/s')}")
+        for phase, percentiles in summary['phases'].items():
+            lines.append(f"    {phase:<11} {format_percentiles(percentiles, 's')}")
+        lines.append(f"    peak RSS    {format_percentiles(summary['peak_rss'], 'MB', 1024 * 1024)}")
+    return lines
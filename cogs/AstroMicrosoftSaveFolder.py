@@ -2,6 +2,7 @@
 
 import os
 from cogs import AstroLogging as Logger
+from cogs import AstroCompression
 import utils
 import re
 import glob
@@ -155,7 +156,7 @@ def backup_microsoft_save_folder(to_path: str) -> str:
         str: Path to the original save folder that was backed up.
     """
     astroneer_save_folder = get_microsoft_save_folder()
-    utils.copy_files(astroneer_save_folder, to_path)
+    AstroCompression.backup_folder(astroneer_save_folder, to_path)
 
     return astroneer_save_folder
 
@@ -189,6 +190,6 @@ def backup_microsoft_save_folders(folders: list, to_path: str) -> list:
     utils.make_dir_if_doesnt_exists(to_path)
     for i, folder in enumerate(folders, 1):
         destination = utils.join_paths(to_path, f'Backup_{i}')
-        utils.copy_files(folder, destination)
+        AstroCompression.backup_folder(folder, destination)
 
     return folders
@@ -0,0 +1,135 @@
+"""Profiling of a whole run, to attach to a performance issue.
+
+``AstroProfiler`` runs cProfile on the main thread and on every thread
+started while it is active (the conversion workers), and traces the memory
+allocations with tracemalloc. When stopped, it writes in the logs folder a
+``.pstats`` file, readable with :mod:`pstats` or tools like snakeviz, and a
+text report with the peak memory, the lines holding the most memory when the
+memory use was the highest and the functions taking the most time.
+
+Tracing the allocations makes the run noticeably slower, and adds to its
+peak memory.
+"""
+
+import cProfile
+import io
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Tuple
+
+from cogs.AstroMetrics import get_peak_rss
+
+TOP_ENTRIES = 30  # Allocations and functions listed in the report
+PEAK_SAMPLE_INTERVAL = 0.5  # Seconds between two checks of the allocated memory
+PEAK_SNAPSHOT_GROWTH = 1.1  # Growth of the allocated memory triggering a new snapshot
+
+
+class AstroProfiler:
+    """CPU and memory profiler of a run."""
+
+    def __init__(self, folder: str, app_version: str, top: int = TOP_ENTRIES) -> None:
+        """Create a profiler.
+
+        Args:
+            folder: Folder receiving the reports, created if needed.
+            app_version: Version written in the report.
+            top: Number of allocations and functions listed in the report.
+        """
+        self.folder = folder
+        self.app_version = app_version
+        self.top = top
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.start_time = None
+        self.start_cpu_time = None
+        self.peak_snapshot = None
+        self.peak_snapshot_size = 0
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.__sample_peak_memory, daemon=True)
+
+    def start(self) -> None:
+        """Start profiling the current thread and the threads started from now on."""
+        tracemalloc.start()
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        # Started before the hook, not to be profiled
+        self.sampler.start()
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        threading.setprofile(self.__profile_thread)
+        profile.enable()
+
+    def __sample_peak_memory(self) -> None:
+        """Keep a snapshot of the allocations taken close to the highest memory use."""
+        while not self.stopped.wait(PEAK_SAMPLE_INTERVAL):
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self.peak_snapshot_size * PEAK_SNAPSHOT_GROWTH:
+                self.peak_snapshot = tracemalloc.take_snapshot()
+                self.peak_snapshot_size = current
+
+    def __profile_thread(self, frame, event, arg) -> None:
+        """Replace the profiling hook of a new thread with a profiler of its own."""
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Since Python 3.12, the profiler of the main thread sees every thread
+            return
+        with self.lock:
+            self.profiles.append(profile)
+
+    def stop(self) -> Tuple[str, str]:
+        """Stop profiling and write the reports.
+
+        Returns:
+            The paths of the ``.pstats`` file and of the text report.
+        """
+        threading.setprofile(None)
+        self.profiles[0].disable()
+        duration = time.perf_counter() - self.start_time
+        cpu_time = time.process_time() - self.start_cpu_time
+        self.stopped.set()
+        self.sampler.join()
+        snapshot = tracemalloc.take_snapshot()
+        current, traced_peak = tracemalloc.get_traced_memory()
+        if current >= self.peak_snapshot_size:
+            self.peak_snapshot, self.peak_snapshot_size = snapshot, current
+        tracemalloc.stop()
+
+        with self.lock:
+            stats = pstats.Stats(*self.profiles, stream=io.StringIO())
+
+        os.makedirs(self.folder, exist_ok=True)
+        base_path = os.path.join(self.folder, f'profile_{time.strftime("%Y%m%d_%H%M%S")}')
+        stats_path, report_path = f'{base_path}.pstats', f'{base_path}.txt'
+        stats.dump_stats(stats_path)
+
+        peak_rss = get_peak_rss()
+        lines = [
+            f'AstroSaveConverter {self.app_version} profile',
+            f'Command: {" ".join(sys.argv)}',
+            f'Python {platform.python_version()} on {platform.platform()}',
+            f'Wall time: {duration:.2f} s, CPU time: {cpu_time:.2f} s, {len(self.profiles)} thread(s) profiled',
+            'Peak RSS: ' + (f'{peak_rss / 1024 / 1024:.1f} MB' if peak_rss is not None else 'unknown')
+            + ' (tracemalloc included)',
+            f'Peak memory allocated by Python: {traced_peak / 1024 / 1024:.1f} MB',
+            '',
+            f'Top {self.top} allocations by line, when {self.peak_snapshot_size / 1024 / 1024:.1f} MB were allocated:',
+        ]
+        snapshot = self.peak_snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        for statistic in snapshot.statistics('lineno')[:self.top]:
+            lines.append(f'  {statistic}')
+        lines += ['', f'Top {self.top} functions by cumulative time:']
+
+        stats.stream = io.StringIO()
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        lines.append(stats.stream.getvalue())
+        with open(report_path, 'w', encoding='utf-8') as report:
+            report.write('\n'.join(lines))
+        return stats_path, report_path
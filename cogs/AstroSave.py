@@ -4,28 +4,92 @@ from __future__ import annotations
 import os
 import re
 import uuid
-from typing import List, Tuple
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
 from io import BytesIO
 
 from cogs import AstroLogging as Logger
-from utils import is_a_file, list_folder_content, join_paths
+from cogs import AstroSaveStorage
+from utils import is_a_file, list_folder_content, join_paths, read_file_blocks
 
 
 XBOX_CHUNK_SIZE = int.from_bytes(b'\x01\x00\x00\x00', byteorder='big')
+CHUNK_ID_SIZE = 16  # Size of the raw UUID naming a chunk file
+
+# Platforms of a save, as reported by the API, the catalog and the inspector
+MICROSOFT = 'microsoft'
+STEAM = 'steam'
 
 
 class AstroSave:
-    """In-memory representation of an Astroneer save."""
+    """In-memory representation of an Astroneer save.
+
+    Thousands of saves can be loaded at once by the catalog and the migrations,
+    so a save only holds its name and the raw 16-byte UUIDs of its chunks. The
+    saves of a container share the buffer of the container, each save only
+    knowing where its UUIDs are in it. The chunk file names are only built when
+    asked for.
+    """
+
+    __slots__ = ('name', '_ids', '_start', '_end')
 
-    def __init__(self, save_name: str, chunks_names: List[str]) -> None:
+    def __init__(self, save_name: str, chunks_names: List[str] = (), chunk_ids: bytes = None,
+                 start: int = 0, end: int = None) -> None:
         """Create a new ``AstroSave`` instance.
 
         Args:
             save_name: Name of the save.
             chunks_names: Names of the chunks constituting the save.
+            chunk_ids: Buffer of concatenated raw chunk UUIDs, used instead of
+                ``chunks_names`` if given. It isn't copied.
+            start: Offset of the first UUID of the save in ``chunk_ids``.
+            end: Offset after the last UUID of the save in ``chunk_ids``, its
+                end if ``None``.
         """
         self.name = save_name  # User-defined save name + '$' + YYYY.MM.dd-HH.mm.ss
-        self.chunks_names = chunks_names  # Names of the all the chunks composing the save
+        if chunk_ids is None:
+            self.chunks_names = chunks_names
+        else:
+            self._ids, self._start = chunk_ids, start
+            self._end = len(chunk_ids) if end is None else end
+
+    @property
+    def chunk_ids(self) -> bytes:
+        """Raw UUIDs of the chunks of the save, concatenated."""
+        if self._start == 0 and self._end == len(self._ids):
+            return self._ids
+        return self._ids[self._start:self._end]
+
+    @chunk_ids.setter
+    def chunk_ids(self, chunk_ids: bytes) -> None:
+        self._ids, self._start, self._end = bytes(chunk_ids), 0, len(chunk_ids)
+
+    @property
+    def chunks_names(self) -> List[str]:
+        """Names of the all the chunks composing the save, the HEX upper form of their UUID.
+
+        A new list is built from the UUIDs on every access: changing it doesn't
+        change the save, assign the names instead. Loops should keep the list
+        rather than asking for it again, and use ``chunk_count`` or
+        ``get_chunk_name`` when they don't need every name.
+        """
+        return [self._ids[i:i + CHUNK_ID_SIZE].hex().upper() for i in range(self._start, self._end, CHUNK_ID_SIZE)]
+
+    @chunks_names.setter
+    def chunks_names(self, chunks_names: List[str]) -> None:
+        self.chunk_ids = b''.join(bytes.fromhex(chunk_name) for chunk_name in chunks_names)
+
+    @property
+    def chunk_count(self) -> int:
+        """Number of chunks of the save."""
+        return (self._end - self._start) // CHUNK_ID_SIZE
+
+    def get_chunk_name(self, chunk_index: int) -> str:
+        """Return the file name of the chunk at ``chunk_index``."""
+        start = self._start + chunk_index * CHUNK_ID_SIZE
+        if not 0 <= chunk_index < self.chunk_count:
+            raise IndexError(f'Save {self.name} has no chunk {chunk_index}')
+        return self._ids[start:start + CHUNK_ID_SIZE].hex().upper()
 
     @staticmethod
     def init_saves_list_from(steamsave_files_list: List[str]) -> List['AstroSave']:
@@ -49,13 +113,32 @@ class AstroSave:
             A buffer containing the Steam save
         """
         buffer = BytesIO()
-        for chunk_name in self.chunks_names:
-            chunk_file_path = join_paths(source, chunk_name)
-
-            with open(chunk_file_path, 'rb') as chunk_file:
-                buffer.write(chunk_file.read())
+        for block in self.iter_steam_blocks(source):
+            buffer.write(block)
         return buffer
 
+    def iter_steam_blocks(self, source: str) -> Iterator[bytes]:
+        """Stream the content of the Steam file of the save.
+
+        Arguments:
+            source: Where to read the chunks of the save
+
+        Yields:
+            Consecutive blocks of the concatenated chunks
+        """
+        storage = AstroSaveStorage.open_storage(source)
+        for _, blocks in AstroSaveStorage.read_files_in_order(storage, self.chunks_names):
+            yield from blocks
+
+    def get_steam_size(self, source: str) -> int:
+        """Return the size of the Steam file of the save, from its chunks sizes.
+
+        Arguments:
+            source: Where the chunks of the save are stored
+        """
+        storage = AstroSaveStorage.open_storage(source)
+        return sum(storage.get_size(chunk_name) for chunk_name in self.chunks_names)
+
     def convert_to_xbox(self, source: str) -> Tuple[List[uuid.UUID], List[BytesIO]]:
         """Split a Steam save file into Xbox-formatted chunks.
 
@@ -65,35 +148,84 @@ class AstroSave:
         Returns:
             Tuple[List[uuid.UUID], List[BytesIO]]: Generated UUIDs and chunk buffers.
         """
-        buffer_uuids: List[uuid.UUID] = []
-        buffers: List[BytesIO] = []
-        self.chunks_names = []
+        buffer_uuids = self.prepare_xbox_chunks(source)
+        buffers = [self.read_xbox_chunk(source, i) for i in range(len(buffer_uuids))]
+
+        return (buffer_uuids, buffers)
 
-        len_read = XBOX_CHUNK_SIZE
-        save_file_path = source
+    def prepare_xbox_chunks(self, source: str) -> List[uuid.UUID]:
+        """Name the Xbox chunks a Steam save file will be split into.
 
-        with open(save_file_path, 'rb') as save_file:
-            while len_read == XBOX_CHUNK_SIZE:
-                buffer = BytesIO()
-                file_uuid = uuid.uuid4()
-                Logger.logPrint(f'UUID generated: {file_uuid}', "debug")
+        Only the size of ``source`` is read, the chunks content can then be
+        obtained one by one with ``read_xbox_chunk``.
 
-                buffer.write(save_file.read(XBOX_CHUNK_SIZE))
+        Args:
+            source: Path to the Steam ``.savegame`` file.
 
-                len_read = len(buffer.getvalue())
+        Returns:
+            List[uuid.UUID]: One generated UUID per chunk.
+        """
+        # A file whose size is a multiple of XBOX_CHUNK_SIZE ends with an empty chunk
+        chunk_count = os.path.getsize(source) // XBOX_CHUNK_SIZE + 1
 
-                self.chunks_names.append(file_uuid.hex.upper())
-                buffer_uuids.append(file_uuid)
-                buffers.append(buffer)
+        buffer_uuids: List[uuid.UUID] = []
+        for _ in range(chunk_count):
+            file_uuid = uuid.uuid4()
+            Logger.logPrint(f'UUID generated: {file_uuid}', "debug")
+            buffer_uuids.append(file_uuid)
 
-        return (buffer_uuids, buffers)
+        self.chunk_ids = b''.join(file_uuid.bytes for file_uuid in buffer_uuids)
+        return buffer_uuids
+
+    @staticmethod
+    def read_xbox_chunk(source: str, chunk_index: int) -> BytesIO:
+        """Read the content of one Xbox chunk from a Steam save file.
+
+        Args:
+            source: Path to the Steam ``.savegame`` file.
+            chunk_index: Position of the chunk in the save.
+
+        Returns:
+            BytesIO: Buffer holding at most ``XBOX_CHUNK_SIZE`` bytes.
+        """
+        buffer = BytesIO()
+        for block in read_file_blocks(source, chunk_index * XBOX_CHUNK_SIZE, XBOX_CHUNK_SIZE):
+            buffer.write(block)
+        return buffer
 
     def regenerate_uuid(self, chunk_index: int) -> uuid.UUID:
         """Generate a new UUID for the chunk at ``chunk_index``."""
         new_uuid = uuid.uuid4()
-        self.chunks_names[chunk_index](new_uuid.hex.upper())
+        chunk_ids = bytearray(self.chunk_ids)
+        chunk_ids[chunk_index * CHUNK_ID_SIZE:(chunk_index + 1) * CHUNK_ID_SIZE] = new_uuid.bytes
+        self.chunk_ids = chunk_ids
         return new_uuid
 
+    def get_base_name(self) -> str:
+        """Return the user-defined part of the save name."""
+        return self.name.split('$')[0]
+
+    def get_date(self) -> datetime:
+        """Return the date stored in the save name.
+
+        Raises:
+            ValueError: If the save name doesn't end with a valid date.
+        """
+        name_parts = self.name.split('$')
+        if len(name_parts) < 2:
+            raise ValueError(f'No date in save name {self.name}')
+
+        # Creative saves prefix the date with a 'c'
+        date_string = name_parts[1].lstrip('c')
+        return datetime.strptime(date_string, '%Y.%m.%d-%H.%M.%S')
+
+    def get_iso_date(self) -> Optional[str]:
+        """Return the date of the save in ISO format, ``None`` if it has none."""
+        try:
+            return self.get_date().isoformat()
+        except ValueError:
+            return None
+
     def get_file_name(self) -> str:
         """Return the filename corresponding to this save."""
         return self.name + '.savegame'
@@ -0,0 +1,262 @@
+"""SQLite catalog of the saves found in live save folders and backups.
+
+``update`` walks folders looking for Microsoft save folders (also inside zip
+and tar backups) and Steam save folders, and records every save with its
+date, platform, folder, chunks, size and content hash. Containers and Steam
+files whose modification time and size didn't change since the last update
+are not read again. Queries only read the database.
+
+The content hash is the SHA-256 of the Steam file of a save, so the same save
+has the same hash whatever its platform. Compressed Steam exports
+(``.savegame.xz`` and the like) are decompressed while hashed, so they are
+indexed with the hash and size of the save they hold.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Iterator, List, Tuple
+
+import utils
+from cogs import AstroCompression
+from cogs import AstroLogging as Logger
+from cogs import AstroSaveStorage
+from cogs.AstroSave import AstroSave, MICROSOFT, STEAM
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.expanduser('~'), '.astrosaveconverter', 'catalog.sqlite')
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tgz', '.tar.gz', '.tar.xz', '.tar.bz2')
+STEAM_EXTENSIONS = ('.savegame',) + tuple(f'.savegame.{codec}' for codec in AstroCompression.COMPRESSIONS)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS saves (
+    source TEXT NOT NULL REFERENCES sources(path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    base_name TEXT NOT NULL,
+    date TEXT,
+    platform TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    chunks TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS saves_base_name ON saves (base_name);
+CREATE INDEX IF NOT EXISTS saves_source ON saves (source);
+'''
+
+
+class AstroSaveCatalog:
+    """Catalog of saves stored in a SQLite database."""
+
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH) -> None:
+        """Open the catalog, creating it if needed.
+
+        Args:
+            path: Path of the SQLite database.
+        """
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def update(self, roots: List[str]) -> dict:
+        """Index the saves found under ``roots``.
+
+        Saves of files that disappeared from ``roots`` are removed from the
+        catalog.
+
+        Args:
+            roots: Folders to search, recursively, or archives.
+
+        Returns:
+            dict: Number of ``indexed``, ``unchanged`` and ``removed`` sources.
+        """
+        counts = {'indexed': 0, 'unchanged': 0, 'removed': 0}
+        seen = set()
+        with self.connection:
+            for root in roots:
+                root = os.path.abspath(root)
+                for path, mtime_ns, size, index in find_sources(root):
+                    seen.add(path)
+                    row = self.connection.execute('SELECT mtime_ns, size FROM sources WHERE path = ?',
+                                                  (path,)).fetchone()
+                    if row is not None and (row['mtime_ns'], row['size']) == (mtime_ns, size):
+                        counts['unchanged'] += 1
+                        continue
+                    try:
+                        saves = list(index(self))
+                    except Exception as e:
+                        Logger.logPrint(f'Unable to index {path}: {e}', 'warning')
+                        continue
+                    self.connection.execute('DELETE FROM sources WHERE path = ?', (path,))
+                    self.connection.execute('INSERT INTO sources VALUES (?, ?, ?)', (path, mtime_ns, size))
+                    self.connection.executemany(
+                        'INSERT INTO saves VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        [(path,) + save for save in saves])
+                    counts['indexed'] += 1
+
+                for row in self.connection.execute('SELECT path FROM sources').fetchall():
+                    if row['path'] not in seen and is_under(row['path'], root):
+                        self.connection.execute('DELETE FROM sources WHERE path = ?', (row['path'],))
+                        counts['removed'] += 1
+
+        Logger.logPrint(f"Catalog updated: {counts['indexed']} file(s) indexed, "
+                        f"{counts['unchanged']} unchanged, {counts['removed']} removed", 'debug')
+        return counts
+
+    def find_hash(self, folder: str, chunks: List[str], size: int) -> str:
+        """Return the known hash of a save made of the same chunks, if any.
+
+        Chunk names are random UUIDs renewed when a save changes, so a save
+        of the same folder with the same chunks and size has the same content.
+        """
+        row = self.connection.execute(
+            'SELECT sha256 FROM saves WHERE folder = ? AND chunks = ? AND size = ? LIMIT 1',
+            (folder, json.dumps(chunks), size)).fetchone()
+        return row['sha256'] if row else None
+
+    def list_saves(self, platform: str = None) -> List[sqlite3.Row]:
+        """Return every save of the catalog, newest first."""
+        query = 'SELECT * FROM saves'
+        parameters = ()
+        if platform:
+            query += ' WHERE platform = ?'
+            parameters = (platform,)
+        return self.connection.execute(query + ' ORDER BY date DESC, mtime_ns DESC', parameters).fetchall()
+
+    def search(self, text: str, platform: str = None) -> List[sqlite3.Row]:
+        """Return the saves whose name or folder contains ``text``, newest first."""
+        query = "SELECT * FROM saves WHERE (name LIKE ? ESCAPE '\\' OR folder LIKE ? ESCAPE '\\')"
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        parameters = (pattern, pattern)
+        if platform:
+            query += ' AND platform = ?'
+            parameters += (platform,)
+        return self.connection.execute(query + ' ORDER BY date DESC, mtime_ns DESC', parameters).fetchall()
+
+    def newest(self, base_name: str = None) -> List[sqlite3.Row]:
+        """Return the newest copy of every save, or of the save named ``base_name``."""
+        query = '''
+            SELECT * FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY base_name ORDER BY date DESC, mtime_ns DESC) AS rank
+                FROM saves)
+            WHERE rank = 1'''
+        parameters = ()
+        if base_name:
+            query += ' AND base_name = ? COLLATE NOCASE'
+            parameters = (base_name,)
+        return self.connection.execute(query + ' ORDER BY base_name', parameters).fetchall()
+
+
+def is_under(path: str, root: str) -> bool:
+    """Return ``True`` if ``path`` is ``root`` or inside it."""
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def is_archive_name(name: str) -> bool:
+    """Return ``True`` if ``name`` has the extension of a zip or tar archive."""
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def find_sources(root: str) -> Iterator[Tuple]:
+    """Find the container and Steam files under ``root``.
+
+    Yields:
+        The path of every file, its modification time and size, and a
+        function indexing its saves into a catalog.
+    """
+    if utils.is_a_file(root):
+        if is_archive_name(root):
+            yield from find_archive_sources(root)
+        return
+
+    for folder, folder_names, file_names in os.walk(root):
+        folder_names.sort()
+        for name in sorted(file_names):
+            path = utils.join_paths(folder, name)
+            if name.startswith('container.'):
+                stat = os.stat(path)
+                yield path, stat.st_mtime_ns, stat.st_size, microsoft_indexer(folder, name, path)
+            elif name.endswith(STEAM_EXTENSIONS):
+                stat = os.stat(path)
+                yield path, stat.st_mtime_ns, stat.st_size, steam_indexer(folder, name, stat.st_mtime_ns)
+            elif is_archive_name(name):
+                yield from find_archive_sources(path)
+
+
+def find_archive_sources(archive_path: str) -> Iterator[Tuple]:
+    """Find the container files of a backup archive, see ``find_sources``."""
+    try:
+        archive, files = AstroSaveStorage.open_archive(archive_path, os.stat(archive_path).st_mtime_ns)
+    except Exception as e:
+        Logger.logPrint(f'Unable to open {archive_path}: {e}', 'warning')
+        return
+
+    folders = sorted({AstroSaveStorage.get_member_folder(name) for name in files
+                      if os.path.basename(name).startswith('container.')})
+    for folder in folders:
+        folder_path = utils.join_paths(archive_path, folder) if folder else archive_path
+        storage = AstroSaveStorage.open_storage(folder_path)
+        for name in sorted(storage.list_files()):
+            if name.startswith('container.'):
+                yield (utils.join_paths(folder_path, name), storage.get_mtime_ns(name), storage.get_size(name),
+                       microsoft_indexer(storage, name, utils.join_paths(folder_path, name)))
+
+
+def microsoft_indexer(source, container_name: str, container_path: str):
+    """Return the function indexing the saves of a container."""
+    def index(catalog: AstroSaveCatalog) -> Iterator[Tuple]:
+        storage = AstroSaveStorage.open_storage(source)
+        for save in Container(container_path).save_list:
+            chunks_names = save.chunks_names
+            try:
+                size = save.get_steam_size(storage)
+                mtime_ns = max(storage.get_mtime_ns(chunk_name) for chunk_name in chunks_names)
+            except FileNotFoundError as e:
+                Logger.logPrint(f'Save {save.name} of {storage.path} is incomplete, not indexed: {e}', 'debug')
+                continue
+
+            sha256 = catalog.find_hash(storage.path, chunks_names, size)
+            if sha256 is None:
+                digest = hashlib.sha256()
+                for block in save.iter_steam_blocks(storage):
+                    digest.update(block)
+                sha256 = digest.hexdigest()
+
+            yield (save.name, save.get_base_name(), save.get_iso_date(), MICROSOFT, storage.path,
+                   json.dumps(chunks_names), size, mtime_ns, sha256)
+    return index
+
+
+def steam_indexer(folder: str, file_name: str, mtime_ns: int):
+    """Return the function indexing a Steam save file."""
+    def index(catalog: AstroSaveCatalog) -> Iterator[Tuple]:
+        path = utils.join_paths(folder, file_name)
+        save = AstroSave(file_name[:file_name.rindex('.savegame')], [])
+        compression = AstroCompression.get_file_compression(file_name)
+        if compression:
+            blocks = AstroCompression.read_blocks_decompressed(path, compression)
+        else:
+            blocks = utils.read_file_blocks(path)
+        digest = hashlib.sha256()
+        size = 0
+        for block in blocks:
+            digest.update(block)
+            size += len(block)
+        yield (save.name, save.get_base_name(), save.get_iso_date(), STEAM, folder,
+               json.dumps([]), size, mtime_ns, digest.hexdigest())
+    return index
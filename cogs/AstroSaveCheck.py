@@ -0,0 +1,172 @@
+"""Integrity check of Microsoft save folders from file metadata only.
+
+The containers of every save folder are parsed and each chunk they reference
+is checked against the sizes listed by ``os.scandir``: a chunk may be missing,
+or truncated when a chunk other than the last one of a save isn't exactly
+``XBOX_CHUNK_SIZE`` bytes. Chunk files referenced by no container are
+reported as orphaned. The content of the chunks is never read, and the save
+folders are checked concurrently.
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+from cogs import AstroLogging as Logger
+from cogs import AstroMetrics
+from cogs.AstroSave import XBOX_CHUNK_SIZE
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+from cogs.AstroSaveContainer import CHUNK_METADATA_SIZE, CONTAINER_HEADER_SIZE
+from cogs.AstroExportJournal import AstroExportJournal
+
+CHUNK_FILE_NAME = re.compile(r'^[0-9A-F]{32}$')
+
+
+class AstroFolderReport:
+    """Problems found in a save folder."""
+
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        self.save_count = 0
+        self.missing: List[Tuple[str, str]] = []  # (save name, chunk name)
+        self.truncated: List[Tuple[str, str, int]] = []  # (save name, chunk name, size)
+        self.orphaned: List[Tuple[str, int]] = []  # (chunk name, size)
+        self.pending: List[str] = []  # Chunks of an interrupted export, see ``AstroExportJournal``
+        self.errors: List[str] = []
+
+    def is_healthy(self) -> bool:
+        """Return ``True`` if nothing is missing, truncated or orphaned."""
+        return not (self.missing or self.truncated or self.orphaned or self.errors)
+
+    def get_orphaned_size(self) -> int:
+        """Return the number of bytes used by the orphaned chunks."""
+        return sum(size for _, size in self.orphaned)
+
+
+def list_file_sizes(folder: str) -> Tuple[Dict[str, int], List[str]]:
+    """List the files of ``folder`` with one ``scandir`` call.
+
+    Returns:
+        The size of every file by name, and the paths of the sub-folders.
+    """
+    sizes = {}
+    sub_folders = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                sub_folders.append(entry.path)
+            elif entry.is_file():
+                sizes[entry.name] = entry.stat().st_size
+    return sizes, sub_folders
+
+
+def find_save_folders(roots: List[str]) -> Iterator[Tuple[str, Dict[str, int]]]:
+    """Find the folders holding a container under ``roots``.
+
+    Yields:
+        Every save folder with the size of its files.
+    """
+    folders = list(roots)
+    while folders:
+        folder = folders.pop()
+        try:
+            sizes, sub_folders = list_file_sizes(folder)
+        except OSError as e:
+            Logger.logPrint(f'Unable to list {folder}: {e}', 'warning')
+            continue
+        if any(name.startswith('container.') for name in sizes):
+            yield folder, sizes
+        folders.extend(sorted(sub_folders, reverse=True))
+
+
+def check_save_folder(folder: str, sizes: Dict[str, int] = None) -> AstroFolderReport:
+    """Check the chunks referenced by the containers of ``folder``.
+
+    Args:
+        folder: Microsoft save folder.
+        sizes: Size of every file of ``folder``, listed if ``None``.
+
+    Returns:
+        AstroFolderReport: The problems found.
+    """
+    report = AstroFolderReport(folder)
+    if sizes is None:
+        sizes, _ = list_file_sizes(folder)
+
+    referenced = set()
+    for container_name in sorted(name for name in sizes if name.startswith('container.')):
+        try:
+            container = Container(os.path.join(folder, container_name))
+        except Exception as e:
+            report.errors.append(f'{container_name}: {e}')
+            continue
+
+        for save in container.save_list:
+            report.save_count += 1
+            last_index = save.chunk_count - 1
+            for index, chunk_name in enumerate(save.chunks_names):
+                referenced.add(chunk_name)
+                size = sizes.get(chunk_name)
+                if size is None:
+                    report.missing.append((save.name, chunk_name))
+                elif size > XBOX_CHUNK_SIZE or (index < last_index and size != XBOX_CHUNK_SIZE):
+                    report.truncated.append((save.name, chunk_name, size))
+
+    pending = set()
+    for entry in AstroExportJournal(folder).saves.values():
+        pending.update(entry['chunks'])
+
+    for name, size in sorted(sizes.items()):
+        if name in referenced or not CHUNK_FILE_NAME.match(name):
+            continue
+        if name in pending:
+            report.pending.append(name)
+        else:
+            report.orphaned.append((name, size))
+    return report
+
+
+def check_save_folders(roots: List[str], workers: int = 8) -> List[AstroFolderReport]:
+    """Check every save folder found under ``roots`` concurrently.
+
+    The whole check is recorded as one ``AstroMetrics.SCAN``, sized by the
+    containers read.
+
+    Args:
+        roots: Save folders, or folders to search for save folders.
+        workers: Number of folders checked at the same time.
+
+    Returns:
+        List[AstroFolderReport]: One report per save folder.
+    """
+    with AstroMetrics.measure(AstroMetrics.SCAN, name=', '.join(roots)) as metrics:
+        with metrics.phase('list'):
+            save_folders = list(find_save_folders(roots))
+        container_sizes = [size for _, sizes in save_folders for name, size in sizes.items()
+                           if name.startswith('container.')]
+        metrics.size = sum(container_sizes)
+        metrics.chunk_count = sum(max(0, size - CONTAINER_HEADER_SIZE) // CHUNK_METADATA_SIZE
+                                  for size in container_sizes)
+        with metrics.phase('check'), ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda folder: check_save_folder(*folder), save_folders))
+
+
+def log_reports(reports: List[AstroFolderReport]) -> None:
+    """Log the problems found by ``check_save_folders``."""
+    for report in reports:
+        state = 'OK' if report.is_healthy() else 'PROBLEMS FOUND'
+        Logger.logPrint(f'{report.folder}: {report.save_count} save(s), {state}')
+        for save_name, chunk_name in report.missing:
+            Logger.logPrint(f'  missing chunk   {chunk_name} of {save_name}')
+        for save_name, chunk_name, size in report.truncated:
+            Logger.logPrint(f'  truncated chunk {chunk_name} of {save_name} ({size} bytes)')
+        for chunk_name, size in report.orphaned:
+            Logger.logPrint(f'  orphaned chunk  {chunk_name} ({size} bytes)')
+        for chunk_name in report.pending:
+            Logger.logPrint(f'  chunk {chunk_name} of an interrupted export, see --resume')
+        for error in report.errors:
+            Logger.logPrint(f'  unreadable container {error}')
+
+    unhealthy = sum(not report.is_healthy() for report in reports)
+    Logger.logPrint(f'{len(reports)} save folder(s) checked, {unhealthy} with problems')
@@ -0,0 +1,168 @@
+"""Reclaim the space wasted by orphaned chunks and dead container records.
+
+Interrupted exports and deleted saves leave chunk files that no container
+references, and a container can keep the records of a save whose chunks are
+gone. Compacting a save folder rewrites its containers without the records of
+such saves, in one streaming pass followed by an atomic replace, then removes
+every chunk file that is no longer referenced.
+"""
+
+import os
+import tempfile
+from typing import Dict, List, Tuple
+
+import utils
+from cogs import AstroLogging as Logger
+from cogs import AstroSaveCheck
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+from cogs.AstroSaveContainer import CHUNK_METADATA_SIZE, CONTAINER_HEADER_SIZE
+
+
+class AstroCompactionResult:
+    """Space reclaimed, or to reclaim, in a save folder."""
+
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        self.dead_saves: List[Tuple[str, str]] = []  # (container name, save name)
+        self.dead_records: Dict[str, int] = {}  # Number of records to drop, by container name
+        self.removed_chunks: List[str] = []
+        self.reclaimed_bytes = 0
+
+
+def get_record_chunk_name(record: bytes) -> str:
+    """Return the name of the chunk file referenced by a container record."""
+    return Container.extract_chunk_id_from_chunk(record).hex().upper()
+
+
+def rewrite_container(path: str, dead_records: Dict[int, str]) -> int:
+    """Rewrite a container without some of its records.
+
+    The records are streamed to a temporary file which then replaces the
+    container, so the container is never partially written.
+
+    Args:
+        path: Container to rewrite.
+        dead_records: Chunk name referenced by every record to drop, by
+            record index.
+
+    Returns:
+        int: Number of records dropped.
+
+    Raises:
+        ValueError: If the container is truncated, or a record to drop
+            doesn't reference the expected chunk anymore.
+    """
+    temp_fd, temp_path = tempfile.mkstemp(prefix='.astrosaveconverter-', suffix='.tmp',
+                                          dir=utils.get_dir_name(path) or None)
+    try:
+        with open(path, 'rb') as container, os.fdopen(temp_fd, 'wb') as temp_file:
+            header = bytearray(container.read(CONTAINER_HEADER_SIZE))
+            record_count = int.from_bytes(header[4:8], byteorder='little')
+            temp_file.write(header)
+
+            kept = 0
+            for index in range(record_count):
+                record = container.read(CHUNK_METADATA_SIZE)
+                if len(record) < CHUNK_METADATA_SIZE:
+                    raise ValueError(f'{path} is truncated at record {index} of {record_count}')
+                if index not in dead_records:
+                    temp_file.write(record)
+                    kept += 1
+                elif get_record_chunk_name(record) != dead_records[index]:
+                    raise ValueError(f'{path} changed since it was checked')
+            # Anything after the records is kept as it is
+            temp_file.write(container.read())
+
+            temp_file.seek(4)
+            temp_file.write(kept.to_bytes(4, byteorder='little'))
+            utils.sync_file(temp_file)
+        utils.set_replacement_mode(temp_path, path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return record_count - kept
+
+
+def compact_save_folder(folder: str, dry_run: bool = True) -> AstroCompactionResult:
+    """Drop the dead saves of ``folder`` and remove its unreferenced chunks.
+
+    A save with a missing chunk can't be loaded anymore: its records are
+    dropped from its container and its remaining chunks removed, unless a
+    save of the folder still references them. Saves with
+    a truncated chunk are left as they are, and so are the chunks of an
+    interrupted export, which can still be resumed.
+
+    Args:
+        folder: Microsoft save folder.
+        dry_run: Only compute what would be reclaimed.
+
+    Returns:
+        AstroCompactionResult: What was, or would be, reclaimed.
+    """
+    result = AstroCompactionResult(folder)
+    sizes, _ = AstroSaveCheck.list_file_sizes(folder)
+    report = AstroSaveCheck.check_save_folder(folder, sizes)
+    if report.errors:
+        raise ValueError(f'Unreadable container in {folder}: {", ".join(report.errors)}')
+
+    # A save is dead in its own container only, another copy of it may be healthy
+    dead_records: Dict[str, Dict[int, str]] = {}
+    dead_chunks = set()
+    live_chunks = set()
+    for container_name in sorted(name for name in sizes if name.startswith('container.')):
+        container = Container(utils.join_paths(folder, container_name))
+        for save, (_, first_record, _) in zip(container.save_list, container.record_offsets):
+            chunks_names = save.chunks_names
+            if all(chunk_name in sizes for chunk_name in chunks_names):
+                live_chunks.update(chunks_names)
+                continue
+            result.dead_saves.append((container_name, save.name))
+            dead_chunks.update(chunks_names)
+            dead_records.setdefault(container_name, {}).update(enumerate(chunks_names, first_record))
+
+    for container_name, records in dead_records.items():
+        result.dead_records[container_name] = len(records)
+        result.reclaimed_bytes += len(records) * CHUNK_METADATA_SIZE
+    result.removed_chunks = sorted([name for name in dead_chunks - live_chunks if name in sizes]
+                                   + [name for name, _ in report.orphaned])
+    result.reclaimed_bytes += sum(sizes[name] for name in result.removed_chunks)
+    if dry_run:
+        return result
+
+    # Containers first, so that they never reference a removed chunk
+    for container_name, records in dead_records.items():
+        rewrite_container(utils.join_paths(folder, container_name), records)
+    for chunk_name in result.removed_chunks:
+        os.remove(utils.join_paths(folder, chunk_name))
+    return result
+
+
+def compact_save_folders(roots: List[str], dry_run: bool = True) -> List[AstroCompactionResult]:
+    """Compact every save folder found under ``roots`` and log the space reclaimed.
+
+    Args:
+        roots: Save folders, or folders to search for save folders.
+        dry_run: Only log what would be reclaimed.
+
+    Returns:
+        List[AstroCompactionResult]: One result per save folder.
+    """
+    results = []
+    for folder, _ in AstroSaveCheck.find_save_folders(roots):
+        result = compact_save_folder(folder, dry_run)
+        results.append(result)
+        if result.dead_saves or result.removed_chunks:
+            Logger.logPrint(f'{folder}: {len(result.dead_saves)} dead save(s), '
+                            f'{sum(result.dead_records.values())} container record(s), '
+                            f'{len(result.removed_chunks)} chunk file(s)')
+            for container_name, save_name in result.dead_saves:
+                Logger.logPrint(f'  dead save {save_name} in {container_name}')
+
+    reclaimed = sum(result.reclaimed_bytes for result in results) / 1024 / 1024
+    if dry_run:
+        Logger.logPrint(f'{reclaimed:.2f} MB can be reclaimed in {len(results)} save folder(s), '
+                        f'run again with --apply to reclaim them')
+    else:
+        Logger.logPrint(f'{reclaimed:.2f} MB reclaimed in {len(results)} save folder(s)')
+    return results
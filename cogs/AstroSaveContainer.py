@@ -1,31 +1,42 @@
 """Parsing and handling of Astroneer save container files."""
 
-import os
-import hexdump
-import re
+from contextlib import closing
+from typing import Iterator, List, Optional, Tuple
 
-from utils import is_a_file, list_folder_content, join_paths
+from utils import is_a_file, join_paths
 
-from cogs.AstroSave import AstroSave
+from cogs.AstroSave import AstroSave, CHUNK_ID_SIZE
 from cogs import AstroLogging as Logger
+from cogs import AstroSaveStorage
 
 CHUNK_METADATA_SIZE = 160  # Length of a chunk metadata found in a save container
+CONTAINER_HEADER_SIZE = 8  # Header and record count
+SCAN_BLOCK_RECORDS = 64  # Records read at once when looking for a save
 
 
 class AstroSaveContainer:
-    """Represent an Astroneer save container and its contents."""
+    """Represent an Astroneer save container and its contents.
+
+    Only the header is read when the container is created. ``save_list``
+    parses every record at once and keeps the UUIDs of every chunk in a single
+    buffer, ``chunk_ids``, shared by the saves, see ``AstroSave``. The lazy
+    ``iter_saves``, ``get_save`` and ``find_save`` only read the records they
+    need, and fill ``record_offsets`` as they go.
+    """
+
+    __slots__ = ('full_path', 'header', 'chunk_count', 'record_offsets', '__saves', '__chunk_ids',
+                 '__records_end', '__scanned_records')
 
     def __init__(self, container_file_path: str) -> None:
-        """Load saves from a container file.
+        """Read the header of a container file.
 
         Args:
             container_file_path: Path to the container file.
         """
         self.full_path = container_file_path
-        self.save_list = []
         Logger.logPrint(f'full_path: {self.full_path}', "debug")
 
-        with open(self.full_path, "rb") as container:
+        with AstroSaveStorage.open_save_file(self.full_path) as container:
             # The Astroneer file type is contained in at least the first 2 bytes of the file
             self.header = container.read(2)
 
@@ -39,31 +50,219 @@ class AstroSaveContainer:
             self.chunk_count = int.from_bytes(
                 container.read(4), byteorder='little')
 
-            # Parsing saves chunks
-            current_save_name = None
-            for _ in range(self.chunk_count):
-                current_chunk = container.read(CHUNK_METADATA_SIZE)
-                current_chunk_name = self.extract_name_from_chunk(
-                    current_chunk)
-                Logger.logPrint(f'Save: {current_chunk_name}', "debug")
+        # (save name, index of its first record, record count) of the saves found so far
+        self.record_offsets: List[Tuple[str, int, int]] = []
+        self.__scanned_records = 0
+        self.__records_end = self.chunk_count  # Lowered if the container is truncated
+        self.__saves: Optional[List[AstroSave]] = None
+        self.__chunk_ids = b''
+
+    @property
+    def save_list(self) -> List[AstroSave]:
+        """Every save of the container, parsed on first access."""
+        if self.__saves is None:
+            self.__parse_all_records()
+        return self.__saves
+
+    @property
+    def chunk_ids(self) -> bytes:
+        """Raw UUIDs of every chunk of the container, shared by the saves of ``save_list``."""
+        if self.__saves is None:
+            self.__parse_all_records()
+        return self.__chunk_ids
+
+    def __parse_all_records(self) -> None:
+        records = self.read_records(0, self.chunk_count)
+        chunk_ids = bytearray()
+        offsets = []
+        for save_name, first_record, record_ids in self.group_records(records, 0):
+            offsets.append((save_name, first_record, len(record_ids) // CHUNK_ID_SIZE, len(chunk_ids)))
+            chunk_ids += record_ids
+
+        self.__chunk_ids = bytes(chunk_ids)
+        self.__saves = []
+        for save_name, first_record, record_count, start in offsets:
+            Logger.logPrint(f'Save: {save_name} ({record_count} chunks)', "debug")
+            self.__saves.append(AstroSave(save_name, chunk_ids=self.__chunk_ids, start=start,
+                                          end=start + record_count * CHUNK_ID_SIZE))
+        self.record_offsets = [offset[:3] for offset in offsets]
+        self.__records_end = self.__scanned_records = len(records) // CHUNK_METADATA_SIZE
+
+    def read_records(self, first_record: int, count: int) -> bytes:
+        """Read ``count`` records from the record at index ``first_record``, fewer if the container is truncated."""
+        with AstroSaveStorage.open_save_file(self.full_path) as container:
+            container.seek(CONTAINER_HEADER_SIZE + first_record * CHUNK_METADATA_SIZE)
+            records = container.read(count * CHUNK_METADATA_SIZE)
+        return records[:len(records) - len(records) % CHUNK_METADATA_SIZE]
+
+    def group_records(self, records: bytes, first_record: int, offset: int = 0,
+                      count: Optional[int] = None) -> Iterator[Tuple[str, int, bytes]]:
+        """Group consecutive records sharing a save name.
 
-                if current_chunk_name != current_save_name:
-                    if current_save_name != None:
-                        # Parsing a new save, storing the current save
-                        self.save_list.append(AstroSave(current_save_name,
-                                                        current_chunks_names))
-
-                    current_chunks_names = []
-                    current_save_name = current_chunk_name
+        Args:
+            records: Consecutive records, or any buffer whose slices are
+                ``bytes`` such as a memory-mapped container.
+            first_record: Index of the first of ``records`` in the container.
+            offset: Position of the first record in ``records``.
+            count: Number of records to group, every record after ``offset``
+                by default.
+
+        Yields:
+            The name, index of the first record and chunk UUIDs of every save.
+        """
+        if count is None:
+            count = (len(records) - offset) // CHUNK_METADATA_SIZE
+        current_save_name = None
+        current_first = first_record
+        current_ids = bytearray()
+        for index, position in enumerate(range(offset, offset + count * CHUNK_METADATA_SIZE, CHUNK_METADATA_SIZE),
+                                         first_record):
+            current_chunk = records[position:position + CHUNK_METADATA_SIZE]
+            current_chunk_name = self.extract_name_from_chunk(current_chunk)
+            if current_chunk_name != current_save_name:
+                if current_save_name is not None:
+                    yield current_save_name, current_first, bytes(current_ids)
+                current_save_name, current_first, current_ids = current_chunk_name, index, bytearray()
+            current_ids += self.extract_chunk_id_from_chunk(current_chunk)
+        if current_save_name is not None:
+            yield current_save_name, current_first, bytes(current_ids)
+
+    def iter_saves(self, block_records: int = 1024) -> Iterator[AstroSave]:
+        """Yield the saves of the container as their records are read.
 
-                chunk_file_name = self.extract_chunk_file_name_from_chunk(current_chunk)
-                Logger.logPrint(f'Processed chunk: {chunk_file_name}', "debug")
+        Args:
+            block_records: Number of records read at once.
+        """
+        if self.__saves is not None:
+            yield from self.__saves
+            return
+
+        index = 0
+        # Save whose records may go on in the next block, each block is grouped only once
+        pending_name, pending_first, pending_ids = None, 0, bytearray()
+        next_record = 0
+        while next_record < self.__records_end:
+            records = self.read_records(next_record, min(block_records, self.__records_end - next_record))
+            if not records:
+                self.__records_end = next_record
+                break
+            groups = self.group_records(records, next_record)
+            next_record += len(records) // CHUNK_METADATA_SIZE
+
+            for save_name, first_record, chunk_ids in groups:
+                if save_name != pending_name:
+                    if pending_name is not None:
+                        yield self.__found_save(index, pending_name, pending_first, bytes(pending_ids))
+                        index += 1
+                    pending_name, pending_first, pending_ids = save_name, first_record, bytearray()
+                pending_ids += chunk_ids
+
+        if pending_name is not None:
+            yield self.__found_save(index, pending_name, pending_first, bytes(pending_ids))
+
+    def __found_save(self, index: int, save_name: str, first_record: int, chunk_ids: bytes) -> AstroSave:
+        """Add a save found by ``iter_saves`` to the record offset table and return it."""
+        record_count = len(chunk_ids) // CHUNK_ID_SIZE
+        if index == len(self.record_offsets):
+            self.record_offsets.append((save_name, first_record, record_count))
+            self.__scanned_records = first_record + record_count
+        return AstroSave(save_name, chunk_ids=chunk_ids)
+
+    def __scan_saves(self) -> Iterator[int]:
+        """Add the next saves to ``record_offsets``, decoding as few records as possible.
+
+        The records of a multi-chunk save tell how many chunks it has: when the
+        last record of the save and the first of the next one agree with it,
+        the records in between are not decoded, nor read for large saves.
+
+        Yields:
+            The index of every save added to the table.
+        """
+        block_first, block = 0, b''
+
+        def read_record(container, index: int, block_records: int = SCAN_BLOCK_RECORDS) -> Optional[bytes]:
+            nonlocal block_first, block
+            if index >= self.__records_end:
+                return None
+            if not block_first <= index < block_first + len(block) // CHUNK_METADATA_SIZE:
+                container.seek(CONTAINER_HEADER_SIZE + index * CHUNK_METADATA_SIZE)
+                block = container.read(block_records * CHUNK_METADATA_SIZE)
+                block = block[:len(block) - len(block) % CHUNK_METADATA_SIZE]
+                block_first = index
+                if not block:
+                    self.__records_end = index
+                    return None
+            offset = (index - block_first) * CHUNK_METADATA_SIZE
+            return block[offset:offset + CHUNK_METADATA_SIZE]
+
+        with AstroSaveStorage.open_save_file(self.full_path) as container:
+            while True:
+                first_record = self.__scanned_records
+                record = read_record(container, first_record)
+                if record is None:
+                    return
+                save_name = self.extract_name_from_chunk(record)
+
+                record_count = None
+                position = self.extract_chunk_position_from_chunk(record)
+                if position and position[0] == 0 and position[1] > 1:
+                    # Reading the last record along with the first of the next save
+                    last_record = read_record(container, first_record + position[1] - 1, 2)
+                    next_record = read_record(container, first_record + position[1])
+                    if (last_record is not None and self.extract_name_from_chunk(last_record) == save_name
+                            and (next_record is None or self.extract_name_from_chunk(next_record) != save_name)):
+                        record_count = position[1]
+                if record_count is None:
+                    # No usable chunk count, decoding the records until the name changes
+                    record_count = 1
+                    while True:
+                        record = read_record(container, first_record + record_count)
+                        if record is None or self.extract_name_from_chunk(record) != save_name:
+                            break
+                        record_count += 1
+
+                self.record_offsets.append((save_name, first_record, record_count))
+                self.__scanned_records = first_record + record_count
+                yield len(self.record_offsets) - 1
+
+    def __load_save(self, index: int) -> AstroSave:
+        if self.__saves is not None:
+            return self.__saves[index]
+        save_name, first_record, record_count = self.record_offsets[index]
+        records = self.read_records(first_record, record_count)
+        chunk_ids = b''.join(self.extract_chunk_id_from_chunk(records[offset:offset + CHUNK_METADATA_SIZE])
+                             for offset in range(0, len(records), CHUNK_METADATA_SIZE))
+        return AstroSave(save_name, chunk_ids=chunk_ids)
+
+    def get_save(self, index: int) -> AstroSave:
+        """Return the save at ``index``, reading only the records needed to find it.
 
-                current_chunks_names.append(chunk_file_name)
+        Raises:
+            IndexError: If the container has no such save.
+        """
+        if index >= len(self.record_offsets):
+            with closing(self.__scan_saves()) as scanned_saves:
+                for scanned_index in scanned_saves:
+                    if scanned_index == index:
+                        break
+        if index >= len(self.record_offsets):
+            raise IndexError(f'{self.full_path} has no save {index}')
+        return self.__load_save(index)
+
+    def find_save(self, save_name: str) -> AstroSave:
+        """Return the save named ``save_name``, reading only the records needed to find it.
 
-            # Saving the last save of the container file
-            self.save_list.append(AstroSave(current_save_name,
-                                            current_chunks_names))
+        Raises:
+            KeyError: If the container has no such save.
+        """
+        for index, (name, _, _) in enumerate(self.record_offsets):
+            if name == save_name:
+                return self.__load_save(index)
+        with closing(self.__scan_saves()) as scanned_saves:
+            for index in scanned_saves:
+                if self.record_offsets[index][0] == save_name:
+                    return self.__load_save(index)
+        raise KeyError(f'Save {save_name} not found in {self.full_path}')
 
     def is_valid_container_header(self, header: bytes) -> bool:
         """Validate a container file header."""
@@ -85,64 +284,45 @@ class AstroSaveContainer:
 
         # The seperator is either '$$' in case of multi-chunk save
         # or '\x00' if only one chunk
-        return re.split('[$]{2}|[\\x00]', utf_16_encoded_text)[0]
+        return utf_16_encoded_text.split('\x00', 1)[0].split('$$', 1)[0]
 
-    def extract_chunk_file_name_from_chunk(self, chunk: bytes) -> str:
-        """Extract the filename associated with a chunk.
+    def extract_chunk_position_from_chunk(self, chunk: bytes) -> Optional[Tuple[int, int]]:
+        """Return the index of a chunk in its save and the chunk count of the save.
 
-        Args:
-            chunk: Chunk to inspect.
+        The name of the chunks of a multi-chunk save ends with
+        ``$$<index>$<count>$1``.
 
         Returns:
-            str: Filename derived from the chunk metadata.
+            The index and the count, ``None`` for a single-chunk save.
         """
-        chunk_file_name = ''
-        partial_name = ''
-        i = CHUNK_METADATA_SIZE - 16
-
-        (partial_name, i) = self.chunk_grab_bytes_to_string(chunk, i, 4)
-        chunk_file_name = self.convert_chunk_name_to_file_name(partial_name)
-
-        (partial_name, i) = self.chunk_grab_bytes_to_string(chunk, i, 2)
-        chunk_file_name += self.convert_chunk_name_to_file_name(partial_name)
+        text = chunk[0:CHUNK_METADATA_SIZE - 32].decode('utf-16le', errors='ignore').split('\x00', 1)[0]
+        if '$$' not in text:
+            return None
+        fields = text.split('$$', 1)[1].split('$')
+        if len(fields) < 2 or not (fields[0].isdigit() and fields[1].isdigit()):
+            return None
+        return int(fields[0]), int(fields[1])
 
-        (partial_name, i) = self.chunk_grab_bytes_to_string(chunk, i, 2)
-        chunk_file_name += self.convert_chunk_name_to_file_name(partial_name)
-
-        (partial_name, i) = self.chunk_grab_bytes_to_string(chunk, i, 8)
-        chunk_file_name += self.string_to_hex(partial_name)
+    @staticmethod
+    def extract_chunk_id_from_chunk(chunk: bytes) -> bytes:
+        """Return the raw UUID of the file of a chunk.
 
-        return chunk_file_name
+        The last 16 bytes of a chunk are the UUID in little-endian fields, the
+        chunk file is named after the big-endian form.
+        """
+        uuid_le = chunk[CHUNK_METADATA_SIZE - CHUNK_ID_SIZE:CHUNK_METADATA_SIZE]
+        return uuid_le[3::-1] + uuid_le[5:3:-1] + uuid_le[7:5:-1] + uuid_le[8:]
 
-    def chunk_grab_bytes_to_string(self, chunk: bytes, index: int, n: int):
-        """Read ``n`` bytes from ``chunk`` starting at ``index``.
+    def extract_chunk_file_name_from_chunk(self, chunk: bytes) -> str:
+        """Extract the filename associated with a chunk.
 
         Args:
-            chunk: Source bytes.
-            index: Starting index.
-            n: Number of bytes to read.
+            chunk: Chunk to inspect.
 
         Returns:
-            tuple[str, int]: Extracted string and new index position.
+            str: Filename derived from the chunk metadata.
         """
-        extracted_string = ''
-        for _ in range(n):
-            extracted_string += chr(chunk[index])
-            index += 1
-
-        return (extracted_string, index)
-
-    def reverse_string(self, string: str) -> str:
-        """Return ``string`` reversed."""
-        return string[::-1]
-
-    def convert_chunk_name_to_file_name(self, string: str) -> str:
-        """Convert a chunk's display name to its filename."""
-        return self.string_to_hex(self.reverse_string(string))
-
-    def string_to_hex(self, string: str) -> str:
-        """Convert ``string`` to uppercase hexadecimal using Latin-1 encoding."""
-        return string.encode('latin1').hex().upper()
+        return self.extract_chunk_id_from_chunk(chunk).hex().upper()
 
     @staticmethod
 
@@ -150,7 +330,8 @@ class AstroSaveContainer:
         """Return container filenames found in a directory.
 
         Args:
-            path: Directory to search for ``container.*`` files.
+            path: Directory to search for ``container.*`` files, which may be
+                inside a zip or tar archive.
 
         Returns:
             List of container filenames located in ``path``.
@@ -158,9 +339,8 @@ class AstroSaveContainer:
         Raises:
             FileNotFoundError: If no ``container.*`` files are found.
         """
-        folder_content = list_folder_content(path)
-        containers_list = [
-            file for file in folder_content if AstroSaveContainer.is_a_container_file(join_paths(path, file))]
+        folder_content = AstroSaveStorage.open_storage(path).list_files()
+        containers_list = [file for file in folder_content if file.rfind('container') != -1]
 
         if not containers_list or len(containers_list) == 0:
             raise FileNotFoundError
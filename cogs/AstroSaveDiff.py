@@ -0,0 +1,256 @@
+"""Record-level comparison of two snapshots of a Microsoft save folder.
+
+Two backups, or a backup and the live folder, are compared from the record
+tables of their containers only: the containers of regular folders are
+memory-mapped and no chunk is read. Saves are reported as added, removed,
+renamed (same chunks under another name) or changed (other chunks, e.g.
+saved again by the game under a new date). When asked, the chunk files that
+both sides of a changed or renamed save reference are then compared by size
+and modification time, or content, so that a diff of two large folders only
+reads a few kilobytes in the common case.
+"""
+
+import mmap
+import os
+from typing import Dict, List, Optional
+
+import utils
+from cogs import AstroSaveStorage
+from cogs.AstroSave import AstroSave
+from cogs.AstroSaveContainer import AstroSaveContainer as Container, CONTAINER_HEADER_SIZE, CHUNK_METADATA_SIZE
+from cogs.AstroSaveRestore import MTIME_TOLERANCE_NS, get_file_sha256
+
+ADDED = 'added'
+REMOVED = 'removed'
+RENAMED = 'renamed'
+CHANGED = 'changed'
+
+SYMBOLS = {ADDED: '+', REMOVED: '-', RENAMED: '>', CHANGED: '~'}
+
+
+class AstroSaveSnapshot:
+    """Saves of a save folder or container, read from the record tables only."""
+
+    def __init__(self, path: str) -> None:
+        """Read the record tables of a snapshot.
+
+        Args:
+            path: Container file, or Microsoft save folder which may be
+                inside a backup archive.
+
+        Raises:
+            FileNotFoundError: If the path holds no container.
+        """
+        self.path = path
+        if 'container' in os.path.basename(path) and utils.is_a_file(path):
+            self.storage = AstroSaveStorage.open_storage(utils.get_dir_name(path))
+            container_names = [os.path.basename(path)]
+        else:
+            self.storage = AstroSaveStorage.open_storage(path)
+            try:
+                container_names = Container.get_containers_list(self.storage)
+            except FileNotFoundError:
+                raise FileNotFoundError(f'No container found in {path}')
+
+        # Like select_saves, the last container holding a save wins
+        self.saves: Dict[str, AstroSave] = {}
+        self.table_size = 0
+        for container_name in container_names:
+            for save in self.read_record_table(container_name):
+                self.saves[save.name] = save
+
+    def read_record_table(self, container_name: str) -> List[AstroSave]:
+        """Return the saves of a container of the snapshot."""
+        container = Container(utils.join_paths(self.storage.path, container_name))
+        if not isinstance(self.storage, AstroSaveStorage.FolderStorage):
+            # Archive members can't be mapped, their record table is read instead
+            with self.storage.open(container_name) as container_file:
+                records = container_file.read()
+            return self.group_saves(container, records)
+
+        with open(container.full_path, 'rb') as container_file:
+            if os.fstat(container_file.fileno()).st_size <= CONTAINER_HEADER_SIZE:
+                return []
+            with mmap.mmap(container_file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+                return self.group_saves(container, records)
+
+    def group_saves(self, container: Container, records) -> List[AstroSave]:
+        """Group the records of a whole container file into saves."""
+        count = min(container.chunk_count, (len(records) - CONTAINER_HEADER_SIZE) // CHUNK_METADATA_SIZE)
+        self.table_size += count * CHUNK_METADATA_SIZE
+        return [AstroSave(save_name, chunk_ids=chunk_ids)
+                for save_name, _, chunk_ids in container.group_records(records, 0, CONTAINER_HEADER_SIZE, count)]
+
+
+class AstroSaveDifference:
+    """Difference of one save between two snapshots."""
+
+    def __init__(self, kind: str, name: str, old_name: Optional[str] = None,
+                 added_chunks: List[str] = (), removed_chunks: List[str] = ()) -> None:
+        """Describe a difference.
+
+        Args:
+            kind: ``ADDED``, ``REMOVED``, ``RENAMED`` or ``CHANGED``.
+            name: Name of the save in the new snapshot, or in the old one
+                for a removed save.
+            old_name: Previous name of a renamed save, or of a changed save
+                saved under a new date.
+            added_chunks: Chunks only referenced by the new save.
+            removed_chunks: Chunks only referenced by the old save.
+        """
+        self.kind = kind
+        self.name = name
+        self.old_name = old_name
+        self.added_chunks = list(added_chunks)
+        self.removed_chunks = list(removed_chunks)
+        self.shared_chunks: List[str] = []
+        self.modified_chunks: List[str] = []  # Shared chunks whose file differs
+
+    def to_dict(self) -> dict:
+        """Return the difference as a JSON-serializable dictionary."""
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'old_name': self.old_name,
+            'added_chunks': self.added_chunks,
+            'removed_chunks': self.removed_chunks,
+            'modified_chunks': self.modified_chunks,
+        }
+
+    def format(self) -> str:
+        """Return the difference as a text line."""
+        name = f'{self.old_name} -> {self.name}' if self.old_name else self.name
+        details = []
+        if self.added_chunks or self.removed_chunks:
+            details.append(f'+{len(self.added_chunks)} -{len(self.removed_chunks)} chunk(s)')
+        if self.modified_chunks:
+            details.append(f'{len(self.modified_chunks)} chunk file(s) modified')
+        return f"{SYMBOLS[self.kind]} {name}" + (f"  ({', '.join(details)})" if details else '')
+
+
+class AstroSaveDiff:
+    """Differences between two snapshots."""
+
+    def __init__(self, old: AstroSaveSnapshot, new: AstroSaveSnapshot) -> None:
+        self.old = old
+        self.new = new
+        self.differences: List[AstroSaveDifference] = []
+        self.unchanged: List[str] = []
+        self.compared_bytes = 0  # Bytes of chunk files read to compare their content
+
+    def has_differences(self) -> bool:
+        """Return ``True`` if the snapshots hold different saves."""
+        return bool(self.differences)
+
+    def to_dict(self) -> dict:
+        """Return the diff as a JSON-serializable dictionary."""
+        return {
+            'old': self.old.path,
+            'new': self.new.path,
+            'unchanged': len(self.unchanged),
+            'differences': [difference.to_dict() for difference in self.differences],
+            'record_bytes': self.old.table_size + self.new.table_size,
+            'compared_bytes': self.compared_bytes,
+        }
+
+    def format(self) -> List[str]:
+        """Return the diff as text lines."""
+        lines = [difference.format() for difference in self.differences]
+        lines.append(f'{len(self.differences)} difference(s), {len(self.unchanged)} save(s) unchanged')
+        return lines
+
+
+def compare_chunks(old: AstroSave, new: AstroSave, kind: str) -> AstroSaveDifference:
+    """Compare the chunk sets of two versions of a save."""
+    old_chunks, new_chunks = old.chunks_names, new.chunks_names
+    old_set, new_set = set(old_chunks), set(new_chunks)
+    difference = AstroSaveDifference(kind, new.name, old.name if old.name != new.name else None,
+                                     [chunk for chunk in new_chunks if chunk not in old_set],
+                                     [chunk for chunk in old_chunks if chunk not in new_set])
+    difference.shared_chunks = [chunk for chunk in new_chunks if chunk in old_set]
+    return difference
+
+
+def is_chunk_unchanged(diff: AstroSaveDiff, chunk_name: str, compare_content: bool) -> bool:
+    """Return ``True`` if both snapshots hold the same chunk file.
+
+    Args:
+        diff: Diff of the snapshots.
+        chunk_name: Name of the chunk file.
+        compare_content: Compare the content of files of the same size
+            instead of their modification time.
+    """
+    old, new = diff.old.storage, diff.new.storage
+    try:
+        size = old.get_size(chunk_name)
+        if size != new.get_size(chunk_name):
+            return False
+        if not compare_content:
+            return abs(old.get_mtime_ns(chunk_name) - new.get_mtime_ns(chunk_name)) < MTIME_TOLERANCE_NS
+    except (FileNotFoundError, OSError):
+        return False
+    diff.compared_bytes += 2 * size
+    return get_file_sha256(old.read_blocks(chunk_name)) == get_file_sha256(new.read_blocks(chunk_name))
+
+
+def diff_snapshots(old_path: str, new_path: str, compare_files: bool = False,
+                   compare_content: bool = False) -> AstroSaveDiff:
+    """Compare the saves of two snapshots of a Microsoft save folder.
+
+    Args:
+        old_path: Older container or save folder, which may be inside a
+            backup archive.
+        new_path: Newer container or save folder.
+        compare_files: Also compare the chunk files shared by both versions
+            of the changed and renamed saves.
+        compare_content: Compare the content of the chunk files instead of
+            their modification time.
+
+    Returns:
+        AstroSaveDiff: Differences, in the order of the new snapshot, then
+            the removed saves.
+
+    Raises:
+        FileNotFoundError: If a path holds no container.
+    """
+    diff = AstroSaveDiff(AstroSaveSnapshot(old_path), AstroSaveSnapshot(new_path))
+    old_saves, new_saves = diff.old.saves, diff.new.saves
+
+    # Saves of each side without a save of the same name on the other one
+    old_by_ids = {}
+    old_by_base_name = {}
+    for name, save in old_saves.items():
+        if name not in new_saves:
+            old_by_ids.setdefault(save.chunk_ids, name)
+            old_by_base_name.setdefault(save.get_base_name(), name)
+    matched = set()
+
+    for name, save in new_saves.items():
+        old_save = old_saves.get(name)
+        if old_save is not None:
+            if old_save.chunk_ids == save.chunk_ids:
+                diff.unchanged.append(name)
+            else:
+                diff.differences.append(compare_chunks(old_save, save, CHANGED))
+            continue
+
+        old_name = old_by_ids.get(save.chunk_ids)
+        kind = RENAMED
+        if old_name is None or old_name in matched:
+            old_name = old_by_base_name.get(save.get_base_name())
+            kind = CHANGED
+        if old_name is None or old_name in matched:
+            diff.differences.append(AstroSaveDifference(ADDED, name, added_chunks=save.chunks_names))
+            continue
+        matched.add(old_name)
+        diff.differences.append(compare_chunks(old_saves[old_name], save, kind))
+
+    for name, save in old_saves.items():
+        if name not in new_saves and name not in matched:
+            diff.differences.append(AstroSaveDifference(REMOVED, name, removed_chunks=save.chunks_names))
+
+    if compare_files:
+        for difference in diff.differences:
+            difference.modified_chunks = [chunk for chunk in difference.shared_chunks
+                                          if not is_chunk_unchanged(diff, chunk, compare_content)]
+    return diff
@@ -0,0 +1,105 @@
+"""Read-only description of save folders, containers and Steam save files.
+
+Only the containers are read: the chunks and Steam files are described from
+their sizes, so that listing saves stays fast enough to be polled.
+"""
+
+import os
+from typing import List
+
+import utils
+from cogs import AstroSaveStorage
+from cogs.AstroSave import AstroSave, MICROSOFT, STEAM
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+
+
+def describe_container(path: str) -> dict:
+    """Describe a container and the chunks of its saves.
+
+    Args:
+        path: Path to the container, which may be inside an archive.
+
+    Returns:
+        dict: Container path, record count and saves, each with its chunks.
+            The size of a missing chunk is ``None``.
+    """
+    storage = AstroSaveStorage.open_storage(utils.get_dir_name(path))
+    container = Container(path)
+    saves = []
+    for save in container.iter_saves():
+        chunks = []
+        for chunk_name in save.chunks_names:
+            try:
+                size = storage.get_size(chunk_name)
+            except (FileNotFoundError, OSError):
+                size = None
+            chunks.append({'name': chunk_name, 'size': size})
+        saves.append({
+            'name': save.name,
+            'date': save.get_iso_date(),
+            'container': os.path.basename(path),
+            'chunk_count': len(chunks),
+            'size': sum(chunk['size'] or 0 for chunk in chunks),
+            'complete': all(chunk['size'] is not None for chunk in chunks),
+            'chunks': chunks,
+        })
+    return {'path': path, 'platform': MICROSOFT, 'record_count': container.chunk_count, 'saves': saves}
+
+
+def describe_steam_file(path: str) -> dict:
+    """Describe a Steam ``.savegame`` file."""
+    save = AstroSave(os.path.basename(path)[:-len('.savegame')], [])
+    return {'name': save.name, 'date': save.get_iso_date(), 'size': os.path.getsize(path)}
+
+
+def describe_folder(path: str) -> dict:
+    """Describe the saves of a Microsoft or Steam save folder.
+
+    Args:
+        path: Save folder, which may be inside an archive for Microsoft saves.
+
+    Returns:
+        dict: Folder path, platform and saves. The chunks of Microsoft saves
+            are only counted.
+
+    Raises:
+        FileNotFoundError: If the folder holds no container nor Steam save.
+    """
+    storage = AstroSaveStorage.open_storage(path)
+    containers = sorted(name for name in storage.list_files() if 'container' in name)
+    if containers:
+        saves = []
+        for container_name in containers:
+            for save in describe_container(utils.join_paths(storage.path, container_name))['saves']:
+                del save['chunks']
+                saves.append(save)
+        return {'path': path, 'platform': MICROSOFT, 'saves': saves}
+
+    steam_files = sorted(name for name in storage.list_files() if name.endswith('.savegame'))
+    if not steam_files:
+        raise FileNotFoundError(f'No container nor Steam save found in {path}')
+    return {'path': path, 'platform': STEAM,
+            'saves': [describe_steam_file(utils.join_paths(path, name)) for name in steam_files]}
+
+
+def describe(path: str) -> dict:
+    """Describe a save folder, a container or a Steam save file."""
+    if os.path.basename(path).endswith('.savegame'):
+        description = describe_steam_file(path)
+        return {'path': path, 'platform': STEAM, 'saves': [description]}
+    if 'container' in os.path.basename(path) and not utils.is_folder_a_dir(path):
+        return describe_container(path)
+    return describe_folder(path)
+
+
+def format_description(description: dict) -> List[str]:
+    """Format a description as text lines, one per save and chunk."""
+    lines = [f"{description['path']} ({description['platform']}, {len(description['saves'])} save(s))"]
+    for save in description['saves']:
+        chunks = f"{save['chunk_count']} chunk(s)" if 'chunk_count' in save else ''
+        state = '' if save.get('complete', True) else '  INCOMPLETE'
+        lines.append(f"  {save['date'] or '-':<20}{save['size']:>12} B  {chunks:<12}{save['name']}{state}")
+        for chunk in save.get('chunks', []):
+            size = 'missing' if chunk['size'] is None else f"{chunk['size']} B"
+            lines.append(f"      {chunk['name']}  {size}")
+    return lines
@@ -0,0 +1,229 @@
+"""Bulk migration of every Microsoft save of a machine to the Steam format.
+
+Every save of every container of every detected save folder becomes a task
+of a work queue. The queue is ordered by save size and served by a pool of
+workers, while a global semaphore bounds the number of saves being read and
+written at the same time. The save folders can be backed up during the same
+pass, every chunk being read only once.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+import utils
+import AstroSaveScenario as Scenario
+from cogs import AstroCompression
+from cogs import AstroLogging as Logger
+from cogs.AstroSave import AstroSave
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+from cogs.AstroConversionManifest import AstroConversionManifest
+from cogs import AstroTeePipeline
+
+SHORTEST_FIRST = 'shortest'
+LARGEST_FIRST = 'largest'
+
+
+class AstroMigrationTask:
+    """A save waiting to be exported to the Steam format."""
+
+    def __init__(self, save: AstroSave, source_folder: str, target_folder: str, size: int) -> None:
+        """Create a new task.
+
+        Args:
+            save: Microsoft save to export.
+            source_folder: Folder holding the chunks of the save.
+            target_folder: Steam folder receiving the ``.savegame`` file.
+            size: Total size of the chunks of the save, in bytes.
+        """
+        self.save = save
+        self.source_folder = source_folder
+        self.target_folder = target_folder
+        self.size = size
+        self.export_path = None
+        self.skipped = False
+        self.error = None
+
+
+def list_migration_tasks(source_folders: List[str], target_path: str) -> List[AstroMigrationTask]:
+    """Create one task per save found in ``source_folders``.
+
+    When several folders are migrated, the saves of each folder are exported
+    to a sub-folder of ``target_path`` named after it, so that saves with the
+    same name in different profiles don't overwrite each other.
+
+    Args:
+        source_folders: Microsoft save folders to migrate.
+        target_path: Steam folder receiving the exported saves.
+
+    Returns:
+        List[AstroMigrationTask]: Tasks in discovery order.
+    """
+    tasks = []
+    for source_folder in source_folders:
+        if len(source_folders) == 1:
+            target_folder = target_path
+        else:
+            target_folder = utils.join_paths(target_path, os.path.basename(os.path.normpath(source_folder)))
+
+        for container_name in Container.get_containers_list(source_folder):
+            container = Container(utils.join_paths(source_folder, container_name))
+            for save in container.save_list:
+                try:
+                    size = save.get_steam_size(source_folder)
+                except FileNotFoundError as e:
+                    Logger.logPrint(f'Save {save.name} of {source_folder} is incomplete, skipping it: {e}')
+                    continue
+                tasks.append(AstroMigrationTask(save, source_folder, target_folder, size))
+
+    return tasks
+
+
+def get_save_date(save: AstroSave) -> datetime:
+    """Return the date of ``save``, saves without a valid date being the oldest."""
+    try:
+        return save.get_date()
+    except ValueError:
+        return datetime.min
+
+
+def load_newest_saves(source_folder: str, container_names: List[str], workers: int = 4) -> List[AstroSave]:
+    """Parse several containers of a folder in parallel and merge their saves.
+
+    When the same save exists in several containers, only the copy with the
+    most recent date is kept.
+
+    Args:
+        source_folder: Microsoft save folder holding the containers.
+        container_names: Names of the containers to parse.
+        workers: Number of containers parsed at the same time.
+
+    Returns:
+        List[AstroSave]: Newest copy of every save, in container order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        containers = list(executor.map(
+            lambda name: Container(utils.join_paths(source_folder, name)), container_names))
+
+    newest_saves: Dict[str, AstroSave] = {}
+    for container in containers:
+        for save in container.save_list:
+            current = newest_saves.get(save.get_base_name())
+            if current is None or get_save_date(save) > get_save_date(current):
+                if current is not None:
+                    Logger.logPrint(f'Using {save.name} of {container.full_path} instead of {current.name}', 'debug')
+                newest_saves[save.get_base_name()] = save
+
+    return list(newest_saves.values())
+
+
+def order_migration_tasks(tasks: List[AstroMigrationTask], order: str = SHORTEST_FIRST) -> List[AstroMigrationTask]:
+    """Sort tasks by save size.
+
+    ``SHORTEST_FIRST`` delivers the first saves as soon as possible while
+    ``LARGEST_FIRST`` minimises the total duration of a parallel migration.
+    """
+    return sorted(tasks, key=lambda task: task.size, reverse=(order == LARGEST_FIRST))
+
+
+def log_progress(done: int, total: int) -> None:
+    """Log the progress of a migration, every 10%."""
+    previous_step = (done - 1) * 10 // total if done and total else -1
+    if total and done * 10 // total > previous_step:
+        Logger.logPrint(f'Migration progress: {done * 100 // total}% '
+                        f'({done / 1024 / 1024:.2f} / {total / 1024 / 1024:.2f} MB)')
+
+
+def run_migration(tasks: List[AstroMigrationTask], workers: int = 4, io_limit: int = 2,
+                  backup_path: str = None, backups: Dict[str, object] = None) -> List[AstroMigrationTask]:
+    """Export every task with a pool of workers.
+
+    Tasks are started in the order of ``tasks``. Saves that are unchanged
+    since their last export are skipped thanks to the conversion manifest of
+    their target folder. The digest of every exported save is recorded in
+    the manifest, computed while the save is read. The saves are compressed
+    as configured in ``AstroCompression``.
+
+    Args:
+        tasks: Ordered tasks to run.
+        workers: Number of worker threads.
+        io_limit: Maximum number of saves being read and written at once.
+        backup_path: Folder receiving a backup of every source folder, named
+            after it, in the ``AstroCompression.backup_format``. The chunks
+            of the exported saves are backed up while they are converted.
+        backups: Backups already opened with ``AstroTeePipeline.open_backup``,
+            by source folder, fed like those of ``backup_path`` but left for
+            the caller to complete and close.
+
+    Returns:
+        List[AstroMigrationTask]: The tasks, with their result filled in.
+    """
+    io_semaphore = threading.BoundedSemaphore(io_limit)
+    manifest_lock = threading.Lock()
+    manifests: Dict[str, AstroConversionManifest] = {}
+    owned_backups = {}
+    backups = dict(backups or {})
+    progress = AstroTeePipeline.ProgressSink(sum(task.size for task in tasks), log_progress)
+    compression = AstroCompression.export_compression
+
+    for task in tasks:
+        if task.target_folder not in manifests:
+            os.makedirs(task.target_folder, exist_ok=True)
+            manifests[task.target_folder] = AstroConversionManifest(task.target_folder)
+        if backup_path and task.source_folder not in backups:
+            backup_name = os.path.basename(os.path.normpath(task.source_folder))
+            backups[task.source_folder] = owned_backups[task.source_folder] = \
+                AstroTeePipeline.open_backup(utils.join_paths(backup_path, backup_name))
+
+    def run_task(task: AstroMigrationTask) -> None:
+        manifest = manifests[task.target_folder]
+        try:
+            with manifest_lock:
+                task.skipped = manifest.is_steam_export_up_to_date(task.save, task.source_folder, compression)
+            if task.skipped:
+                with manifest_lock:
+                    manifest.skip(task.save, task.size)
+                progress.advance(task.size)
+                return
+
+            digest = AstroTeePipeline.HashSink()
+            with io_semaphore:
+                task.export_path = Scenario.export_save_to_steam(task.save, task.source_folder,
+                                                                 task.target_folder, [digest, progress],
+                                                                 backups.get(task.source_folder), compression,
+                                                                 AstroCompression.compression_level)
+            with manifest_lock:
+                manifest.record_steam_export(task.save, task.source_folder, digest.hexdigest(), compression)
+                manifest.save()
+            Logger.logPrint(f'Save {task.save.name} has been exported to {task.export_path}')
+        except Exception as e:
+            # A corrupted save must not stop the migration of the others
+            task.error = e
+            Logger.logPrint(f'Export of {task.save.name} from {task.source_folder} failed: {e}', 'error')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # The executor starts the tasks in submission order
+        list(executor.map(run_task, tasks))
+
+    for source_folder, backup in owned_backups.items():
+        try:
+            # Containers and saves that were not exported
+            AstroTeePipeline.backup_remaining_files(source_folder, backup)
+        finally:
+            Logger.logPrint(f'{source_folder} backed up to {backup.close()}')
+    duration = time.perf_counter() - start
+
+    exported = [task for task in tasks if task.export_path]
+    exported_bytes = sum(task.size for task in exported)
+    Logger.logPrint(
+        f'\n{len(exported)} save(s) exported, {sum(task.skipped for task in tasks)} unchanged, '
+        f'{sum(task.error is not None for task in tasks)} failed '
+        f'({exported_bytes / 1024 / 1024:.2f} MB in {duration:.2f}s)')
+    for manifest in manifests.values():
+        manifest.log_summary()
+
+    return tasks
@@ -0,0 +1,233 @@
+"""Incremental restore of a backed up save folder over a live one.
+
+Instead of copying a whole backup back, only the files that differ from the
+live folder (by size and modification time, or content when asked) are
+copied, and the Microsoft chunks that the restored containers don't reference
+are removed.
+
+Everything is first written to temporary files of the live folder, so a
+failure leaves the live folder untouched. The new chunks are then moved in
+place, then the containers, and only then are the extra chunks removed: at
+any time the containers of the live folder only reference chunks that exist.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import Dict, Iterator, List, Tuple
+
+import utils
+from cogs import AstroLogging as Logger
+from cogs import AstroSaveStorage
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+
+# Zip archives store modification times with a 2 seconds precision
+MTIME_TOLERANCE_NS = 2 * 10**9
+
+
+class AstroRestorePlan:
+    """Files to copy and remove to restore a backup."""
+
+    def __init__(self, backup, live_folder: str) -> None:
+        """Create an empty plan.
+
+        Args:
+            backup: Storage of the backed up save folder.
+            live_folder: Save folder to restore the backup into.
+        """
+        self.backup = backup
+        self.live_folder = live_folder
+        self.copies: List[Tuple[str, str]] = []  # (name in the backup, name in the live folder)
+        self.removals: List[str] = []
+        self.unchanged: List[str] = []
+
+    def get_copied_size(self) -> int:
+        """Return the number of bytes to copy."""
+        return sum(self.backup.get_size(backup_name) for backup_name, _ in self.copies)
+
+
+def is_container_name(name: str) -> bool:
+    """Return ``True`` if ``name`` is the name of a container file."""
+    return 'container' in name
+
+
+def get_file_sha256(blocks) -> str:
+    """Return the SHA-256 of a stream of blocks."""
+    digest = hashlib.sha256()
+    for block in blocks:
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def is_file_unchanged(backup, backup_name: str, live_path: str, compare_content: bool) -> bool:
+    """Return ``True`` if ``live_path`` holds the same file as the backup.
+
+    Args:
+        backup: Storage of the backup.
+        backup_name: Name of the file in the backup.
+        live_path: Path of the file in the live folder.
+        compare_content: Compare the content of files of the same size
+            instead of their modification time.
+    """
+    try:
+        stat = os.stat(live_path)
+    except FileNotFoundError:
+        return False
+    if stat.st_size != backup.get_size(backup_name):
+        return False
+    if not compare_content:
+        return abs(stat.st_mtime_ns - backup.get_mtime_ns(backup_name)) < MTIME_TOLERANCE_NS
+    return (get_file_sha256(utils.read_file_blocks(live_path))
+            == get_file_sha256(backup.read_blocks(backup_name)))
+
+
+def get_container_names(backup_containers: List[str], live_containers: List[str]) -> Dict[str, str]:
+    """Name the restored containers after the live ones.
+
+    The game only loads the container whose number it expects, so a single
+    backed up container takes the name of the single live container.
+
+    Returns:
+        Dict[str, str]: Live container name of every backed up container.
+    """
+    if len(backup_containers) == 1 and len(live_containers) == 1:
+        return {backup_containers[0]: live_containers[0]}
+    return {name: name for name in backup_containers}
+
+
+def plan_restore(backup_path: str, live_folder: str, compare_content: bool = False) -> AstroRestorePlan:
+    """Compare a backup with a live save folder.
+
+    Microsoft folders are restored container by container: the containers and
+    the chunks they reference are copied if they differ, the other files of
+    the live folder are removed. Steam folders only get the ``.savegame``
+    files of the backup that differ.
+
+    Args:
+        backup_path: Backed up save folder, possibly inside an archive.
+        live_folder: Save folder to restore the backup into.
+        compare_content: Compare the content of files of the same size
+            instead of their modification time.
+
+    Returns:
+        AstroRestorePlan: The files to copy and remove.
+    """
+    backup = AstroSaveStorage.open_storage(backup_path)
+    plan = AstroRestorePlan(backup, live_folder)
+    backup_files = sorted(backup.list_files())
+    live_files = []
+    if utils.is_folder_a_dir(live_folder):
+        # Hidden files are the manifest and journal of the tool, kept as they are
+        live_files = sorted(name for name in os.listdir(live_folder)
+                            if not name.startswith('.') and utils.is_a_file(utils.join_paths(live_folder, name)))
+
+    backup_containers = [name for name in backup_files if is_container_name(name)]
+    if backup_containers:
+        live_containers = [name for name in live_files if is_container_name(name)]
+        files = []
+        for backup_name, live_name in get_container_names(backup_containers, live_containers).items():
+            container = Container(utils.join_paths(backup.path, backup_name))
+            files.extend((chunk_name, chunk_name) for save in container.save_list
+                         for chunk_name in save.chunks_names)
+            files.append((backup_name, live_name))
+        restored_names = {live_name for _, live_name in files}
+        plan.removals = [name for name in live_files if name not in restored_names]
+    else:
+        files = [(name, name) for name in backup_files if name.endswith('.savegame')]
+
+    for backup_name, live_name in files:
+        if is_file_unchanged(backup, backup_name, utils.join_paths(live_folder, live_name), compare_content):
+            plan.unchanged.append(live_name)
+        else:
+            plan.copies.append((backup_name, live_name))
+    return plan
+
+
+def stage_file(backup, backup_name: str, blocks: Iterator[bytes], live_folder: str) -> str:
+    """Copy a file of the backup to a temporary file of ``live_folder``.
+
+    Args:
+        backup: Storage of the backup.
+        backup_name: Name of the file in the backup.
+        blocks: Content of the file, see ``AstroSaveStorage.read_files``.
+        live_folder: Save folder being restored.
+
+    Returns:
+        str: Path of the temporary file, flushed to the disk.
+    """
+    temp_fd, temp_path = tempfile.mkstemp(prefix='.astrosaveconverter-', suffix='.tmp', dir=live_folder)
+    try:
+        with os.fdopen(temp_fd, 'wb') as temp_file:
+            utils.preallocate_file(temp_file, backup.get_size(backup_name))
+            for block in blocks:
+                utils.write_throttled(temp_file, block)
+            utils.sync_file(temp_file)
+        mtime_ns = backup.get_mtime_ns(backup_name)
+        os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+
+def apply_restore(plan: AstroRestorePlan) -> None:
+    """Copy and remove the files of ``plan``, see the module documentation.
+
+    Raises:
+        OSError: If a file can't be copied, the live folder being unchanged.
+    """
+    os.makedirs(plan.live_folder, exist_ok=True)
+    utils.ensure_free_space(plan.live_folder, plan.get_copied_size())
+
+    staged = []
+    try:
+        live_names = dict(plan.copies)
+        # Read in the order of the backup, a compressed tar archive being decompressed once
+        for backup_name, blocks in plan.backup.read_files(list(live_names)):
+            temp_path = stage_file(plan.backup, backup_name, blocks, plan.live_folder)
+            live_name = live_names[backup_name]
+            staged.append((temp_path, live_name))
+            utils.set_replacement_mode(temp_path, utils.join_paths(plan.live_folder, live_name))
+    except BaseException:
+        for temp_path, _ in staged:
+            os.remove(temp_path)
+        raise
+
+    # Chunks first, the containers referencing them last
+    staged.sort(key=lambda file: is_container_name(file[1]))
+    for temp_path, live_name in staged:
+        os.replace(temp_path, utils.join_paths(plan.live_folder, live_name))
+        Logger.logPrint(f'Restored {live_name}', 'debug')
+
+    for name in plan.removals:
+        os.remove(utils.join_paths(plan.live_folder, name))
+        Logger.logPrint(f'Removed {name}', 'debug')
+
+
+def restore_save_folder(backup_path: str, live_folder: str, compare_content: bool = False,
+                        dry_run: bool = False) -> AstroRestorePlan:
+    """Restore a backed up save folder over a live one, copying only what changed.
+
+    Args:
+        backup_path: Backed up save folder, possibly inside an archive.
+        live_folder: Save folder to restore.
+        compare_content: Compare the content of files of the same size
+            instead of their modification time.
+        dry_run: Only log what would be done.
+
+    Returns:
+        AstroRestorePlan: The files copied and removed.
+    """
+    plan = plan_restore(backup_path, live_folder, compare_content)
+    action = 'Would restore' if dry_run else 'Restoring'
+    Logger.logPrint(f'{action} {len(plan.copies)} file(s) '
+                    f'({plan.get_copied_size() / 1024 / 1024:.2f} MB) and remove {len(plan.removals)}, '
+                    f'{len(plan.unchanged)} file(s) unchanged')
+    if dry_run:
+        for _, live_name in plan.copies:
+            Logger.logPrint(f'  copy   {live_name}')
+        for name in plan.removals:
+            Logger.logPrint(f'  remove {name}')
+    else:
+        apply_restore(plan)
+    return plan
@@ -0,0 +1,348 @@
+"""Read access to Microsoft save folders stored on disk or inside archives.
+
+A save folder can be a regular directory or a folder inside a zip or tar
+archive, e.g. ``backup.zip`` or ``backup.tar.gz/wgs/000900000A0B1C2D``. When
+only the archive is given, the folder holding a ``container.*`` file is used.
+Container files and chunks are streamed straight from the archive, nothing is
+extracted to the disk.
+
+A compressed tar archive can't be read at random: opening one of its members
+decompresses the archive from its start. Reading several files goes through
+``read_files`` or ``read_files_in_order`` instead, which decompress the
+archive once.
+
+The archive modules are only imported when an archive is opened.
+"""
+
+import os
+import time
+from functools import lru_cache
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import utils
+from cogs import AstroIOThrottle
+from errors import MultipleFolderFoundError
+
+
+class FolderStorage:
+    """Save folder stored as a regular directory."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def list_files(self) -> List[str]:
+        """Return the names of the files of the folder."""
+        return [name for name in utils.list_folder_content(self.path)
+                if utils.is_a_file(utils.join_paths(self.path, name))]
+
+    def open(self, name: str) -> BinaryIO:
+        """Open a file of the folder for reading."""
+        return open(utils.join_paths(self.path, name), 'rb')
+
+    def get_size(self, name: str) -> int:
+        """Return the size of a file of the folder."""
+        return os.path.getsize(utils.join_paths(self.path, name))
+
+    def get_mtime_ns(self, name: str) -> int:
+        """Return the modification time of a file of the folder."""
+        return os.stat(utils.join_paths(self.path, name)).st_mtime_ns
+
+    def read_blocks(self, name: str, offset: int = 0, length: int = None) -> Iterator[bytes]:
+        """Stream a file of the folder, see ``utils.read_file_blocks``."""
+        return utils.read_file_blocks(utils.join_paths(self.path, name), offset, length)
+
+    def read_files(self, names: List[str]) -> Iterator[Tuple[str, Iterator[bytes]]]:
+        """Stream several files of the folder, in the order of ``names``.
+
+        Yields:
+            The name of every file and its blocks, to be read before the
+            next file is yielded.
+        """
+        for name in names:
+            yield name, self.read_blocks(name)
+
+
+class ArchiveStorage:
+    """Save folder stored inside an archive."""
+
+    def __init__(self, archive_path: str, folder: str, members: Dict[str, object]) -> None:
+        """Create a storage for ``folder`` inside an already indexed archive.
+
+        Args:
+            archive_path: Path to the archive file.
+            folder: Folder of the archive holding the saves, ``''`` for the root.
+            members: Archive members of ``folder``, by file name.
+        """
+        self.archive_path = archive_path
+        self.folder = folder
+        self.path = utils.join_paths(archive_path, folder) if folder else archive_path
+        self.members = members
+
+    def list_files(self) -> List[str]:
+        """Return the names of the files of the folder."""
+        return list(self.members)
+
+    def get_member(self, name: str):
+        """Return the archive member named ``name``."""
+        try:
+            return self.members[name]
+        except KeyError:
+            raise FileNotFoundError(f'{name} not found in {self.path}')
+
+    def read_blocks(self, name: str, offset: int = 0, length: int = None) -> Iterator[bytes]:
+        """Stream a file of the folder, decompressing it on the fly."""
+        with self.open(name) as member_file:
+            yield from read_member_blocks(member_file, offset, length)
+
+    def read_files(self, names: List[str]) -> Iterator[Tuple[str, Iterator[bytes]]]:
+        """Stream several files of the folder, see ``FolderStorage.read_files``."""
+        for name in names:
+            yield name, self.read_blocks(name)
+
+
+class ZipStorage(ArchiveStorage):
+    """Save folder stored inside a zip archive."""
+
+    def __init__(self, archive: 'zipfile.ZipFile', archive_path: str, folder: str,
+                 files: Dict[str, 'zipfile.ZipInfo']) -> None:
+        # Zip members can be read from several threads, each one gets a file position of its own
+        self.archive = archive
+        members = {os.path.basename(name): info for name, info in files.items() if get_member_folder(name) == folder}
+        super().__init__(archive_path, folder, members)
+
+    def open(self, name: str) -> BinaryIO:
+        return self.archive.open(self.get_member(name))
+
+    def get_size(self, name: str) -> int:
+        return self.get_member(name).file_size
+
+    def get_mtime_ns(self, name: str) -> int:
+        return int(time.mktime(self.get_member(name).date_time + (0, 0, -1))) * 10**9
+
+
+class TarStorage(ArchiveStorage):
+    """Save folder stored inside a tar archive, compressed or not.
+
+    A compressed tar archive is decompressed from its start every time one of
+    its members is opened, ``read_files`` reads several of them at once.
+    """
+
+    def __init__(self, archive_path: str, folder: str, files: Dict[str, 'tarfile.TarInfo']) -> None:
+        members = {os.path.basename(name): info for name, info in files.items() if get_member_folder(name) == folder}
+        super().__init__(archive_path, folder, members)
+
+    def open(self, name: str) -> BinaryIO:
+        """Open a member of the archive through a handle of its own, closed with the member."""
+        import tarfile
+        info = self.get_member(name)
+        # A tar file has a single file position: sharing it between readers mixes their data
+        archive = tarfile.open(self.archive_path)
+        try:
+            return TarMemberFile(archive, archive.extractfile(info))
+        except BaseException:
+            archive.close()
+            raise
+
+    def read_files(self, names: List[str]) -> Iterator[Tuple[str, Iterator[bytes]]]:
+        """Stream several members of the archive through a single handle.
+
+        The members are yielded in the order they are stored in the archive,
+        not in the order of ``names``, so that the archive is decompressed
+        once. See ``read_files_in_order`` to get them in the order of ``names``.
+
+        Yields:
+            The name of every member and its blocks, to be read before the
+            next member is yielded.
+        """
+        import tarfile
+        names = sorted(names, key=lambda name: self.get_member(name).offset_data)
+        with tarfile.open(self.archive_path) as archive:
+            for name in names:
+                with archive.extractfile(self.get_member(name)) as member_file:
+                    yield name, read_member_blocks(member_file)
+
+    def get_size(self, name: str) -> int:
+        return self.get_member(name).size
+
+    def get_mtime_ns(self, name: str) -> int:
+        return int(self.get_member(name).mtime) * 10**9
+
+
+class TarMemberFile:
+    """Member of a tar archive, closing the archive handle it is read through."""
+
+    def __init__(self, archive: 'tarfile.TarFile', member_file: BinaryIO) -> None:
+        self.archive = archive
+        self.member_file = member_file
+
+    def read(self, size: int = -1) -> bytes:
+        return self.member_file.read(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.member_file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.member_file.tell()
+
+    def close(self) -> None:
+        self.member_file.close()
+        self.archive.close()
+
+    def __enter__(self) -> 'TarMemberFile':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def read_member_blocks(member_file: BinaryIO, offset: int = 0, length: int = None) -> Iterator[bytes]:
+    """Stream an open archive member, see ``utils.read_file_blocks``."""
+    if offset:
+        member_file.seek(offset)
+    remaining = length
+    while remaining is None or remaining > 0:
+        size = utils.IO_BUFFER_SIZE if remaining is None else min(utils.IO_BUFFER_SIZE, remaining)
+        block = member_file.read(size)
+        if not block:
+            break
+        if remaining is not None:
+            remaining -= len(block)
+        AstroIOThrottle.consume(len(block))
+        yield block
+
+
+def read_files_in_order(storage, names: List[str]) -> Iterator[Tuple[str, Iterator[bytes]]]:
+    """Stream several files of a storage in the order of ``names``.
+
+    The files are read in the order ``storage.read_files`` gives them, those
+    coming before their turn are kept in memory until then.
+
+    Yields:
+        The name of every file and its blocks, to be read before the next
+        file is yielded.
+    """
+    pending = {}
+    files = storage.read_files(names)
+    try:
+        for name in names:
+            if name in pending:
+                yield name, iter([pending.pop(name)])
+                continue
+            for read_name, blocks in files:
+                if read_name == name:
+                    yield name, blocks
+                    break
+                pending[read_name] = b''.join(blocks)
+    finally:
+        files.close()
+
+
+def get_member_folder(member_name: str) -> str:
+    """Return the folder of an archive member, relative to the archive root."""
+    if member_name.startswith('./'):
+        member_name = member_name[2:]
+    return os.path.dirname(member_name)
+
+
+def is_archive(path: str) -> bool:
+    """Return ``True`` if ``path`` is a zip or tar archive."""
+    import tarfile
+    import zipfile
+    return utils.is_a_file(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def split_archive_path(path: str) -> Optional[Tuple[str, str]]:
+    """Split ``archive.zip/inner/folder`` into the archive path and the inner folder.
+
+    Returns:
+        The archive path and the folder inside it, or ``None`` if ``path``
+        doesn't go through an archive.
+    """
+    archive_path = os.path.normpath(path)
+    inner_parts = []
+    while archive_path and not utils.is_path_exists(archive_path):
+        archive_path, part = os.path.split(archive_path)
+        if not part:
+            return None
+        inner_parts.insert(0, part)
+
+    if not is_archive(archive_path):
+        return None
+    return archive_path, '/'.join(inner_parts)
+
+
+@lru_cache(maxsize=8)
+def open_archive(archive_path: str, mtime_ns: int):
+    """Index an archive, the index being kept while the archive is unchanged.
+
+    A zip archive is kept open with its index. A tar archive is closed once
+    indexed, each of its readers opens it again, see ``TarStorage.open`` and
+    ``TarStorage.read_files``.
+
+    Returns:
+        The open zip file, or ``None`` for a tar archive, and the members
+        of the archive that are files, by name.
+    """
+    import tarfile
+    import zipfile
+    if zipfile.is_zipfile(archive_path):
+        archive = zipfile.ZipFile(archive_path)
+        files = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+    else:
+        archive = None
+        with tarfile.open(archive_path) as tar_archive:
+            files = {info.name: info for info in tar_archive.getmembers() if info.isfile()}
+    return archive, files
+
+
+def find_save_folder_in_archive(archive_path: str, files: List[str]) -> str:
+    """Return the folder of the archive holding a container file.
+
+    Raises:
+        MultipleFolderFoundError: If several folders hold a container.
+    """
+    folders = sorted({get_member_folder(name) for name in files
+                      if os.path.basename(name).startswith('container.')})
+    if len(folders) > 1:
+        raise MultipleFolderFoundError(
+            f'Several save folders found in {archive_path}, please choose one of: '
+            + ', '.join(utils.join_paths(archive_path, folder) for folder in folders))
+    return folders[0] if folders else ''
+
+
+def open_storage(source):
+    """Return the storage of a save folder.
+
+    Args:
+        source: Folder path, path through an archive, or storage returned
+            by a previous call.
+
+    Raises:
+        FileNotFoundError: If ``source`` doesn't exist.
+        MultipleFolderFoundError: If an archive holds several save folders
+            and none was selected.
+    """
+    if isinstance(source, (FolderStorage, ArchiveStorage)):
+        return source
+    if utils.is_folder_a_dir(source):
+        return FolderStorage(source)
+
+    archive_location = split_archive_path(source)
+    if archive_location is None:
+        raise FileNotFoundError(f'Save folder not found: {source}')
+
+    archive_path, folder = archive_location
+    archive, files = open_archive(archive_path, os.stat(archive_path).st_mtime_ns)
+    if not folder:
+        folder = find_save_folder_in_archive(archive_path, files)
+
+    if archive is not None:
+        return ZipStorage(archive, archive_path, folder, files)
+    return TarStorage(archive_path, folder, files)
+
+
+def open_save_file(path: str) -> BinaryIO:
+    """Open a file of a save folder, which may be inside an archive."""
+    if utils.is_a_file(path):
+        return open(path, 'rb')
+    return open_storage(utils.get_dir_name(path)).open(os.path.basename(path))
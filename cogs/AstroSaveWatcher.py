@@ -0,0 +1,149 @@
+"""Continuous export of a Microsoft/Xbox save folder to a Steam save folder."""
+
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import utils
+import AstroSaveScenario as Scenario
+from cogs import AstroCompression
+from cogs import AstroLogging as Logger
+from cogs.AstroSaveContainer import AstroSaveContainer as Container
+from cogs.AstroConversionManifest import AstroConversionManifest
+
+
+class AstroSaveWatcher:
+    """Mirror a wgs save folder into a Steam ``SaveGames`` folder.
+
+    The watcher polls the modification time of the ``container.*`` files of
+    the source folder. Once a change has been stable for ``debounce`` seconds
+    the containers are parsed again and only the saves whose chunk list
+    changed since the last export are written to the target folder. The
+    conversion manifest of the target folder lets a restarted watcher skip the
+    saves it already exported. The saves are compressed as configured in
+    ``AstroCompression``.
+    """
+
+    def __init__(self, source_folder: str, target_folder: str, interval: float = 2.0,
+                 debounce: float = 5.0, min_interval: float = 0.0) -> None:
+        """Create a new watcher.
+
+        Args:
+            source_folder: Microsoft save folder holding the container and chunks.
+            target_folder: Steam save folder receiving the ``.savegame`` files.
+            interval: Seconds between two polls of the container files.
+            debounce: Seconds the containers must stay untouched before exporting.
+            min_interval: Minimum number of seconds between two exports.
+        """
+        self.source_folder = source_folder
+        self.target_folder = target_folder
+        self.interval = interval
+        self.debounce = debounce
+        self.min_interval = min_interval
+
+        self.exported_saves: Dict[str, Tuple[str, ...]] = {}
+        self.__synced_mtimes: Optional[Dict[str, float]] = None
+        self.__pending_mtimes: Optional[Dict[str, float]] = None
+        self.__pending_since = 0.0
+        self.__last_sync = None
+
+    def get_containers_mtimes(self) -> Dict[str, float]:
+        """Return the modification time of every container of the source folder."""
+        mtimes = {}
+        for container_name in Container.get_containers_list(self.source_folder):
+            container_path = utils.join_paths(self.source_folder, container_name)
+            mtimes[container_name] = os.stat(container_path).st_mtime
+        return mtimes
+
+    def poll(self, now: float = None) -> List[str]:
+        """Check the source folder once and export the changed saves if needed.
+
+        Args:
+            now: Current time, defaults to ``time.monotonic()``.
+
+        Returns:
+            List[str]: Paths of the saves exported during this poll.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        try:
+            mtimes = self.get_containers_mtimes()
+        except FileNotFoundError:
+            Logger.logPrint(f'No container found in {self.source_folder}', 'debug')
+            return []
+
+        if mtimes == self.__synced_mtimes:
+            self.__pending_mtimes = None
+            return []
+
+        if mtimes != self.__pending_mtimes:
+            # The game is still writing, wait for the containers to settle
+            Logger.logPrint(f'Container change detected in {self.source_folder}', 'debug')
+            self.__pending_mtimes = mtimes
+            self.__pending_since = now
+
+        if now - self.__pending_since < self.debounce:
+            return []
+        if self.__last_sync is not None and now - self.__last_sync < self.min_interval:
+            return []
+
+        try:
+            exported = self.sync()
+        except Exception as e:
+            # A chunk disappeared or a container was caught half written, retry once the debounce is over again
+            Logger.logPrint(f'Export of {self.source_folder} failed, retrying in {self.debounce} s: {e}', 'warning')
+            self.__pending_since = now
+            return []
+
+        self.__synced_mtimes = mtimes
+        self.__pending_mtimes = None
+        self.__last_sync = now
+        return exported
+
+    def sync(self) -> List[str]:
+        """Parse the containers and export the saves whose chunks changed.
+
+        Returns:
+            List[str]: Paths of the exported saves.
+        """
+        utils.make_dir_if_doesnt_exists(self.target_folder)
+        manifest = AstroConversionManifest(self.target_folder)
+        compression = AstroCompression.export_compression
+        exported = []
+
+        for container_name in Container.get_containers_list(self.source_folder):
+            container = Container(utils.join_paths(self.source_folder, container_name))
+
+            for save in container.save_list:
+                chunks = tuple(save.chunks_names)
+                if self.exported_saves.get(save.name) == chunks:
+                    continue
+                if manifest.is_steam_export_up_to_date(save, self.source_folder, compression):
+                    # Already exported by a previous run of the watcher
+                    self.exported_saves[save.name] = chunks
+                    continue
+
+                export_path = Scenario.export_save_to_steam(save, self.source_folder, self.target_folder,
+                                                            compression=compression,
+                                                            level=AstroCompression.compression_level)
+                manifest.record_steam_export(save, self.source_folder, compression=compression)
+                manifest.save()
+                self.exported_saves[save.name] = chunks
+                Logger.logPrint(f'Save {save.name} has been exported to {export_path}')
+                exported.append(export_path)
+
+        return exported
+
+    def run(self, max_polls: int = None) -> None:
+        """Poll the source folder until interrupted.
+
+        Args:
+            max_polls: Stop after this many polls, runs forever when ``None``.
+        """
+        Logger.logPrint(f'Watching {self.source_folder}, exporting to {self.target_folder}')
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            self.poll()
+            polls += 1
+            time.sleep(self.interval)
@@ -0,0 +1,148 @@
+"""Clients of the local conversion service, see ``AstroConversionService``.
+
+``AstroServiceClient`` talks to a running service over HTTP or a Unix socket
+and only needs the standard library. ``LocalServiceClient`` has the same
+methods but calls a service of the same process, so that tests and scripts
+can run jobs without opening a socket.
+"""
+
+import http.client
+import json
+import socket
+import time
+from typing import List
+from urllib.parse import urlencode
+
+
+class ServiceRequestError(Exception):
+    """Error answered by the service."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection through a Unix socket."""
+
+    def __init__(self, socket_path: str, timeout: float = None) -> None:
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class BaseServiceClient:
+    """Methods of the clients, on top of ``request``."""
+
+    def request(self, method: str, url: str, content=None):
+        """Send a request to the service and return the JSON answer.
+
+        Raises:
+            ServiceRequestError: If the service answers with an error.
+        """
+        raise NotImplementedError
+
+    def get_save_folders(self, refresh: bool = False) -> List[str]:
+        """Return the Microsoft save folders found by the service."""
+        return self.request('GET', '/folders?refresh=1' if refresh else '/folders')
+
+    def list_saves(self, path: str) -> List[dict]:
+        """Return the saves of a save folder or container."""
+        return self.request('GET', '/saves?' + urlencode({'path': path}))
+
+    def submit(self, job_type: str, source: str, target: str, **options) -> dict:
+        """Queue a job and return it, see ``AstroConversionService.JOB_TYPES``."""
+        return self.request('POST', '/jobs', dict(options, type=job_type, source=source, target=target))
+
+    def get_job(self, job_id: int) -> dict:
+        """Return the status, progress and result of a job."""
+        return self.request('GET', f'/jobs/{job_id}')
+
+    def list_jobs(self) -> List[dict]:
+        """Return every job known by the service."""
+        return self.request('GET', '/jobs')
+
+    def get_metrics(self) -> dict:
+        """Return the job counts, throughput and cache efficiency of the service."""
+        return self.request('GET', '/metrics')
+
+    def wait(self, job_id: int, timeout: float = None, interval: float = 0.1) -> dict:
+        """Poll a job until it is finished and return it.
+
+        Raises:
+            TimeoutError: If the job is not finished after ``timeout`` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job['status'] not in ('queued', 'running'):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f'Job {job_id} is still {job["status"]}')
+            time.sleep(interval)
+
+
+class AstroServiceClient(BaseServiceClient):
+    """Client of a running service."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, socket_path: str = None,
+                 timeout: float = 30.0, token: str = None, token_path: str = None) -> None:
+        """Create a client.
+
+        Args:
+            host: Host of the service.
+            port: Port of the service.
+            socket_path: Unix socket of the service, used instead of
+                ``host`` and ``port`` if given.
+            timeout: Seconds to wait for an answer.
+            token: Token of a service listening on a port.
+            token_path: File holding the token, written by the service.
+        """
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+        if token is None and token_path:
+            with open(token_path, encoding='utf-8') as token_file:
+                token = token_file.read().strip()
+        self.token = token
+
+    def request(self, method: str, url: str, content=None):
+        if self.socket_path:
+            connection = UnixHTTPConnection(self.socket_path, self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            body = None if content is None else json.dumps(content).encode('utf-8')
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            if self.token:
+                headers['Authorization'] = f'Bearer {self.token}'
+            connection.request(method, url, body, headers)
+            response = connection.getresponse()
+            answer = json.loads(response.read() or b'null')
+        finally:
+            connection.close()
+        if response.status >= 400:
+            raise ServiceRequestError(response.status, answer.get('error') if isinstance(answer, dict) else answer)
+        return answer
+
+
+class LocalServiceClient(BaseServiceClient):
+    """Client calling an ``AstroConversionService`` of the same process."""
+
+    def __init__(self, service) -> None:
+        self.service = service
+
+    def request(self, method: str, url: str, content=None):
+        body = b'' if content is None else json.dumps(content).encode('utf-8')
+        status, answer = self.service.handle(method, url, body)
+        # Same round trip as over HTTP, so that the answers are plain JSON
+        answer = json.loads(json.dumps(answer))
+        if status >= 400:
+            raise ServiceRequestError(status, answer['error'])
+        return answer
@@ -0,0 +1,206 @@
+"""Single read pass over the chunks of a save, shared by several sinks.
+
+Converting a save, backing it up and hashing it used to read every chunk once
+per operation. ``iter_save_blocks`` reads the chunks once and hands every
+block to all the sinks (backup, digest, progress...) before yielding it to
+the writer of the Steam file, so the whole operation reads the save only once.
+
+A sink is any object with ``write(block)`` and ``close()`` methods.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Callable, Iterable, Iterator, Union
+
+import utils
+from cogs import AstroCompression
+from cogs import AstroSaveStorage
+from cogs.AstroSave import AstroSave
+
+
+class HashSink:
+    """Digest of the blocks going through the pipeline."""
+
+    def __init__(self, algorithm: str = 'sha256') -> None:
+        self.algorithm = algorithm
+        self.__hash = hashlib.new(algorithm)
+
+    def write(self, block: bytes) -> int:
+        self.__hash.update(block)
+        return len(block)
+
+    def close(self) -> None:
+        pass
+
+    def hexdigest(self) -> str:
+        """Return the digest of the blocks written so far."""
+        return self.__hash.hexdigest()
+
+
+class ProgressSink:
+    """Count the bytes going through one or several pipelines at once."""
+
+    def __init__(self, total: int, callback: Callable[[int, int], None]) -> None:
+        """Create a progress counter.
+
+        Args:
+            total: Number of bytes expected.
+            callback: Called with the bytes done so far and ``total`` after
+                every block.
+        """
+        self.total = total
+        self.done = 0
+        self.__callback = callback
+        self.__lock = threading.Lock()
+
+    def write(self, block: bytes) -> int:
+        self.advance(len(block))
+        return len(block)
+
+    def advance(self, amount: int) -> None:
+        """Count ``amount`` bytes done without going through the pipeline."""
+        with self.__lock:
+            self.done += amount
+            done = self.done
+        self.__callback(done, self.total)
+
+    def close(self) -> None:
+        pass
+
+
+class FileSink:
+    """File written block by block, with its size reserved beforehand."""
+
+    def __init__(self, target: str, size: int, mtime_ns: int = None) -> None:
+        """Create the file.
+
+        Args:
+            target: Path of the file.
+            size: Expected size of the file.
+            mtime_ns: Modification time given to the file once closed,
+                left to now if ``None``.
+        """
+        self.target = target
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.written = 0
+        self.__file = open(target, 'wb')
+        try:
+            utils.preallocate_file(self.__file, size)
+        except BaseException:
+            self.__file.close()
+            raise
+
+    def write(self, block: bytes) -> int:
+        self.written += utils.write_throttled(self.__file, block)
+        return len(block)
+
+    @property
+    def complete(self) -> bool:
+        """``True`` once the file has received its expected size."""
+        return self.written == self.size
+
+    def close(self) -> None:
+        try:
+            if self.written != self.size:
+                self.__file.truncate(self.written)
+            utils.drop_file_cache(self.__file, written=True)
+        finally:
+            self.__file.close()
+        if self.mtime_ns is not None:
+            os.utime(self.target, ns=(self.mtime_ns, self.mtime_ns))
+
+
+class FolderBackup:
+    """Backup written as a plain copy of the files, see ``open_backup``."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.names = set()
+        os.makedirs(path, exist_ok=True)
+
+    def open_member(self, name: str, size: int, mtime_ns: int = None) -> FileSink:
+        """Start the copy of a file, see ``AstroCompression.ArchiveWriter.open_member``."""
+        self.names.add(name)
+        target = utils.join_paths(self.path, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        return FileSink(target, size, mtime_ns)
+
+    def close(self) -> str:
+        return self.path
+
+
+def open_backup(target: str) -> Union[FolderBackup, AstroCompression.ArchiveWriter]:
+    """Start a backup in the configured ``AstroCompression.backup_format``.
+
+    Args:
+        target: Backup folder, or archive path without extension.
+
+    Returns:
+        The backup, whose ``close`` returns the path of the folder or archive.
+    """
+    if AstroCompression.backup_format == 'folder':
+        return FolderBackup(target)
+    return AstroCompression.ArchiveWriter(target, AstroCompression.backup_format,
+                                          AstroCompression.compression_level)
+
+
+def iter_save_blocks(save: AstroSave, source, sinks: Iterable = (), backup=None) -> Iterator[bytes]:
+    """Stream the Steam file of a save, feeding every block to ``sinks`` first.
+
+    Sinks are not closed, as they can be shared by several saves.
+
+    Args:
+        save: Microsoft save to read.
+        source: Save folder or storage holding the chunks of the save.
+        sinks: Sinks receiving the concatenated chunks.
+        backup: Backup receiving a copy of every chunk file, if any.
+
+    Yields:
+        Consecutive blocks of the concatenated chunks.
+
+    Raises:
+        OSError: If a chunk changed while it was read.
+    """
+    storage = AstroSaveStorage.open_storage(source)
+    sinks = list(sinks)
+    for chunk_name, blocks in AstroSaveStorage.read_files_in_order(storage, save.chunks_names):
+        chunk_sinks = sinks
+        member = None
+        if backup is not None:
+            member = backup.open_member(chunk_name, storage.get_size(chunk_name),
+                                        storage.get_mtime_ns(chunk_name))
+            chunk_sinks = sinks + [member]
+        try:
+            for block in blocks:
+                for sink in chunk_sinks:
+                    sink.write(block)
+                yield block
+        finally:
+            if member is not None:
+                member.close()
+        if member is not None and not member.complete:
+            raise OSError(f'Chunk {chunk_name} of {save.name} changed while being backed up')
+
+
+def backup_remaining_files(source, backup) -> None:
+    """Copy the files of ``source`` that are not in ``backup`` yet.
+
+    Completes a backup fed by ``iter_save_blocks`` with the containers and
+    the chunks of the saves that were not exported.
+
+    Raises:
+        OSError: If a file changed while it was backed up.
+    """
+    storage = AstroSaveStorage.open_storage(source)
+    names = sorted(name for name in storage.list_files() if name not in backup.names)
+    for name, blocks in storage.read_files(names):
+        member = backup.open_member(name, storage.get_size(name), storage.get_mtime_ns(name))
+        try:
+            for block in blocks:
+                member.write(block)
+        finally:
+            member.close()
+        if not member.complete:
+            raise OSError(f'{name} of {storage.path} changed while being backed up')
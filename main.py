@@ -6,15 +6,14 @@ user interaction, file discovery and conversion workflows.
 """
 
 import os
+import sys
 import utils
 from argparse import ArgumentParser, Namespace
-import AstroSaveScenario as Scenario
+from typing import Callable
 from cogs import AstroLogging as Logger
-from cogs import AstroSteamSaveFolder
-from cogs.AstroSaveContainer import AstroSaveContainer as Container
-from cogs.AstroSave import AstroSave
-from cogs.AstroConvType import AstroConvType
-from cogs.LoadingBar import LoadingBar
+
+# The conversion modules are imported by the commands using them, so that
+# parsing the arguments and running a single command stay fast
 
 APP_VERSION = "3.0"
 
@@ -32,43 +31,364 @@ def get_args() -> Namespace:
         help="Path from which to read the container and extract the saves",
         required=False,
     )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        help="Microsoft save folder of an interrupted Steam to Microsoft export to finish",
+        required=False,
+    )
+    parser.add_argument(
+        "-a",
+        "--allContainers",
+        action="store_true",
+        help="Convert the saves of every container of the folder instead of choosing one",
+    )
+    parser.add_argument(
+        "--bufferSize",
+        type=int,
+        help="Size in KiB of the blocks read from save files (default: 1024)",
+    )
+    parser.add_argument(
+        "--keepPageCache",
+        action="store_true",
+        help="Don't evict the converted files from the system file cache",
+    )
+    parser.add_argument(
+        "--maxRate",
+        type=float,
+        help="Maximum disk throughput in MB/s, reads and writes included",
+    )
+    parser.add_argument(
+        "--burst",
+        type=float,
+        help="Amount of MB that can be transferred above --maxRate after an idle period (default: one second worth)",
+    )
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        help="Run with a lower CPU and disk priority",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=("xz", "gz", "bz2"),
+        help="Write the converted Steam saves as compressed .savegame.<codec> files",
+    )
+    parser.add_argument(
+        "--backupFormat",
+        choices=("folder", "zip", "tar.gz", "tar.xz", "tar.bz2"),
+        default="folder",
+        help="Write the backups as a plain folder copy or as a compressed archive (default: folder)",
+    )
+    parser.add_argument(
+        "--compressLevel",
+        type=int,
+        help="Compression level of --compress and --backupFormat (default: codec default)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the run (CPU time, memory allocations, peak memory) and write the reports in the logs folder",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Continuously export a Microsoft save folder to a Steam save folder",
+    )
+    watch_parser.add_argument("source", help="Microsoft save folder to watch")
+    watch_parser.add_argument("target", help="Steam save folder receiving the exported saves")
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="Seconds between two checks of the container files (default: 2)",
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=5.0,
+        help="Seconds a container must stay unchanged before exporting (default: 5)",
+    )
+    watch_parser.add_argument(
+        "--minInterval",
+        type=float,
+        default=0.0,
+        help="Minimum number of seconds between two exports (default: 0)",
+    )
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-all",
+        help="Convert every save of every Microsoft save folder to the Steam format",
+    )
+    migrate_parser.add_argument("target", help="Folder receiving the Steam saves")
+    migrate_parser.add_argument(
+        "-s",
+        "--source",
+        action="append",
+        help="Microsoft save folder to migrate, can be repeated (default: every detected folder)",
+    )
+    migrate_parser.add_argument(
+        "--order",
+        choices=["shortest", "largest"],
+        default="shortest",
+        help="Convert the smallest or the largest saves first (default: shortest)",
+    )
+    migrate_parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of saves converted in parallel (default: 4)",
+    )
+    migrate_parser.add_argument(
+        "--ioLimit",
+        type=int,
+        default=2,
+        help="Maximum number of saves read and written at the same time (default: 2)",
+    )
+    migrate_parser.add_argument(
+        "--backup",
+        help="Also back up the Microsoft save folders into this folder, "
+             "while reading them for the conversion (see --backupFormat)",
+    )
+
+    restore_parser = subparsers.add_parser(
+        "restore",
+        help="Restore a backed up save folder, copying only the files that changed",
+    )
+    restore_parser.add_argument("backup", help="Backed up save folder, or zip/tar backup")
+    restore_parser.add_argument("target", help="Save folder to restore")
+    restore_parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="Compare the content of the files instead of their modification time",
+    )
+    restore_parser.add_argument(
+        "--dryRun",
+        action="store_true",
+        help="Only show the files that would be copied and removed",
+    )
+
+    list_parser = subparsers.add_parser(
+        "list",
+        help="List the saves of a Microsoft or Steam save folder, without logging nor prompts",
+    )
+    list_parser.add_argument("path", help="Save folder, or zip/tar backup of a Microsoft save folder")
+    list_parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    inspect_parser = subparsers.add_parser(
+        "inspect",
+        help="Show the saves of a container, folder or Steam save with their chunks",
+    )
+    inspect_parser.add_argument("path", help="Container, save folder or .savegame file")
+    inspect_parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    diff_parser = subparsers.add_parser(
+        "diff",
+        help="Compare the container records of two Microsoft save folders, backups or containers",
+    )
+    diff_parser.add_argument("old", help="Older save folder, zip/tar backup or container")
+    diff_parser.add_argument("new", help="Newer save folder, zip/tar backup or container")
+    diff_parser.add_argument(
+        "--files",
+        action="store_true",
+        help="Also compare the chunk files shared by the changed and renamed saves, by size and modification time",
+    )
+    diff_parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="With --files, compare the content of the chunk files instead of their modification time",
+    )
+    diff_parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    metrics_parser = subparsers.add_parser(
+        "metrics",
+        help="Summarize the durations and throughputs recorded in the metrics ledger",
+    )
+    metrics_parser.add_argument("--ledger", help="Metrics ledger to read (default: logs/metrics.jsonl)")
+    metrics_parser.add_argument(
+        "--operation",
+        choices=("conversion", "backup", "scan"),
+        help="Only summarize this operation",
+    )
+    metrics_parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    check_parser = subparsers.add_parser(
+        "check",
+        help="Look for missing, truncated and orphaned chunks without reading them",
+    )
+    check_parser.add_argument(
+        "folders",
+        nargs="*",
+        help="Microsoft save folders, or folders to search (default: every detected folder)",
+    )
+    check_parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of save folders checked in parallel (default: 8)",
+    )
+
+    compact_parser = subparsers.add_parser(
+        "compact",
+        help="Remove orphaned chunks and dead saves from containers (close Astroneer first)",
+    )
+    compact_parser.add_argument(
+        "folders",
+        nargs="*",
+        help="Microsoft save folders, or folders to search (default: every detected folder)",
+    )
+    compact_parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Actually rewrite the containers and remove the chunks, instead of only reporting",
+    )
+
+    catalog_parser = subparsers.add_parser(
+        "catalog",
+        help="Index the saves of live folders and backups, and query the index",
+    )
+    catalog_parser.add_argument(
+        "--db",
+        help="Catalog database (default: ~/.astrosaveconverter/catalog.sqlite)",
+    )
+    catalog_parser.add_argument(
+        "--platform",
+        choices=["microsoft", "steam"],
+        help="Only show the saves of this platform",
+    )
+    catalog_subparsers = catalog_parser.add_subparsers(dest="catalog_command", required=True)
+    catalog_update_parser = catalog_subparsers.add_parser(
+        "update",
+        help="Index the saves found in folders and backup archives, skipping unchanged files",
+    )
+    catalog_update_parser.add_argument("paths", nargs="+", help="Folders to search recursively, or archives")
+    catalog_subparsers.add_parser("list", help="List every indexed save")
+    catalog_search_parser = catalog_subparsers.add_parser(
+        "search",
+        help="List the saves whose name or folder contains a text",
+    )
+    catalog_search_parser.add_argument("text")
+    catalog_newest_parser = catalog_subparsers.add_parser(
+        "newest",
+        help="Show where the newest copy of every save, or of one save, is",
+    )
+    catalog_newest_parser.add_argument("name", nargs="?", help="Save name, without date")
+
+    plan_parser = subparsers.add_parser(
+        "plan",
+        help="Show what migrate-all, or an export to Microsoft, would read and write, without doing it",
+    )
+    plan_parser.add_argument("target", help="Folder receiving the Steam saves, or Microsoft save folder")
+    plan_parser.add_argument(
+        "-s",
+        "--source",
+        nargs="+",
+        help="Microsoft save folders to migrate (default: every detected folder)",
+    )
+    plan_parser.add_argument(
+        "--fromSteam",
+        help="Plan the export of the Steam saves of this folder into the Microsoft save folder target instead",
+    )
+    plan_parser.add_argument("--backup", help="Folder receiving the backups, as with migrate-all")
+    plan_parser.add_argument(
+        "--readRate",
+        type=float,
+        help="Read throughput in MB/s used for the estimate (default: 100, or measured with --measure)",
+    )
+    plan_parser.add_argument(
+        "--writeRate",
+        type=float,
+        help="Write throughput in MB/s used for the estimate (default: 50, or measured with --measure)",
+    )
+    plan_parser.add_argument(
+        "--measure",
+        action="store_true",
+        help="Measure the throughputs by reading a sample of the saves, evicted from the system file cache first, "
+             "and by writing a 32 MB file on the target disk",
+    )
+    plan_parser.add_argument("--json", action="store_true", help="Print the whole plan as JSON")
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run a local service converting and backing up saves on request",
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    serve_parser.add_argument("--socket", help="Unix socket to listen on instead of a port")
+    serve_parser.add_argument(
+        "--tokenFile",
+        help="File receiving the token the clients must send when listening on a port (default: logs/service_token)",
+    )
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="Number of jobs run at the same time (default: 2)",
+    )
+    serve_parser.add_argument(
+        "--queueSize",
+        type=int,
+        default=16,
+        help="Number of waiting jobs beyond which new jobs are refused (default: 16)",
+    )
     return parser.parse_args()
 
 
-def windows_to_steam_conversion(original_save_path: str) -> None:
+def windows_to_steam_conversion(original_save_path: str, all_containers: bool = False, backup=None) -> None:
     """Convert Microsoft/Xbox saves to the Steam format.
 
     Args:
         original_save_path: Folder containing the Microsoft save container and
             chunks.
+        all_containers: Load the saves of every container of the folder at
+            once instead of asking for one, then export them concurrently.
+        backup: Backup of ``original_save_path`` returned by
+            ``Scenario.ask_for_save_folder``, receiving the chunks of the
+            exported saves while they are read, then the other files.
 
     Raises:
         FileNotFoundError: If no container file is found in ``original_save_path``.
     """
+    import AstroSaveAPI as API
+    import AstroSaveScenario as Scenario
+    from cogs import AstroCompression
+    from cogs import AstroSaveMigration
+    from cogs import AstroSteamSaveFolder
+    from cogs import AstroTeePipeline
+    from cogs.AstroConvType import AstroConvType
+    from cogs.AstroSaveContainer import AstroSaveContainer as Container
+
     try:
         containers_list = Container.get_containers_list(original_save_path)
     except FileNotFoundError:
         Logger.logPrint(
             "No container found in the selected folder. Please choose another path."
         )
-        original_save_path = Scenario.ask_for_save_folder(AstroConvType.WIN2STEAM)
+        if backup is not None:
+            backup.close()
+        original_save_path, backup = Scenario.ask_for_save_folder(AstroConvType.WIN2STEAM)
         Logger.logPrint(f"User selected new path: {original_save_path}", "debug")
         containers_list = Container.get_containers_list(original_save_path)
 
     Logger.logPrint('\nContainers found:' + str(containers_list))
-    container_name = Scenario.ask_for_containers_to_convert(
-        containers_list) if len(containers_list) > 1 else containers_list[0]
-    container_url = utils.join_paths(original_save_path, container_name)
 
-    Logger.logPrint('\nInitializing Astroneer save container...')
-    container = Container(container_url)
-    Logger.logPrint(f'Detected chunks: {container.chunk_count}')
+    if all_containers:
+        Logger.logPrint('\nInitializing all the Astroneer save containers...')
+        save_list = AstroSaveMigration.load_newest_saves(original_save_path, containers_list)
+        container_url = original_save_path
+    else:
+        container_name = Scenario.ask_for_containers_to_convert(
+            containers_list) if len(containers_list) > 1 else containers_list[0]
+        container_url = utils.join_paths(original_save_path, container_name)
+
+        Logger.logPrint('\nInitializing Astroneer save container...')
+        container = Container(container_url)
+        Logger.logPrint(f'Detected chunks: {container.chunk_count}')
+        save_list = container.save_list
 
     Logger.logPrint('Container file loaded successfully !\n')
 
-    saves_to_export = Scenario.ask_saves_to_export(container.save_list, "Microsoft")
+    saves_to_export = Scenario.ask_saves_to_export(save_list, "Microsoft")
 
-    Scenario.ask_rename_saves(saves_to_export, container.save_list)
+    Scenario.ask_rename_saves(saves_to_export, save_list)
 
     to_path = AstroSteamSaveFolder.get_steam_save_folder()
     utils.make_dir_if_doesnt_exists(to_path)
@@ -76,14 +396,37 @@ def windows_to_steam_conversion(original_save_path: str) -> None:
     Logger.logPrint(f'\nExtracting saves {str([i+1 for i in saves_to_export])}')
     Logger.logPrint(f'Exporting to Steam folder: {to_path}', "debug")
 
-    for save_index in saves_to_export:
-        save = container.save_list[save_index]
-
-        Scenario.ask_overwrite_save_while_file_exists(save, to_path)
-        export_path = Scenario.export_save_to_steam(save, original_save_path, to_path)
-        Logger.logPrint(f"Container: {container_url} has been exported to {export_path}", "debug")
-
-        Logger.logPrint(f"\nSave {save.name} has been exported successfully to {export_path}")
+    selected_saves = [save_list[save_index] for save_index in saves_to_export]
+    compression = AstroCompression.export_compression
+    try:
+        if all_containers:
+            # The unchanged saves are skipped by the migration, according to the manifest
+            tasks = []
+            for save in selected_saves:
+                Scenario.ask_overwrite_save_while_file_exists(save, to_path, compression)
+                save_size = save.get_steam_size(original_save_path)
+                tasks.append(AstroSaveMigration.AstroMigrationTask(save, original_save_path, to_path, save_size))
+            AstroSaveMigration.run_migration(tasks, backups={original_save_path: backup} if backup else None)
+        else:
+            def ask_overwrite(save, _) -> bool:
+                # Either overwrites or renames the save, the export goes on in both cases
+                Scenario.ask_overwrite_save_while_file_exists(save, to_path, compression)
+                return True
+
+            results = API.export_to_steam(original_save_path, to_path, selected_saves, overwrite=ask_overwrite,
+                                          backup=backup, compression=compression,
+                                          level=AstroCompression.compression_level)
+            log_export_results(results)
+            Logger.logPrint(f"Container: {container_url} has been exported to {to_path}", "debug")
+        if backup is not None:
+            # Containers and saves that were not exported
+            AstroTeePipeline.backup_remaining_files(original_save_path, backup)
+    except BaseException:
+        if backup is not None:
+            Logger.logPrint(f'The backup {backup.close()} is incomplete', 'warning')
+        raise
+    if backup is not None:
+        Logger.logPrint(f'Save files copied to: {backup.close()}')
 
 
 def steam_to_windows_conversion(original_save_path: str) -> None:
@@ -95,6 +438,12 @@ def steam_to_windows_conversion(original_save_path: str) -> None:
     Raises:
         FileNotFoundError: If a save file to convert cannot be located.
     """
+    import AstroSaveAPI as API
+    import AstroSaveScenario as Scenario
+    from cogs.AstroExportJournal import AstroExportJournal
+    from cogs.AstroSave import AstroSave
+    from cogs.LoadingBar import LoadingBar
+
     Logger.logPrint('\n\n/!\\ WARNING /!\\')
     Logger.logPrint('/!\\ Astroneer needs to be closed longer than 20 seconds before we can start exporting your saves /!\\')
     Logger.logPrint('/!\\ More info and save restoring procedure are available on Github (cf. README) /!\\')
@@ -105,6 +454,10 @@ def steam_to_windows_conversion(original_save_path: str) -> None:
     if not microsoft_target_folder:
         utils.wait_and_exit(1)
 
+    if AstroExportJournal(microsoft_target_folder).saves:
+        Logger.logPrint(f'\nAn interrupted export was found in {microsoft_target_folder}, '
+                        f'run AstroSaveConverter --resume "{microsoft_target_folder}" to finish it')
+
     steamsave_files_list = AstroSave.get_steamsaves_list(original_save_path)
 
     saves_list = AstroSave.init_saves_list_from(steamsave_files_list)
@@ -120,49 +473,450 @@ def steam_to_windows_conversion(original_save_path: str) -> None:
     Logger.logPrint(f'\nExtracting saves {str([i+1 for i in saves_indexes_to_export])}')
     Logger.logPrint(f'Working folder: {original_save_path} Export to: {microsoft_target_folder}', "debug")
 
-    for save_index in saves_indexes_to_export:
-        save = saves_list[save_index]
-        original_save_full_path = utils.join_paths(original_save_path, original_saves_name[save_index]+'.savegame')
-        export_path = Scenario.export_save_to_xbox(save, original_save_full_path, microsoft_target_folder)
+    renames = {original_saves_name[save_index]: saves_list[save_index].name
+               for save_index in saves_indexes_to_export}
+    try:
+        results = API.export_to_xbox(original_save_path, microsoft_target_folder,
+                                     [original_saves_name[save_index] for save_index in saves_indexes_to_export],
+                                     renames)
+    except (KeyboardInterrupt, OSError):
+        Logger.logPrint(f'\nExport interrupted. Written chunks are kept, '
+                        f'run AstroSaveConverter --resume "{microsoft_target_folder}" to finish it')
+        raise
+    log_export_results(results)
+
+
+def log_export_results(results: list) -> None:
+    """Log the outcome of the ``AstroSaveAPI`` exports of the interactive mode."""
+    import AstroSaveAPI as API
+
+    skipped = [result for result in results if result.status == API.UNCHANGED]
+    for result in results:
+        if result.status == API.UNCHANGED:
+            Logger.logPrint(f'Save {result.name} is unchanged since its last export, skipping it')
+        elif result.status == API.EXPORTED:
+            Logger.logPrint(f"\nSave {result.name} has been exported successfully to {result.path}")
+    if skipped:
+        Logger.logPrint(f'\n{len(skipped)} unchanged save(s) skipped, '
+                        f'{sum(result.size for result in skipped) / 1024 / 1024:.2f} MB not converted again')
+
+
+def get_microsoft_save_folders(folders: list) -> list:
+    """Return ``folders``, or every Microsoft save folder of the computer if empty."""
+    if folders:
+        return folders
+    from cogs import AstroMicrosoftSaveFolder
+    return AstroMicrosoftSaveFolder.find_microsoft_save_folders()
+
+
+def watch_save_folder(args: Namespace) -> None:
+    """Mirror a Microsoft save folder into a Steam save folder until interrupted.
+
+    Args:
+        args: Parsed ``watch`` sub-command arguments.
+    """
+    from cogs.AstroSaveWatcher import AstroSaveWatcher
+
+    if not utils.is_folder_a_dir(args.source):
+        raise FileNotFoundError(f"Save folder not found: {args.source}")
+
+    watcher = AstroSaveWatcher(args.source, args.target, args.interval,
+                               args.debounce, args.minInterval)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        Logger.logPrint('\nWatch mode stopped')
+
+
+def migrate_all_saves(args: Namespace) -> bool:
+    """Convert every save of the Microsoft save folders to the Steam format.
+
+    Args:
+        args: Parsed ``migrate-all`` sub-command arguments.
+
+    Returns:
+        bool: ``True`` if every save has been converted or skipped.
+    """
+    from cogs import AstroSaveMigration
 
-        Logger.logPrint(f"\nSave {save.name} has been exported successfully to {export_path}")
+    source_folders = get_microsoft_save_folders(args.source)
+    Logger.logPrint(f'Migrating {len(source_folders)} Microsoft save folder(s) to {args.target}')
+
+    tasks = AstroSaveMigration.list_migration_tasks(source_folders, args.target)
+    tasks = AstroSaveMigration.order_migration_tasks(tasks, args.order)
+    tasks = AstroSaveMigration.run_migration(tasks, args.workers, args.ioLimit, args.backup)
+    return not any(task.error for task in tasks)
+
+
+def run_catalog_command(args: Namespace) -> None:
+    """Update or query the save catalog.
+
+    Args:
+        args: Parsed ``catalog`` sub-command arguments.
+    """
+    from cogs import AstroSaveCatalog
+
+    catalog = AstroSaveCatalog.AstroSaveCatalog(args.db or AstroSaveCatalog.DEFAULT_CATALOG_PATH)
+    try:
+        if args.catalog_command == "update":
+            counts = catalog.update(args.paths)
+            Logger.logPrint(f"{counts['indexed']} file(s) indexed, {counts['unchanged']} unchanged, "
+                            f"{counts['removed']} removed")
+            return
+
+        if args.catalog_command == "list":
+            saves = catalog.list_saves(args.platform)
+        elif args.catalog_command == "search":
+            saves = catalog.search(args.text, args.platform)
+        else:
+            saves = [save for save in catalog.newest(args.name)
+                     if not args.platform or save["platform"] == args.platform]
+
+        for save in saves:
+            Logger.logPrint(f"{save['date'] or '-':<20} {save['platform']:<10} {save['size'] / 1024 / 1024:>8.2f} MB  "
+                            f"{save['sha256'][:12]}  {save['name']}  {save['folder']}")
+        Logger.logPrint(f"{len(saves)} save(s)")
+    finally:
+        catalog.close()
+
+
+def print_command_error(error: Exception, as_json: bool) -> None:
+    """Print the error of a read-only command on one line of the error output.
+
+    Args:
+        error: Error raised by the command.
+        as_json: Print the error as a JSON object.
+    """
+    import json
+
+    message = " ".join(str(error).split()) or type(error).__name__
+    if as_json:
+        print(json.dumps({"error": message, "type": type(error).__name__}), file=sys.stderr)
+    else:
+        print(message, file=sys.stderr)
+
+
+def print_save_description(args: Namespace) -> int:
+    """Print the saves of a folder, container or Steam save file.
+
+    Nothing is logged to a file and nothing is asked, so that it can be
+    polled by scripts.
+
+    Args:
+        args: Parsed ``list`` or ``inspect`` sub-command arguments.
+
+    Returns:
+        int: Exit code, ``1`` if the path holds no save or can't be read.
+    """
+    import json
+    from cogs import AstroSaveInspector
+
+    try:
+        if args.command == "list":
+            description = AstroSaveInspector.describe_folder(args.path)
+        else:
+            description = AstroSaveInspector.describe(args.path)
+    except Exception as e:
+        print_command_error(e, args.json)
+        return 1
+
+    if args.json:
+        print(json.dumps(description, indent=1))
+    else:
+        print("\n".join(AstroSaveInspector.format_description(description)))
+    return 0
+
+
+def print_save_diff(args: Namespace) -> int:
+    """Print the differences between two snapshots of a Microsoft save folder.
+
+    Like ``list``, nothing is logged to a file and nothing is asked.
+
+    Args:
+        args: Parsed ``diff`` sub-command arguments.
+
+    Returns:
+        int: Exit code, ``0`` if the snapshots hold the same saves, ``1`` if
+            they differ and ``2`` if a snapshot can't be read.
+    """
+    import json
+    from cogs import AstroSaveDiff
+
+    try:
+        diff = AstroSaveDiff.diff_snapshots(args.old, args.new, args.files or args.hash, args.hash)
+    except Exception as e:
+        print_command_error(e, args.json)
+        return 2
+
+    if args.json:
+        print(json.dumps(diff.to_dict(), indent=1))
+    else:
+        print("\n".join(diff.format()))
+    return 1 if diff.has_differences() else 0
+
+
+def get_metrics_ledger_path() -> str:
+    """Return the path of the metrics ledger, next to the log file."""
+    from cogs import AstroMetrics
+
+    return os.path.join(os.getcwd(), "logs", AstroMetrics.LEDGER_FILE_NAME)
+
+
+def print_metrics_summary(args: Namespace) -> int:
+    """Print the percentiles of the metrics ledger per operation and version.
+
+    Args:
+        args: Parsed ``metrics`` sub-command arguments.
+
+    Returns:
+        int: Exit code, ``1`` if the ledger doesn't exist or can't be read.
+    """
+    import json
+    from cogs import AstroMetrics
+
+    ledger_path = args.ledger or get_metrics_ledger_path()
+    try:
+        records = AstroMetrics.read_ledger(ledger_path)
+    except FileNotFoundError:
+        print_command_error(FileNotFoundError(f"No metrics recorded yet in {ledger_path}"), args.json)
+        return 1
+    except Exception as e:
+        print_command_error(e, args.json)
+        return 1
+    if args.operation:
+        records = [record for record in records if record.get("operation") == args.operation]
+
+    summaries = AstroMetrics.summarize(records)
+    if args.json:
+        print(json.dumps(summaries, indent=1))
+    else:
+        print("\n".join(AstroMetrics.format_summary(summaries)))
+    return 0
+
+
+def restore_save_folder(args: Namespace) -> None:
+    """Restore a backed up save folder.
+
+    Args:
+        args: Parsed ``restore`` sub-command arguments.
+    """
+    from cogs import AstroSaveRestore
+
+    AstroSaveRestore.restore_save_folder(args.backup, args.target, args.hash, args.dryRun)
+
+
+def check_save_folders(args: Namespace) -> bool:
+    """Check the integrity of Microsoft save folders.
+
+    Args:
+        args: Parsed ``check`` sub-command arguments.
+
+    Returns:
+        bool: ``True`` if no problem was found.
+    """
+    from cogs import AstroSaveCheck
+
+    reports = AstroSaveCheck.check_save_folders(get_microsoft_save_folders(args.folders), args.workers)
+    AstroSaveCheck.log_reports(reports)
+    return all(report.is_healthy() for report in reports)
+
+
+def compact_save_folders(args: Namespace) -> None:
+    """Reclaim the space of orphaned chunks and dead saves.
+
+    Args:
+        args: Parsed ``compact`` sub-command arguments.
+    """
+    from cogs import AstroSaveCompaction
+
+    AstroSaveCompaction.compact_save_folders(get_microsoft_save_folders(args.folders), not args.apply)
+
+
+def plan_migration(args: Namespace, output=sys.stdout) -> None:
+    """Show the operations and cost of a migration without doing it.
+
+    Args:
+        args: Parsed ``plan`` sub-command arguments.
+        output: Where the JSON plan is printed.
+    """
+    import json
+    from cogs import AstroIOPlanner
+
+    if args.fromSteam:
+        plan = AstroIOPlanner.plan_xbox_export(args.fromSteam, args.target, args.backup)
+    else:
+        plan = AstroIOPlanner.plan_steam_migration(get_microsoft_save_folders(args.source), args.target, args.backup)
+
+    read_throughput = args.readRate * 1024 * 1024 if args.readRate else AstroIOPlanner.DEFAULT_READ_THROUGHPUT
+    write_throughput = args.writeRate * 1024 * 1024 if args.writeRate else AstroIOPlanner.DEFAULT_WRITE_THROUGHPUT
+    if args.measure:
+        # Saves inside a backup archive can't be read as plain files
+        read_paths = [operation.path for operation in sorted(plan.operations, key=lambda op: -op.read_bytes)
+                      if operation.kind == AstroIOPlanner.READ and utils.is_a_file(operation.path)]
+        if read_paths and not args.readRate:
+            read_throughput = AstroIOPlanner.measure_read_throughput(read_paths)
+        if not args.writeRate:
+            write_throughput = AstroIOPlanner.measure_write_throughput(args.target)
+
+    if args.json:
+        print(json.dumps(dict(plan.to_dict(), read_throughput=read_throughput, write_throughput=write_throughput,
+                              estimated_seconds=plan.estimate_duration(read_throughput, write_throughput)),
+                         indent=1), file=output)
+    else:
+        AstroIOPlanner.log_plan(plan, read_throughput, write_throughput)
+
+
+def run_conversion_service(args: Namespace) -> None:
+    """Serve conversion and backup jobs until interrupted.
+
+    Args:
+        args: Parsed ``serve`` sub-command arguments.
+    """
+    from cogs import AstroConversionService
+
+    token_path = args.tokenFile or os.path.join(os.getcwd(), "logs", "service_token")
+    AstroConversionService.serve(args.host, args.port, args.socket, args.workers, args.queueSize, token_path)
+
+
+def start_profiling() -> Callable[[], None]:
+    """Profile the run until the returned function writes the reports in the logs folder.
+
+    The reports are also written before the final prompt, not to profile the
+    time the user takes to answer it.
+    """
+    from cogs.AstroProfiler import AstroProfiler
+
+    profiler = AstroProfiler(os.path.join(os.getcwd(), "logs"), APP_VERSION)
+
+    def write_reports() -> None:
+        utils.set_exit_hook(None)
+        if profiler.stopped.is_set():
+            return
+        stats_path, report_path = profiler.stop()
+        # On the error output, so that the output of list, inspect and diff is unchanged
+        print(f"Profile written to {report_path} and {stats_path}", file=sys.stderr)
+
+    utils.set_exit_hook(write_reports)
+    profiler.start()
+    return write_reports
+
+
+def configure_io(args: Namespace) -> None:
+    """Apply the I/O and compression options shared by every command.
+
+    Args:
+        args: Parsed command-line arguments.
+    """
+    utils.configure_io(args.bufferSize * 1024 if args.bufferSize else None,
+                       False if args.keepPageCache else None)
+    if args.maxRate or args.background:
+        from cogs import AstroIOThrottle
+        if args.maxRate:
+            AstroIOThrottle.configure(args.maxRate * 1024 * 1024,
+                                      args.burst * 1024 * 1024 if args.burst else None)
+        if args.background:
+            AstroIOThrottle.lower_io_priority()
+    if args.compress or args.backupFormat != "folder" or args.compressLevel is not None:
+        from cogs import AstroCompression
+        AstroCompression.configure(args.compress, args.backupFormat, args.compressLevel)
 
 
 if __name__ == "__main__":
+    args = None
+    stop_profiling = None
     try:
+        args = get_args()
+        if args.profile:
+            stop_profiling = start_profiling()
+        if args.command in ("list", "inspect"):
+            sys.exit(print_save_description(args))
+        if args.command == "diff":
+            sys.exit(print_save_diff(args))
+        if args.command == "metrics":
+            sys.exit(print_metrics_summary(args))
+        output = sys.stdout
+        if args.command == "plan" and args.json:
+            # The logs go to the error output, so that only the plan is on the standard output
+            sys.stdout = sys.stderr
+
         Logger.setup_logging(os.getcwd())
         Logger.logPrint(f"Starting AstroSaveConverter version {APP_VERSION}")
+        from cogs import AstroMetrics
+        AstroMetrics.configure(get_metrics_ledger_path(), APP_VERSION)
 
-        try:
+        if os.name == "nt":
             os.system(f"title AstroSaveConverter {APP_VERSION} - Convert your Astroneer saves between Microsoft and Steam")
-        except:
-            pass
-
-        args = get_args()
 
-        conversion_type = Scenario.ask_conversion_type()
-
-        try:
-            if not args.savesPath:
-                original_save_path = Scenario.ask_for_save_folder(conversion_type)
-            else:
-                original_save_path = args.savesPath
-                if not utils.is_path_exists(original_save_path):
-                    raise FileNotFoundError
-        except FileNotFoundError as e:
-            Logger.logPrint('\nSave folder or container not found, press any key to exit')
-            Logger.logPrint(e, 'exception')
-            utils.wait_and_exit(1)
-
-        if conversion_type == AstroConvType.WIN2STEAM:
-            windows_to_steam_conversion(original_save_path)
-        elif conversion_type == AstroConvType.STEAM2WIN:
-            steam_to_windows_conversion(original_save_path)
+        configure_io(args)
+
+        if args.command == "watch":
+            watch_save_folder(args)
+            sys.exit(0)
+        if args.command == "migrate-all":
+            sys.exit(0 if migrate_all_saves(args) else 1)
+        if args.command == "restore":
+            restore_save_folder(args)
+            sys.exit(0)
+        if args.command == "check":
+            sys.exit(0 if check_save_folders(args) else 1)
+        if args.command == "compact":
+            compact_save_folders(args)
+            sys.exit(0)
+        if args.command == "catalog":
+            run_catalog_command(args)
+            sys.exit(0)
+        if args.command == "plan":
+            plan_migration(args, output)
+            sys.exit(0)
+        if args.command == "serve":
+            run_conversion_service(args)
+            sys.exit(0)
+
+        import AstroSaveScenario as Scenario
+        from cogs import AstroSaveStorage
+        from cogs.AstroConvType import AstroConvType
+
+        conversion_type = None
+        if args.resume:
+            if Scenario.resume_xbox_export(args.resume) is None:
+                Logger.logPrint('Falling back to a full Steam to Microsoft export')
+                conversion_type = AstroConvType.STEAM2WIN
+        else:
+            conversion_type = Scenario.ask_conversion_type()
+
+        if conversion_type is not None:
+            backup = None
+            try:
+                if not args.savesPath:
+                    original_save_path, backup = Scenario.ask_for_save_folder(conversion_type)
+                else:
+                    original_save_path = args.savesPath
+                    if (not utils.is_path_exists(original_save_path)
+                            and AstroSaveStorage.split_archive_path(original_save_path) is None):
+                        raise FileNotFoundError
+            except FileNotFoundError as e:
+                Logger.logPrint('\nSave folder or container not found, press any key to exit')
+                Logger.logPrint(e, 'exception')
+                utils.wait_and_exit(1)
+
+            if conversion_type == AstroConvType.WIN2STEAM:
+                windows_to_steam_conversion(original_save_path, args.allContainers, backup)
+            elif conversion_type == AstroConvType.STEAM2WIN:
+                steam_to_windows_conversion(original_save_path)
 
         Logger.logPrint(f'\nTask completed, press any key to exit')
         Logger.logPrint("\n" + "-" * 60 + "\n")
         utils.wait_and_exit(0)
+    except KeyboardInterrupt:
+        Logger.logPrint('Interrupted by the user', 'warning')
+        sys.exit(1)
     except Exception as e:
         Logger.logPrint(e)
         Logger.logPrint('', 'exception')
+        if args is not None and args.command:
+            # Sub-commands are meant to be run unattended, only the interactive conversion waits for a key
+            sys.exit(1)
         utils.wait_and_exit(1)
+    finally:
+        if stop_profiling is not None:
+            stop_profiling()
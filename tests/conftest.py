@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import AstroSaveScenario as scenario
+from cogs.AstroSave import AstroSave
+
+
+@pytest.fixture(autouse=True)
+def xbox_manifests_folder(tmp_path, monkeypatch):
+    """Keep the manifests of the Microsoft save folders out of the working directory."""
+    monkeypatch.setattr('cogs.AstroConversionManifest.XBOX_MANIFESTS_FOLDER', str(tmp_path / 'manifests'))
+
+
+@pytest.fixture
+def make_xbox_save(tmp_path):
+    """Return a helper adding a save made of random bytes to a wgs folder."""
+    steam_folder = tmp_path / 'steam_source'
+    steam_folder.mkdir(exist_ok=True)
+
+    def _make(wgs_folder, name, size=1000, date='2024.01.01-00.00.00'):
+        save_name = f'{name}${date}'
+        steam_file = steam_folder / f'{save_name}.savegame'
+        steam_file.write_bytes(os.urandom(size))
+        save = AstroSave(save_name, [])
+        scenario.export_save_to_xbox(save, str(steam_file), str(wgs_folder))
+        return save
+
+    return _make
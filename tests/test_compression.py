@@ -0,0 +1,75 @@
+import bz2
+import gzip
+import lzma
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import AstroSaveScenario as scenario
+from cogs import AstroCompression
+from cogs import AstroSaveStorage
+from cogs import AstroTeePipeline
+
+DECOMPRESSORS = {'xz': lzma.open, 'gz': gzip.open, 'bz2': bz2.open}
+
+
+@pytest.fixture(autouse=True)
+def reset_compression():
+    yield
+    AstroCompression.configure()
+
+
+@pytest.mark.parametrize('compression', AstroCompression.COMPRESSIONS)
+def test_steam_export_is_compressed(tmp_path, make_xbox_save, compression):
+    wgs = tmp_path / 'wgs'
+    wgs.mkdir()
+    save = make_xbox_save(wgs, 'ONE', size=50000)
+    target = tmp_path / 'SaveGames'
+    target.mkdir()
+
+    export_path = scenario.export_save_to_steam(save, str(wgs), str(target), compression=compression, level=1)
+
+    assert export_path.endswith(f'.savegame.{compression}')
+    with DECOMPRESSORS[compression](export_path) as exported:
+        assert exported.read() == save.convert_to_steam(str(wgs)).getvalue()
+
+
+@pytest.mark.parametrize('backup_format', ['zip', 'tar.gz', 'tar.xz', 'tar.bz2'])
+def test_backup_archive_holds_the_folder(tmp_path, backup_format):
+    source = tmp_path / 'source'
+    (source / 'sub').mkdir(parents=True)
+    files = {'container.1': os.urandom(1000), 'sub/CHUNK': os.urandom(3000)}
+    for name, content in files.items():
+        (source / name).write_bytes(content)
+
+    AstroCompression.configure(backup=backup_format)
+    archive_path, size = AstroCompression.backup_folder(str(source), str(tmp_path / 'backup'))
+
+    assert archive_path == str(tmp_path / f'backup.{backup_format}')
+    assert size == os.path.getsize(archive_path)
+    if backup_format == 'zip':
+        with zipfile.ZipFile(archive_path) as archive:
+            assert {name: archive.read(name) for name in archive.namelist()} == files
+    else:
+        with tarfile.open(archive_path) as archive:
+            assert {info.name: archive.extractfile(info).read()
+                    for info in archive.getmembers()} == files
+
+
+def test_backup_of_a_shrunk_file_is_reported(tmp_path, monkeypatch):
+    source = tmp_path / 'source'
+    source.mkdir()
+    (source / 'container.1').write_bytes(os.urandom(1000))
+    real_get_size = AstroSaveStorage.FolderStorage.get_size
+    # The file shrank between the size lookup and its reading
+    monkeypatch.setattr(AstroSaveStorage.FolderStorage, 'get_size',
+                        lambda storage, name: real_get_size(storage, name) + 10)
+
+    AstroCompression.configure(backup='tar.gz')
+    backup = AstroTeePipeline.open_backup(str(tmp_path / 'backup'))
+    with pytest.raises(OSError, match='changed while being backed up'):
+        AstroTeePipeline.backup_remaining_files(str(source), backup)
+    with tarfile.open(backup.close()) as archive:
+        assert archive.getmember('container.1').size == 1010
@@ -0,0 +1,47 @@
+import os
+
+import AstroSaveScenario as scenario
+from cogs.AstroConversionManifest import AstroConversionManifest
+from cogs.AstroSave import AstroSave
+from cogs.AstroSaveContainer import AstroSaveContainer
+
+
+def test_steam_export_skipped_until_output_or_source_changes(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    target = tmp_path / 'SaveGames'
+    target.mkdir()
+    make_xbox_save(wgs, 'ONE')
+    save = AstroSaveContainer(str(next(wgs.glob('container.*')))).save_list[0]
+
+    manifest = AstroConversionManifest(str(target))
+    assert not manifest.is_steam_export_up_to_date(save, str(wgs))
+    export_path = scenario.export_save_to_steam(save, str(wgs), str(target))
+    manifest.record_steam_export(save, str(wgs))
+    manifest.save()
+
+    manifest = AstroConversionManifest(str(target))
+    assert manifest.is_steam_export_up_to_date(save, str(wgs))
+
+    with open(export_path, 'ab') as output:
+        output.write(b'edited')
+    assert not manifest.is_steam_export_up_to_date(save, str(wgs))
+
+
+def test_xbox_export_skipped_while_source_unchanged(tmp_path):
+    steam_file = tmp_path / 'ONE$2024.01.01-00.00.00.savegame'
+    steam_file.write_bytes(os.urandom(100))
+    wgs = tmp_path / 'wgs'
+    save = AstroSave('ONE$2024.01.01-00.00.00', [])
+
+    manifest = AstroConversionManifest(str(wgs), xbox=True)
+    scenario.export_save_to_xbox(save, str(steam_file), str(wgs))
+    manifest.record_xbox_export(save, str(steam_file))
+    manifest.save()
+
+    # The game owns the folder, the manifest is kept out of it
+    assert not any(name.startswith('.') for name in os.listdir(wgs))
+    manifest = AstroConversionManifest(str(wgs), xbox=True)
+    assert manifest.is_xbox_export_up_to_date(save, str(steam_file))
+
+    os.remove(wgs / save.chunks_names[0])
+    assert not manifest.is_xbox_export_up_to_date(save, str(steam_file))
@@ -0,0 +1,144 @@
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+from cogs import AstroConversionService as Service
+from cogs.AstroServiceClient import AstroServiceClient, LocalServiceClient, ServiceRequestError
+
+
+@pytest.fixture
+def service():
+    service = Service.AstroConversionService(workers=2, queue_size=4)
+    service.start()
+    yield service
+    service.stop()
+
+
+def test_jobs_convert_with_warm_container_cache(tmp_path, make_xbox_save, service):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'ONE', size=300)
+    client = LocalServiceClient(service)
+
+    assert [save['name'] for save in client.list_saves(str(wgs))] == ['ONE$2024.01.01-00.00.00']
+    job = client.submit('export_to_steam', str(wgs), str(tmp_path / 'steam'))
+    job = client.wait(job['id'], timeout=10)
+
+    assert job['status'] == Service.DONE
+    assert [(result['name'], result['status']) for result in job['result']] == [('ONE$2024.01.01-00.00.00', 'exported')]
+    assert job['done_bytes'] == job['total_bytes'] == 300
+    assert (tmp_path / 'steam' / 'ONE$2024.01.01-00.00.00.savegame').stat().st_size == 300
+
+    metrics = client.get_metrics()
+    assert (metrics['cache_misses'], metrics['cache_hits']) == (1, 1)
+    assert metrics['jobs'][Service.DONE] == 1
+    assert metrics['converted_bytes'] == 300
+
+    # A new save changes the container, which is parsed again
+    make_xbox_save(wgs, 'TWO', size=10)
+    assert len(client.list_saves(str(wgs))) == 2
+    assert client.get_metrics()['cache_misses'] == 2
+
+
+def test_invalid_and_failed_jobs(tmp_path, service):
+    client = LocalServiceClient(service)
+
+    with pytest.raises(ServiceRequestError) as error:
+        client.submit('export_to_steam', str(tmp_path), str(tmp_path / 'steam'), unknown=True)
+    assert error.value.status == 400
+
+    job = client.wait(client.submit('export_to_steam', str(tmp_path / 'missing'), str(tmp_path / 'steam'))['id'], 10)
+    assert job['status'] == Service.FAILED
+    assert 'FileNotFoundError' in job['error']
+
+    with pytest.raises(ServiceRequestError) as error:
+        client.get_job(1234)
+    assert error.value.status == 404
+
+
+def test_queue_is_bounded(tmp_path):
+    service = Service.AstroConversionService(workers=1, queue_size=1)
+    client = LocalServiceClient(service)
+
+    client.submit('backup', str(tmp_path), str(tmp_path / 'backup'))
+    with pytest.raises(ServiceRequestError) as error:
+        client.submit('backup', str(tmp_path), str(tmp_path / 'backup'))
+    assert error.value.status == 503
+    assert client.get_metrics()['rejected_jobs'] == 1
+
+
+def test_http_round_trip(tmp_path, make_xbox_save, service):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'ONE', size=100)
+    server = Service.create_server(service, port=0, token_path=str(tmp_path / 'token'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = AstroServiceClient(port=server.server_address[1], token_path=str(tmp_path / 'token'))
+        job = client.wait(client.submit('backup', str(wgs), str(tmp_path / 'backup'), archive_format='zip')['id'], 10)
+        assert job['status'] == Service.DONE
+        assert job['result']['path'].endswith('.zip')
+        assert client.list_jobs()[0]['id'] == job['id']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_bad_arguments_are_refused_and_workers_survive_failures(tmp_path, monkeypatch, service):
+    for body in ({'type': 'backup', 'source': str(tmp_path), 'target': None},
+                 {'type': 'backup', 'source': str(tmp_path), 'target': 'x', 'archive_format': 'rar'},
+                 {'type': 'backup', 'source': str(tmp_path), 'target': 'x', 'level': '9'},
+                 {'type': 'export_to_steam', 'source': 1, 'target': 'x'}):
+        status, content = service.handle('POST', '/jobs', json.dumps(body).encode())
+        assert status == 400, content
+    assert service.jobs == {}
+
+    def crash(*_, **__):
+        raise TypeError('unexpected')
+    monkeypatch.setattr(Service.API, 'backup', crash)
+    client = LocalServiceClient(service)
+    for _ in range(3):
+        job = client.wait(client.submit('backup', str(tmp_path), str(tmp_path / 'backup'))['id'], 10)
+        assert job['status'] == Service.FAILED
+        assert job['error'] == 'TypeError: unexpected'
+
+
+def test_http_requests_need_the_token_and_json(tmp_path, service):
+    token_path = tmp_path / 'token'
+    server = Service.create_server(service, port=0, token_path=str(token_path))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    body = json.dumps({'type': 'backup', 'source': str(tmp_path), 'target': str(tmp_path / 'backup')})
+    try:
+        assert os.stat(token_path).st_mode & 0o777 == 0o600
+        for headers, status in (({'Content-Type': 'application/json'}, 401),
+                                ({'Content-Type': 'text/plain', 'Authorization': f'Bearer {token_path.read_text()}'},
+                                 415)):
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+            connection.request('POST', '/jobs', body, headers)
+            assert connection.getresponse().status == status
+            connection.close()
+        assert service.jobs == {}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_backups_never_replace_other_folders(tmp_path, service):
+    (tmp_path / 'save').mkdir()
+    (tmp_path / 'save' / 'container.1').write_bytes(b'\0' * 8)
+    (tmp_path / 'documents').mkdir()
+    (tmp_path / 'documents' / 'notes.txt').write_text('keep me')
+    client = LocalServiceClient(service)
+
+    job = client.wait(client.submit('backup', str(tmp_path / 'save'), str(tmp_path / 'documents'))['id'], 10)
+    assert job['status'] == Service.FAILED
+    assert 'FileExistsError' in job['error']
+    assert (tmp_path / 'documents' / 'notes.txt').read_text() == 'keep me'
+
+    # A previous backup is replaced
+    for _ in range(2):
+        job = client.wait(client.submit('backup', str(tmp_path / 'save'), str(tmp_path / 'backup'))['id'], 10)
+        assert job['status'] == Service.DONE
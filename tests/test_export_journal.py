@@ -0,0 +1,80 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+import AstroSaveScenario as scenario
+import utils
+from cogs.AstroConversionManifest import AstroConversionManifest
+from cogs.AstroSave import AstroSave
+from cogs.AstroSaveContainer import AstroSaveContainer
+from cogs.AstroExportJournal import AstroExportJournal, JOURNAL_FILE_NAME
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr('cogs.AstroSave.XBOX_CHUNK_SIZE', 100)
+    monkeypatch.setattr('cogs.AstroExportJournal.XBOX_CHUNK_SIZE', 100)
+
+
+def test_interrupted_export_is_resumed_from_last_chunk(tmp_path, small_chunks):
+    content = os.urandom(250)
+    steam_file = tmp_path / 'BIG$2024.01.01-00.00.00.savegame'
+    steam_file.write_bytes(content)
+    wgs = tmp_path / 'wgs'
+    save = AstroSave('BIG$2024.01.01-00.00.00', [])
+
+    real_write = utils.write_buffer_to_file
+    calls = []
+
+    def crash_on_second_chunk(target, buffer, durable=False):
+        calls.append(target)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        real_write(target, buffer, durable)
+
+    with patch('utils.write_buffer_to_file', side_effect=crash_on_second_chunk):
+        with pytest.raises(KeyboardInterrupt):
+            scenario.export_save_to_xbox(save, str(steam_file), str(wgs))
+
+    journal = AstroExportJournal(str(wgs))
+    assert journal.saves[save.name]['written'] == [0]
+    first_chunk_mtime = os.stat(wgs / save.chunks_names[0]).st_mtime_ns
+
+    assert scenario.resume_xbox_export(str(wgs)) == [save.name]
+
+    assert os.stat(wgs / save.chunks_names[0]).st_mtime_ns == first_chunk_mtime
+    assert not (wgs / '.astrosaveconverter_journal.json').exists()
+    container = AstroSaveContainer(str(wgs / 'container.1'))
+    assert [s.name for s in container.save_list] == [save.name]
+    assert container.save_list[0].convert_to_steam(str(wgs)).getvalue() == content
+
+
+def test_damaged_journal_is_not_resumed(tmp_path):
+    wgs = tmp_path / 'wgs'
+    wgs.mkdir()
+    (wgs / JOURNAL_FILE_NAME).write_text('{"BIG$2024.01.01-00.00.00": {"source": "BIG.sav')
+
+    assert AstroExportJournal(str(wgs)).damaged
+    assert scenario.resume_xbox_export(str(wgs)) is None
+
+    (wgs / JOURNAL_FILE_NAME).write_text('{"BIG$2024.01.01-00.00.00": {"source": "BIG.savegame"}}')
+    assert AstroExportJournal(str(wgs)).saves == {}
+
+
+def test_export_interrupted_after_the_container_is_completed(tmp_path, small_chunks):
+    steam_file = tmp_path / 'BIG$2024.01.01-00.00.00.savegame'
+    steam_file.write_bytes(os.urandom(250))
+    wgs = tmp_path / 'wgs'
+    save = AstroSave('BIG$2024.01.01-00.00.00', [])
+
+    with patch.object(AstroExportJournal, 'commit_save', side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            scenario.export_save_to_xbox(save, str(steam_file), str(wgs))
+    assert save.name in AstroExportJournal(str(wgs)).saves
+
+    assert scenario.resume_xbox_export(str(wgs)) == [save.name]
+
+    assert not (wgs / JOURNAL_FILE_NAME).exists()
+    manifest = AstroConversionManifest(str(wgs), xbox=True)
+    assert manifest.is_xbox_export_up_to_date(save, str(steam_file))
@@ -0,0 +1,58 @@
+import errno
+import os
+
+import pytest
+
+import utils
+
+
+def test_ensure_free_space_fails_before_writing(tmp_path):
+    with pytest.raises(OSError) as error:
+        utils.ensure_free_space(str(tmp_path), 1 << 60)
+    assert error.value.errno == errno.ENOSPC
+
+
+def test_replaced_file_counts_as_free_space(tmp_path, monkeypatch):
+    existing = tmp_path / 'save.savegame'
+    existing.write_bytes(b'x' * 100)
+    monkeypatch.setattr('shutil.disk_usage', lambda path: type('usage', (), {'free': 50}))
+    utils.ensure_free_space(str(tmp_path), 120, str(existing))
+    with pytest.raises(OSError):
+        utils.ensure_free_space(str(tmp_path), 120)
+
+
+def test_write_blocks_to_file_keeps_only_written_bytes(tmp_path):
+    target = tmp_path / 'out'
+    assert utils.write_blocks_to_file(str(target), iter([b'abc', b'de']), 4096) == 5
+    assert target.read_bytes() == b'abcde'
+
+
+def test_token_bucket_allows_burst_then_sustained_rate():
+    from cogs.AstroIOThrottle import TokenBucket
+
+    now = [0.0]
+    waits = []
+
+    def sleep(duration):
+        waits.append(duration)
+        now[0] += duration
+
+    bucket = TokenBucket(rate=100, burst=200, clock=lambda: now[0], sleep=sleep)
+    assert bucket.consume(200) == 0
+    assert bucket.consume(50) == pytest.approx(0.5)
+    now[0] += 10
+    assert bucket.consume(150) == 0
+    assert waits == [pytest.approx(0.5)]
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='POSIX permissions')
+def test_atomic_writes_keep_the_file_permissions(tmp_path):
+    existing = tmp_path / 'container.1'
+    existing.write_bytes(b'old')
+    os.chmod(existing, 0o640)
+
+    utils.write_file_atomically(str(existing), b'new')
+    utils.write_file_atomically(str(tmp_path / 'new'), b'new')
+
+    assert existing.stat().st_mode & 0o777 == 0o640
+    assert (tmp_path / 'new').stat().st_mode & 0o777 == 0o666 & ~utils.UMASK
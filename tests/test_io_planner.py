@@ -0,0 +1,50 @@
+import os
+
+from cogs import AstroIOPlanner as Planner
+from cogs.AstroConversionManifest import AstroConversionManifest
+from cogs.AstroSave import XBOX_CHUNK_SIZE
+from cogs.AstroSaveContainer import AstroSaveContainer
+import AstroSaveScenario as scenario
+
+
+def test_steam_migration_plan_touches_nothing(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    target = tmp_path / 'SaveGames'
+    exported = make_xbox_save(wgs, 'DONE', size=100)
+    pending = make_xbox_save(wgs, 'TODO', size=300)
+    target.mkdir()
+    save = AstroSaveContainer(str(next(wgs.glob('container.*')))).save_list[0]
+    scenario.export_save_to_steam(save, str(wgs), str(target))
+    manifest = AstroConversionManifest(str(target))
+    manifest.record_steam_export(save, str(wgs))
+    manifest.save()
+    before = sorted(os.listdir(target))
+
+    plan = Planner.plan_steam_migration([str(wgs)], str(target), str(tmp_path / 'backup'))
+
+    assert [(operation.kind, operation.save_name) for operation in plan.operations[:3]] == [
+        (Planner.SKIP, exported.name), (Planner.READ, pending.name), (Planner.WRITE, pending.name)]
+    container_size = os.path.getsize(next(wgs.glob('container.*')))
+    # The chunks of the converted save are backed up without being read again
+    assert plan.get_read_bytes() == 300 + 100 + container_size
+    assert plan.get_written_bytes() == 300 + 400 + container_size
+    assert plan.get_created_files() == 1 + 3
+    assert sorted(os.listdir(target)) == before
+    assert not (tmp_path / 'backup').exists()
+
+
+def test_xbox_export_plan_counts_chunks_and_container_edits(tmp_path):
+    steam = tmp_path / 'steam'
+    steam.mkdir()
+    (steam / 'BIG$2024.01.01-00.00.00.savegame').write_bytes(b'\0' * (XBOX_CHUNK_SIZE + 10))
+    (steam / 'SMALL$2024.01.01-00.00.00.savegame').write_bytes(b'\0' * 10)
+
+    plan = Planner.plan_xbox_export(str(steam), str(tmp_path / 'wgs'))
+
+    writes = [operation for operation in plan.operations if operation.kind == Planner.WRITE]
+    assert [operation.written_bytes for operation in writes] == [XBOX_CHUNK_SIZE, 10, 10]
+    edits = [operation for operation in plan.operations if operation.kind == Planner.CONTAINER_EDIT]
+    assert [operation.written_bytes for operation in edits] == [8 + 2 * 160, 8 + 3 * 160]
+    assert plan.get_required_space() == {str(tmp_path / 'wgs'): XBOX_CHUNK_SIZE + 20 + 328 + 488}
+    assert plan.estimate_duration(1024, 2048) > 0
+    assert not (tmp_path / 'wgs').exists()
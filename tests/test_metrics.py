@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+import AstroSaveAPI as API
+from cogs import AstroMetrics
+from cogs import AstroSaveCheck
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    path = tmp_path / 'logs' / AstroMetrics.LEDGER_FILE_NAME
+    AstroMetrics.configure(str(path), '9.9')
+    yield path
+    AstroMetrics.configure()
+
+
+def test_conversions_backups_and_scans_are_recorded(tmp_path, make_xbox_save, ledger):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'ONE', size=300)
+    ledger.unlink()
+
+    API.export_to_steam(str(wgs), str(tmp_path / 'steam'))
+    API.backup(str(wgs), str(tmp_path / 'backup'))
+    with pytest.raises(FileNotFoundError):
+        API.backup(str(tmp_path / 'missing'), str(tmp_path / 'backup2'))
+    AstroSaveCheck.check_save_folders([str(wgs)])
+
+    records = AstroMetrics.read_ledger(str(ledger))
+    # Parsing a container to convert it is not a scan of its own
+    assert [(record['operation'], record['direction'], record['status']) for record in records] == [
+        (AstroMetrics.CONVERSION, AstroMetrics.MICROSOFT_TO_STEAM, AstroMetrics.OK),
+        (AstroMetrics.BACKUP, 'folder', AstroMetrics.OK),
+        (AstroMetrics.BACKUP, 'folder', AstroMetrics.FAILED),
+        (AstroMetrics.SCAN, None, AstroMetrics.OK),
+    ]
+    conversion, backup, _, scan = records
+    assert (backup['size'], backup['chunk_count']) == (300 + (wgs / 'container.1').stat().st_size, 2)
+    assert (scan['size'], scan['chunk_count']) == ((wgs / 'container.1').stat().st_size, 1)
+    assert (conversion['version'], conversion['size'], conversion['chunk_count']) == ('9.9', 300, 1)
+    assert set(conversion['phases']) == {'prepare', 'read', 'write'}
+    assert sum(conversion['phases'].values()) <= conversion['duration']
+    assert conversion['peak_rss'] > 0
+
+
+def test_summary_percentiles_per_operation_and_version(tmp_path):
+    ledger = tmp_path / 'metrics.jsonl'
+    lines = [json.dumps({'operation': AstroMetrics.CONVERSION, 'direction': AstroMetrics.STEAM_TO_MICROSOFT,
+                         'version': version, 'status': AstroMetrics.OK, 'size': 1024 * 1024, 'duration': duration,
+                         'mb_per_s': 1 / duration, 'phases': {'chunks': duration}, 'peak_rss': 1024})
+             for version, duration in [('1.0', 1), ('1.0', 2), ('1.0', 3), ('1.0', 4), ('1.0', 5), ('2.0', 10)]]
+    ledger.write_text('\n'.join(lines) + '\n{"cut by a crash')
+    AstroMetrics.configure(str(ledger), '2.0')
+    try:
+        with pytest.raises(OSError), AstroMetrics.measure(AstroMetrics.CONVERSION, AstroMetrics.STEAM_TO_MICROSOFT):
+            raise OSError
+    finally:
+        AstroMetrics.configure()
+
+    old, new = AstroMetrics.summarize(AstroMetrics.read_ledger(str(ledger)))
+
+    assert (old['version'], old['count'], old['failed'], old['total_bytes']) == ('1.0', 5, 0, 5 * 1024 * 1024)
+    assert old['duration'] == {'p50': 3, 'p90': 4.6, 'p99': 4.96}
+    assert old['phases']['chunks']['p50'] == 3
+    assert (new['version'], new['count'], new['failed']) == ('2.0', 2, 1)
+    assert new['duration']['p99'] == 10
+    assert 'conversion steam_to_microsoft (version 2.0): 2 operation(s), 1 failed' in AstroMetrics.format_summary(
+        [old, new])[6]
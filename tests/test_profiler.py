@@ -0,0 +1,44 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+import time
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def test_profile_writes_reports_in_the_logs_folder(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    wgs.mkdir()
+    make_xbox_save(wgs, 'WORLD', size=100)
+
+    result = subprocess.run([sys.executable, MAIN_PATH, '--profile', 'list', str(wgs), '--json'], cwd=tmp_path,
+                            stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True)
+
+    assert json.loads(result.stdout)['saves'][0]['name'] == 'WORLD$2024.01.01-00.00.00'
+    assert 'Profile written to' in result.stderr
+    stats_file, = (tmp_path / 'logs').glob('profile_*.pstats')
+    report = stats_file.with_suffix('.txt').read_text()
+    assert 'Peak RSS' in report
+    assert 'describe_folder' in report
+    assert any('describe_folder' in function for _, _, function in pstats.Stats(str(stats_file)).stats)
+
+
+def test_profile_is_written_before_the_final_prompt(tmp_path):
+    # The prompt waits forever on an open standard input, the reports must already be written
+    process = subprocess.Popen([sys.executable, MAIN_PATH, '--profile', '-p', str(tmp_path / 'missing')],
+                               cwd=tmp_path, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True)
+    try:
+        # Microsoft to Steam, then the save folder is not found
+        process.stdin.write('1\n')
+        process.stdin.flush()
+        deadline = time.monotonic() + 60
+        while not list((tmp_path / 'logs').glob('profile_*.txt')) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert list((tmp_path / 'logs').glob('profile_*.txt'))
+        _, stderr = process.communicate('\n', timeout=60)
+    finally:
+        process.kill()
+    assert stderr.count('Profile written to') == 1
@@ -0,0 +1,113 @@
+import hashlib
+import lzma
+import os
+
+import pytest
+
+import AstroSaveAPI as API
+import utils
+from cogs import AstroCompression
+from cogs import AstroTeePipeline
+
+
+def test_export_to_steam_round_trip_without_output(tmp_path, make_xbox_save, capsys):
+    wgs = tmp_path / 'wgs'
+    steam = tmp_path / 'SaveGames'
+    make_xbox_save(wgs, 'ONE', size=300)
+    make_xbox_save(wgs, 'TWO', size=200, date='2024.02.01-00.00.00')
+
+    saves = API.list_saves(str(wgs))
+    assert [(save.name, save.platform, save.size) for save in saves] == [
+        ('ONE$2024.01.01-00.00.00', API.MICROSOFT, 300),
+        ('TWO$2024.02.01-00.00.00', API.MICROSOFT, 200),
+    ]
+
+    progress = []
+    results = API.export_to_steam(str(wgs), str(steam), ['TWO'], progress=lambda done, total: progress.append((done, total)))
+    assert [(result.name, result.status) for result in results] == [('TWO$2024.02.01-00.00.00', API.EXPORTED)]
+    content = (steam / 'TWO$2024.02.01-00.00.00.savegame').read_bytes()
+    assert results[0].sha256 == hashlib.sha256(content).hexdigest()
+    assert progress[-1] == (200, 200)
+
+    results = API.export_to_steam(str(wgs), str(steam))
+    assert [result.status for result in results] == [API.EXPORTED, API.UNCHANGED]
+
+    back = tmp_path / 'back'
+    results = API.export_to_xbox(str(steam), str(back), renames={'ONE$2024.01.01-00.00.00': 'NEW$2024.01.01-00.00.00'})
+    assert [result.name for result in results] == ['NEW$2024.01.01-00.00.00', 'TWO$2024.02.01-00.00.00']
+    assert sorted(save.name for save in API.list_saves(str(back))) == ['NEW$2024.01.01-00.00.00', 'TWO$2024.02.01-00.00.00']
+    assert capsys.readouterr().out == ''
+
+
+
+def test_api_ignores_the_configured_compression(tmp_path, make_xbox_save, monkeypatch, capsys):
+    wgs = tmp_path / 'wgs'
+    steam = tmp_path / 'SaveGames'
+    make_xbox_save(wgs, 'ONE', size=300)
+    monkeypatch.setattr(AstroCompression, 'export_compression', 'gz')
+
+    results = API.export_to_steam(str(wgs), str(steam), compression='xz', level=1)
+    assert results[0].path == str(steam / 'ONE$2024.01.01-00.00.00.savegame.xz')
+    assert lzma.decompress((steam / 'ONE$2024.01.01-00.00.00.savegame.xz').read_bytes()) == \
+        (wgs.parent / 'steam_source' / 'ONE$2024.01.01-00.00.00.savegame').read_bytes()
+    assert API.export_to_steam(str(wgs), str(steam), compression='xz')[0].status == API.UNCHANGED
+    assert API.export_to_steam(str(wgs), str(steam), overwrite=API.SKIP)[0].status == API.EXPORTED
+    with pytest.raises(ValueError):
+        API.export_to_steam(str(wgs), str(steam), compression='zip')
+
+    # A save of more than 9 chunks is exported without any output
+    monkeypatch.setattr('cogs.AstroSave.XBOX_CHUNK_SIZE', 10)
+    (steam / 'BIG$2024.01.01-00.00.00.savegame').write_bytes(os.urandom(100))
+    API.export_to_xbox(str(steam), str(tmp_path / 'back'), ['BIG$2024.01.01-00.00.00'])
+    assert capsys.readouterr().out == ''
+
+def test_export_to_steam_overwrite_policies(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    steam = tmp_path / 'SaveGames'
+    steam.mkdir()
+    make_xbox_save(wgs, 'ONE', size=100)
+    existing = steam / 'ONE$2024.01.01-00.00.00.savegame'
+    existing.write_bytes(b'old')
+
+    with pytest.raises(FileExistsError):
+        API.export_to_steam(str(wgs), str(steam))
+    assert API.export_to_steam(str(wgs), str(steam), overwrite=API.SKIP)[0].status == API.EXISTING
+    assert existing.read_bytes() == b'old'
+
+    def rename(save, path):
+        save.rename('RENAMED')
+        return True
+    result = API.export_to_steam(str(wgs), str(steam), overwrite=rename)[0]
+    assert result.name == 'RENAMED$2024.01.01-00.00.00'
+    assert existing.read_bytes() == b'old'
+
+    assert API.export_to_steam(str(wgs), str(steam), overwrite=API.OVERWRITE)[0].status == API.EXPORTED
+    assert existing.stat().st_size == 100
+
+
+def test_backup_to_archive(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'ONE', size=100)
+
+    result = API.backup(str(wgs), str(tmp_path / 'backup'), 'zip')
+
+    assert result.path.endswith('.zip')
+    assert [save.name for save in API.list_saves(result.path)] == ['ONE$2024.01.01-00.00.00']
+
+
+def test_export_to_steam_feeds_a_backup(tmp_path, make_xbox_save, monkeypatch):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'ONE', size=300)
+    make_xbox_save(wgs, 'TWO', size=200)
+    reads = []
+    read_file_blocks = utils.read_file_blocks
+    monkeypatch.setattr(utils, 'read_file_blocks', lambda path, *args: reads.append(path) or read_file_blocks(path, *args))
+
+    backup = AstroTeePipeline.open_backup(str(tmp_path / 'backup'))
+    API.export_to_steam(str(wgs), str(tmp_path / 'SaveGames'), ['ONE'], backup=backup)
+    AstroTeePipeline.backup_remaining_files(str(wgs), backup)
+    backup.close()
+
+    source_files = sorted(path.name for path in wgs.iterdir() if not path.name.startswith('.'))
+    assert sorted(path.name for path in (tmp_path / 'backup').iterdir()) == source_files
+    assert sorted(reads) == sorted(str(wgs / name) for name in source_files)
@@ -0,0 +1,51 @@
+import lzma
+import os
+import shutil
+
+import AstroSaveScenario as scenario
+from cogs.AstroSaveCatalog import AstroSaveCatalog, MICROSOFT, STEAM
+
+
+def test_catalog_indexes_folders_and_backups_incrementally(tmp_path, make_xbox_save):
+    root = tmp_path / 'saves'
+    wgs = root / 'wgs' / 'PROFILE'
+    wgs.mkdir(parents=True)
+    make_xbox_save(wgs, 'WORLD', date='2024.01.01-00.00.00')
+    shutil.make_archive(str(root / 'Backup_2024.01.01-00.00'), 'zip', str(root / 'wgs'))
+    newer = make_xbox_save(wgs, 'WORLD', date='2024.02.01-00.00.00')
+    steam = root / 'SaveGames'
+    steam.mkdir()
+    scenario.export_save_to_steam(newer, str(wgs), str(steam))
+
+    catalog = AstroSaveCatalog(str(tmp_path / 'catalog.sqlite'))
+    assert catalog.update([str(root)]) == {'indexed': 3, 'unchanged': 0, 'removed': 0}
+    assert len(catalog.list_saves(MICROSOFT)) == 3
+    assert [save['folder'] for save in catalog.search('world', STEAM)] == [str(steam)]
+
+    newest = catalog.newest('world')
+    assert [save['name'] for save in newest] == ['WORLD$2024.02.01-00.00.00']
+    hashes = {save['sha256'] for save in catalog.search('2024.02.01')}
+    assert len(hashes) == 1
+
+    assert catalog.update([str(root)]) == {'indexed': 0, 'unchanged': 3, 'removed': 0}
+
+    os.remove(steam / newer.get_file_name())
+    make_xbox_save(wgs, 'OTHER')
+    assert catalog.update([str(root)]) == {'indexed': 1, 'unchanged': 1, 'removed': 1}
+    assert sorted(save['base_name'] for save in catalog.newest()) == ['OTHER', 'WORLD']
+    catalog.close()
+
+
+def test_catalog_indexes_compressed_steam_exports(tmp_path):
+    content = os.urandom(1000)
+    (tmp_path / 'WORLD$2024.01.01-00.00.00.savegame').write_bytes(content)
+    (tmp_path / 'WORLD$2024.02.01-00.00.00.savegame.xz').write_bytes(lzma.compress(content))
+
+    catalog = AstroSaveCatalog(str(tmp_path / 'catalog.sqlite'))
+    assert catalog.update([str(tmp_path)])['indexed'] == 2
+
+    saves = catalog.list_saves(STEAM)
+    assert [(save['name'], save['size']) for save in saves] == [
+        ('WORLD$2024.02.01-00.00.00', 1000), ('WORLD$2024.01.01-00.00.00', 1000)]
+    assert len({save['sha256'] for save in saves}) == 1
+    catalog.close()
@@ -0,0 +1,35 @@
+import os
+
+from cogs import AstroSaveCheck
+from cogs.AstroExportJournal import AstroExportJournal
+
+
+def test_check_reports_missing_truncated_and_orphaned_chunks(tmp_path, make_xbox_save, monkeypatch):
+    monkeypatch.setattr('cogs.AstroSave.XBOX_CHUNK_SIZE', 100)
+    monkeypatch.setattr('cogs.AstroSaveCheck.XBOX_CHUNK_SIZE', 100)
+    healthy, broken = tmp_path / 'wgs' / 'A', tmp_path / 'wgs' / 'B'
+    healthy.mkdir(parents=True)
+    broken.mkdir()
+    make_xbox_save(healthy, 'GOOD', size=250)
+    missing = make_xbox_save(broken, 'MISSING', size=250)
+    truncated = make_xbox_save(broken, 'TRUNCATED', size=250)
+    os.remove(broken / missing.chunks_names[2])
+    (broken / truncated.chunks_names[0]).write_bytes(b'x' * 99)
+    orphan = 'F' * 32
+    (broken / orphan).write_bytes(b'x' * 10)
+    pending = '0' * 32
+    (broken / pending).write_bytes(b'x')
+    journal = AstroExportJournal(str(broken))
+    journal.saves['PENDING'] = {'source': 'PENDING.savegame', 'size': 1, 'mtime_ns': 0,
+                               'chunks': [pending], 'written': []}
+    journal.save()
+
+    reports = AstroSaveCheck.check_save_folders([str(tmp_path / 'wgs')])
+
+    by_folder = {report.folder: report for report in reports}
+    assert by_folder[str(healthy)].is_healthy()
+    report = by_folder[str(broken)]
+    assert report.missing == [(missing.name, missing.chunks_names[2])]
+    assert report.truncated == [(truncated.name, truncated.chunks_names[0], 99)]
+    assert report.orphaned == [(orphan, 10)]
+    assert report.pending == [pending]
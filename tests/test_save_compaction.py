@@ -0,0 +1,71 @@
+import os
+import shutil
+
+import pytest
+
+from cogs import AstroSaveCheck
+from cogs import AstroSaveCompaction
+from cogs.AstroSaveContainer import AstroSaveContainer, CHUNK_METADATA_SIZE
+
+
+def test_compaction_drops_dead_saves_and_orphans(tmp_path, make_xbox_save, monkeypatch):
+    monkeypatch.setattr('cogs.AstroSave.XBOX_CHUNK_SIZE', 100)
+    monkeypatch.setattr('cogs.AstroSaveCheck.XBOX_CHUNK_SIZE', 100)
+    wgs = tmp_path / 'wgs'
+    wgs.mkdir()
+    kept = make_xbox_save(wgs, 'KEPT', size=150)
+    dead = make_xbox_save(wgs, 'DEAD', size=250)
+    os.remove(wgs / dead.chunks_names[0])
+    orphan = 'A' * 32
+    (wgs / orphan).write_bytes(b'x' * 40)
+    container_size = (wgs / 'container.1').stat().st_size
+
+    preview = AstroSaveCompaction.compact_save_folder(str(wgs))
+    assert preview.dead_saves == [('container.1', dead.name)]
+    assert preview.dead_records == {'container.1': 3}
+    assert preview.removed_chunks == sorted(dead.chunks_names[1:] + [orphan])
+    assert preview.reclaimed_bytes == 100 + 50 + 40 + 3 * CHUNK_METADATA_SIZE
+    assert (wgs / orphan).exists()
+
+    AstroSaveCompaction.compact_save_folder(str(wgs), dry_run=False)
+
+    container = AstroSaveContainer(str(wgs / 'container.1'))
+    assert [(save.name, save.chunks_names) for save in container.save_list] == [(kept.name, kept.chunks_names)]
+    assert (wgs / 'container.1').stat().st_size == container_size - 3 * CHUNK_METADATA_SIZE
+    assert sorted(os.listdir(wgs)) == sorted(['container.1'] + kept.chunks_names)
+    assert AstroSaveCheck.check_save_folder(str(wgs)).is_healthy()
+
+
+def test_healthy_copy_in_another_container_is_kept(tmp_path, make_xbox_save, monkeypatch):
+    monkeypatch.setattr('cogs.AstroSave.XBOX_CHUNK_SIZE', 100)
+    monkeypatch.setattr('cogs.AstroSaveCheck.XBOX_CHUNK_SIZE', 100)
+    wgs, other = tmp_path / 'wgs', tmp_path / 'other'
+    wgs.mkdir()
+    other.mkdir()
+    healthy = make_xbox_save(wgs, 'WORLD', size=250)
+    broken = make_xbox_save(other, 'WORLD', size=250)
+    shutil.copy(other / 'container.1', wgs / 'container.2')
+    for chunk_name in broken.chunks_names[1:]:
+        shutil.copy(other / chunk_name, wgs / chunk_name)
+
+    result = AstroSaveCompaction.compact_save_folder(str(wgs), dry_run=False)
+
+    assert result.dead_saves == [('container.2', broken.name)]
+    assert result.dead_records == {'container.2': 3}
+    assert result.removed_chunks == sorted(broken.chunks_names[1:])
+    assert [save.chunks_names for save in AstroSaveContainer(str(wgs / 'container.1')).save_list] == [
+        healthy.chunks_names]
+    assert AstroSaveContainer(str(wgs / 'container.2')).save_list == []
+    assert all((wgs / chunk_name).exists() for chunk_name in healthy.chunks_names)
+
+
+def test_truncated_container_is_not_rewritten(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    save = make_xbox_save(wgs, 'WORLD', size=100)
+    content = (wgs / 'container.1').read_bytes()
+    (wgs / 'container.1').write_bytes(content[:-10])
+
+    with pytest.raises(ValueError, match='truncated'):
+        AstroSaveCompaction.rewrite_container(str(wgs / 'container.1'), {0: save.chunks_names[0]})
+    assert (wgs / 'container.1').read_bytes() == content[:-10]
+    assert not [name for name in os.listdir(wgs) if name.endswith('.tmp')]
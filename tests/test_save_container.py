@@ -0,0 +1,104 @@
+import uuid
+
+import pytest
+
+from cogs import AstroSaveStorage
+from cogs.AstroSave import AstroSave
+from cogs.AstroSaveContainer import AstroSaveContainer, CHUNK_METADATA_SIZE
+
+
+def test_saves_share_the_chunk_ids_of_their_container(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    one = make_xbox_save(wgs, 'ONE')
+    two = make_xbox_save(wgs, 'TWO')
+
+    container = AstroSaveContainer(str(next(wgs.glob('container.*'))))
+
+    assert [(save.name, save.chunks_names) for save in container.save_list] == [
+        (one.name, one.chunks_names), (two.name, two.chunks_names)]
+    assert container.chunk_ids == b''.join(bytes.fromhex(name) for name in one.chunks_names + two.chunks_names)
+    assert container.save_list[1].chunk_ids == bytes.fromhex(two.chunks_names[0])
+    assert container.save_list[1].get_chunk_name(0) == two.chunks_names[0]
+    with pytest.raises(AttributeError):
+        container.save_list[0].size = 0
+
+
+def test_chunk_names_round_trip_and_regeneration():
+    names = [uuid.uuid4().hex.upper() for _ in range(3)]
+    save = AstroSave('ONE$2024.01.01-00.00.00', names)
+    assert save.chunks_names == names
+    assert save.chunk_count == 3
+
+    new_uuid = save.regenerate_uuid(1)
+    assert save.chunks_names == [names[0], new_uuid.hex.upper(), names[2]]
+
+
+def write_container(path, saves):
+    """Write a container of ``(save name, chunk count)`` saves, return their chunk names."""
+    records = []
+    chunks_names = []
+    for save_name, chunk_count in saves:
+        names = []
+        for index in range(chunk_count):
+            suffix = f'$${index}${chunk_count}$1' if chunk_count > 1 else ''
+            chunk_uuid = uuid.uuid4()
+            text = (save_name + suffix).encode('utf-16le').ljust(CHUNK_METADATA_SIZE - 16, b'\x00')
+            records.append(text + chunk_uuid.bytes_le)
+            names.append(chunk_uuid.hex.upper())
+        chunks_names.append(names)
+    path.write_bytes(b'\x04\x00\x00\x00' + len(records).to_bytes(4, byteorder='little') + b''.join(records))
+    return chunks_names
+
+
+def test_lazy_iteration_matches_full_parsing(tmp_path):
+    saves = [(f'SAVE{i}$2024.01.01-00.00.00', i % 4 + 1) for i in range(30)]
+    chunks_names = write_container(tmp_path / 'container.1', saves)
+
+    container = AstroSaveContainer(str(tmp_path / 'container.1'))
+    lazy = [(save.name, save.chunks_names) for save in container.iter_saves(block_records=7)]
+
+    assert lazy == [(name, names) for (name, _), names in zip(saves, chunks_names)]
+    assert container.record_offsets[2] == ('SAVE2$2024.01.01-00.00.00', 3, 3)
+    assert [(save.name, save.chunks_names) for save in container.save_list] == lazy
+
+
+
+def test_each_record_is_decoded_once_while_iterating(tmp_path, monkeypatch):
+    chunks_names = write_container(tmp_path / 'container.1', [('BIG$2024.01.01-00.00.00', 60),
+                                                               ('SMALL$2024.01.01-00.00.00', 1)])
+    decoded = []
+    extract_name = AstroSaveContainer.extract_name_from_chunk
+    monkeypatch.setattr(AstroSaveContainer, 'extract_name_from_chunk',
+                        lambda container, chunk: decoded.append(chunk) or extract_name(container, chunk))
+
+    container = AstroSaveContainer(str(tmp_path / 'container.1'))
+    assert [save.chunks_names for save in container.iter_saves(block_records=4)] == chunks_names
+    assert len(decoded) == 61
+    assert AstroSaveContainer(str(tmp_path / 'container.1')).chunk_ids == \
+        b''.join(bytes.fromhex(name) for name in chunks_names[0] + chunks_names[1])
+
+def test_lookups_only_read_the_records_they_need(tmp_path, monkeypatch):
+    saves = [(f'SAVE{i}$2024.01.01-00.00.00', 100) for i in range(100)]
+    chunks_names = write_container(tmp_path / 'container.1', saves)
+    read = []
+    open_save_file = AstroSaveStorage.open_save_file
+
+    def counting_open(path):
+        file = open_save_file(path)
+        read_file = file.read
+        file.read = lambda size=-1: read.append(size) or read_file(size)
+        return file
+    monkeypatch.setattr(AstroSaveStorage, 'open_save_file', counting_open)
+
+    container = AstroSaveContainer(str(tmp_path / 'container.1'))
+    save = container.find_save('SAVE40$2024.01.01-00.00.00')
+
+    assert save.chunks_names == chunks_names[40]
+    assert len(container.record_offsets) == 41
+    # Blocks around the first and last record of every save up to it, then its own records
+    assert sum(read) < 41 * 100 * CHUNK_METADATA_SIZE / 10
+    assert container.get_save(40).chunks_names == chunks_names[40]
+    with pytest.raises(KeyError):
+        container.find_save('MISSING')
+    with pytest.raises(IndexError):
+        container.get_save(100)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import uuid
+
+from cogs import AstroSaveDiff as Diff
+from cogs.AstroSaveContainer import CHUNK_METADATA_SIZE
+
+
+def write_folder(folder, saves):
+    """Write a container of ``(save name, chunk names)`` saves and their chunk files."""
+    folder.mkdir(exist_ok=True)
+    records = []
+    for save_name, chunks_names in saves:
+        for index, chunk_name in enumerate(chunks_names):
+            suffix = f'$${index}${len(chunks_names)}$1' if len(chunks_names) > 1 else ''
+            text = (save_name + suffix).encode('utf-16le').ljust(CHUNK_METADATA_SIZE - 16, b'\x00')
+            records.append(text + uuid.UUID(chunk_name).bytes_le)
+            if not (folder / chunk_name).exists():
+                (folder / chunk_name).write_bytes(chunk_name.encode())
+    (folder / 'container.1').write_bytes(
+        b'\x04\x00\x00\x00' + len(records).to_bytes(4, byteorder='little') + b''.join(records))
+
+
+def new_chunks(count):
+    return [uuid.uuid4().hex.upper() for _ in range(count)]
+
+
+def test_diff_from_the_record_tables(tmp_path):
+    same, renamed, changed, removed, added = (new_chunks(2) for _ in range(5))
+    write_folder(tmp_path / 'old', [('SAME$2024.01.01-00.00.00', same), ('OLD$2024.01.01-00.00.00', renamed),
+                                    ('WORLD$2024.01.01-00.00.00', changed), ('GONE$2024.01.01-00.00.00', removed)])
+    shutil.copytree(tmp_path / 'old', tmp_path / 'new', copy_function=shutil.copy2)
+    os.remove(tmp_path / 'new' / 'container.1')
+    write_folder(tmp_path / 'new', [('SAME$2024.01.01-00.00.00', same), ('NEW$2024.01.01-00.00.00', renamed),
+                                    ('WORLD$2024.02.01-00.00.00', changed[:1] + added)])
+    (tmp_path / 'new' / same[0]).write_bytes(b'modified in place')
+
+    diff = Diff.diff_snapshots(str(tmp_path / 'old'), str(tmp_path / 'new'))
+
+    assert diff.unchanged == ['SAME$2024.01.01-00.00.00']
+    assert [(difference.kind, difference.old_name, difference.name) for difference in diff.differences] == [
+        (Diff.RENAMED, 'OLD$2024.01.01-00.00.00', 'NEW$2024.01.01-00.00.00'),
+        (Diff.CHANGED, 'WORLD$2024.01.01-00.00.00', 'WORLD$2024.02.01-00.00.00'),
+        (Diff.REMOVED, None, 'GONE$2024.01.01-00.00.00'),
+    ]
+    world = diff.differences[1]
+    assert (world.added_chunks, world.removed_chunks) == (added, changed[1:])
+    assert diff.to_dict()['record_bytes'] == (8 + 7) * CHUNK_METADATA_SIZE
+    assert not any(difference.modified_chunks for difference in diff.differences)
+
+    # Only the chunks shared by the changed saves are compared, the unchanged save isn't looked at
+    (tmp_path / 'new' / changed[0]).write_bytes(b'other content')
+    diff = Diff.diff_snapshots(str(tmp_path / 'old'), str(tmp_path / 'new'), compare_files=True)
+    assert [difference.modified_chunks for difference in diff.differences] == [[], [changed[0]], []]
+
+
+def test_diff_of_a_backup_archive_with_content_comparison(tmp_path):
+    chunks = new_chunks(3)
+    write_folder(tmp_path / 'live', [('WORLD$2024.01.01-00.00.00', chunks)])
+    archive = shutil.make_archive(str(tmp_path / 'backup'), 'zip', str(tmp_path / 'live'))
+    write_folder(tmp_path / 'live', [('WORLD$2024.01.01-00.00.00', chunks), ('NEXT$2024.01.01-00.00.00', chunks[:1])])
+    os.utime(tmp_path / 'live' / chunks[1], (0, 0))
+
+    diff = Diff.diff_snapshots(archive, str(tmp_path / 'live' / 'container.1'), True, compare_content=True)
+
+    assert [(difference.kind, difference.name) for difference in diff.differences] == [
+        (Diff.ADDED, 'NEXT$2024.01.01-00.00.00')]
+    assert diff.compared_bytes == 0
+    assert Diff.diff_snapshots(archive, archive).has_differences() is False
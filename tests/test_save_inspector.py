@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def test_list_prints_json_without_logging(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    wgs.mkdir()
+    save = make_xbox_save(wgs, 'WORLD', size=1234)
+    os.remove(wgs / save.chunks_names[0])
+    make_xbox_save(wgs, 'OTHER', size=10, date='c2024.02.01-00.00.00')
+
+    result = subprocess.run([sys.executable, MAIN_PATH, 'list', str(wgs), '--json'], cwd=tmp_path,
+                            stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True)
+
+    description = json.loads(result.stdout)
+    assert description['platform'] == 'microsoft'
+    assert [(save['name'], save['date'], save['chunk_count'], save['size'], save['complete'])
+            for save in description['saves']] == [
+        ('WORLD$2024.01.01-00.00.00', '2024-01-01T00:00:00', 1, 0, False),
+        ('OTHER$c2024.02.01-00.00.00', '2024-02-01T00:00:00', 1, 10, True),
+    ]
+    assert not (tmp_path / 'logs').exists()
+
+
+def test_inspect_steam_file(tmp_path):
+    (tmp_path / 'WORLD$2024.01.01-00.00.00.savegame').write_bytes(b'x' * 50)
+
+    result = subprocess.run([sys.executable, MAIN_PATH, 'inspect', str(tmp_path / 'WORLD$2024.01.01-00.00.00.savegame')],
+                            cwd=tmp_path, stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True)
+
+    assert 'WORLD$2024.01.01-00.00.00' in result.stdout
+    assert '50 B' in result.stdout
+
+
+def test_invalid_container_is_reported_without_prompting(tmp_path):
+    wgs = tmp_path / 'wgs'
+    wgs.mkdir()
+    (wgs / 'container.1').write_bytes(b'not a container')
+
+    results = [subprocess.run([sys.executable, MAIN_PATH] + command, cwd=tmp_path, stdin=subprocess.DEVNULL,
+                              capture_output=True, text=True, timeout=30)
+               for command in (['list', str(wgs), '--json'], ['inspect', str(wgs / 'container.1')])]
+
+    assert [(result.returncode, result.stdout, len(result.stderr.splitlines())) for result in results] == [
+        (1, '', 1), (1, '', 1)]
+    assert 'container.1' in json.loads(results[0].stderr)['error']
+    assert 'container.1' in results[1].stderr
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import subprocess
+import sys
+import tarfile
+
+import pytest
+
+import utils
+from cogs import AstroCompression
+from cogs import AstroSaveMigration
+from cogs.AstroConversionManifest import AstroConversionManifest
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def test_migration_queue_orders_saves_and_exports_them(tmp_path, make_xbox_save):
+    wgs_a, wgs_b = tmp_path / 'wgsA', tmp_path / 'wgsB'
+    make_xbox_save(wgs_a, 'SMALL', size=10)
+    make_xbox_save(wgs_a, 'BIG', size=3000)
+    make_xbox_save(wgs_b, 'MEDIUM', size=500)
+
+    tasks = AstroSaveMigration.list_migration_tasks([str(wgs_a), str(wgs_b)], str(tmp_path / 'out'))
+    ordered = AstroSaveMigration.order_migration_tasks(tasks, AstroSaveMigration.LARGEST_FIRST)
+    assert [task.size for task in ordered] == [3000, 500, 10]
+
+    AstroSaveMigration.run_migration(ordered, workers=2, io_limit=1)
+    assert (tmp_path / 'out' / 'wgsB' / 'MEDIUM$2024.01.01-00.00.00.savegame').stat().st_size == 500
+
+    rerun = AstroSaveMigration.run_migration(ordered, workers=2, io_limit=1)
+    assert all(task.skipped for task in rerun)
+
+
+def test_failed_task_does_not_stop_the_migration(tmp_path, make_xbox_save, monkeypatch):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'BROKEN', size=10)
+    make_xbox_save(wgs, 'GOOD', size=10)
+    real_export = AstroSaveMigration.Scenario.export_save_to_steam
+
+    def export(save, *args):
+        if save.name.startswith('BROKEN'):
+            raise ValueError('corrupted save')
+        return real_export(save, *args)
+
+    monkeypatch.setattr(AstroSaveMigration.Scenario, 'export_save_to_steam', export)
+    tasks = AstroSaveMigration.run_migration(
+        AstroSaveMigration.list_migration_tasks([str(wgs)], str(tmp_path / 'out')), workers=1)
+
+    broken, good = tasks
+    assert isinstance(broken.error, ValueError) and broken.export_path is None
+    assert good.error is None and good.export_path is not None
+
+
+def test_newest_save_is_kept_across_containers(tmp_path, make_xbox_save):
+    wgs, other = tmp_path / 'wgs', tmp_path / 'other'
+    make_xbox_save(wgs, 'ONE', date='2024.01.01-00.00.00')
+    make_xbox_save(wgs, 'TWO')
+    newer = make_xbox_save(other, 'ONE', date='2024.02.01-00.00.00')
+    (other / 'container.1').rename(wgs / 'container.2')
+    (other / newer.chunks_names[0]).rename(wgs / newer.chunks_names[0])
+
+    saves = AstroSaveMigration.load_newest_saves(str(wgs), ['container.1', 'container.2'])
+    assert sorted(save.name for save in saves) == ['ONE$2024.02.01-00.00.00', 'TWO$2024.01.01-00.00.00']
+
+
+@pytest.mark.parametrize('backup_format', ['folder', 'tar.gz'])
+def test_migration_backup_reads_every_chunk_once(tmp_path, make_xbox_save, monkeypatch, backup_format):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'ONE', size=300)
+    make_xbox_save(wgs, 'TWO', size=5000)
+    source_files = {path.name: path.read_bytes() for path in wgs.iterdir()
+                    if not path.name.startswith('.')}
+
+    reads = []
+    read_file_blocks = utils.read_file_blocks
+    monkeypatch.setattr(utils, 'read_file_blocks', lambda path, *args: reads.append(path) or read_file_blocks(path, *args))
+    AstroCompression.configure(backup=backup_format)
+    try:
+        tasks = AstroSaveMigration.list_migration_tasks([str(wgs)], str(tmp_path / 'out'))
+        AstroSaveMigration.run_migration(tasks, backup_path=str(tmp_path / 'backup'))
+    finally:
+        AstroCompression.configure()
+
+    assert sorted(reads) == sorted(str(wgs / name) for name in source_files)
+    if backup_format == 'folder':
+        backup_files = {path.name: path.read_bytes() for path in (tmp_path / 'backup' / 'wgs').iterdir()}
+    else:
+        with tarfile.open(tmp_path / 'backup' / 'wgs.tar.gz') as archive:
+            backup_files = {info.name: archive.extractfile(info).read() for info in archive.getmembers()}
+    assert backup_files == source_files
+
+    manifest = AstroConversionManifest(str(tmp_path / 'out'))
+    exported = tmp_path / 'out' / 'TWO$2024.01.01-00.00.00.savegame'
+    assert manifest.entries['steam'][exported.name]['sha256'] == hashlib.sha256(exported.read_bytes()).hexdigest()
+
+
+def test_tee_backup_keeps_the_modification_times(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'ONE', size=300)
+    for index, path in enumerate(sorted(wgs.iterdir())):
+        os.utime(path, ns=(10**18 + index, 10**18 + index))
+    source_mtimes = {path.name: path.stat().st_mtime_ns for path in wgs.iterdir() if not path.name.startswith('.')}
+
+    tasks = AstroSaveMigration.list_migration_tasks([str(wgs)], str(tmp_path / 'out'))
+    AstroSaveMigration.run_migration(tasks, backup_path=str(tmp_path / 'backup'))
+
+    assert {path.name: path.stat().st_mtime_ns for path in (tmp_path / 'backup' / 'wgs').iterdir()} == source_mtimes
+
+
+def test_failed_migration_exits_with_an_error_without_prompting(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    save = make_xbox_save(wgs, 'BROKEN', size=10)
+    # A folder named after the Steam file can't be written over
+    (tmp_path / 'out' / f'{save.name}.savegame').mkdir(parents=True)
+
+    result = subprocess.run([sys.executable, MAIN_PATH, 'migrate-all', str(tmp_path / 'out'), '-s', str(wgs)],
+                            cwd=tmp_path, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 1
+    assert '1 failed' in result.stdout
+
+    result = subprocess.run([sys.executable, MAIN_PATH, 'restore', str(tmp_path / 'missing'), str(wgs)],
+                            cwd=tmp_path, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 1
+    assert 'EOFError' not in result.stdout + result.stderr
@@ -0,0 +1,44 @@
+import os
+import shutil
+
+import pytest
+
+from cogs import AstroSaveRestore
+from cogs.AstroSaveContainer import AstroSaveContainer
+
+
+@pytest.mark.parametrize('archived', [False, True])
+def test_restore_copies_only_changed_files(tmp_path, make_xbox_save, archived):
+    live = tmp_path / 'live'
+    live.mkdir()
+    kept = make_xbox_save(live, 'KEPT', size=2000)
+    backup = tmp_path / 'backup'
+    shutil.copytree(live, backup, copy_function=shutil.copy2)
+    backup_path = shutil.make_archive(str(tmp_path / 'backup'), 'zip', str(backup)) if archived else str(backup)
+
+    extra = make_xbox_save(live, 'EXTRA', size=500)
+    (live / 'container.1').rename(live / 'container.2')
+    (live / '.astrosaveconverter_manifest.json').write_text('{}')
+
+    plan = AstroSaveRestore.restore_save_folder(backup_path, str(live), compare_content=archived)
+
+    assert [live_name for _, live_name in plan.copies] == ['container.2']
+    assert plan.removals == extra.chunks_names
+    assert plan.unchanged == kept.chunks_names
+    assert sorted(os.listdir(live)) == sorted(['.astrosaveconverter_manifest.json', 'container.2'] + kept.chunks_names)
+    assert (live / 'container.2').read_bytes() == (backup / 'container.1').read_bytes()
+    assert [save.name for save in AstroSaveContainer(str(live / 'container.2')).save_list] == [kept.name]
+
+    assert AstroSaveRestore.plan_restore(backup_path, str(live), compare_content=True).copies == []
+
+
+def test_dry_run_leaves_the_folder_untouched(tmp_path, make_xbox_save):
+    backup = tmp_path / 'backup'
+    backup.mkdir()
+    make_xbox_save(backup, 'ONE')
+    live = tmp_path / 'live'
+    live.mkdir()
+
+    plan = AstroSaveRestore.restore_save_folder(str(backup), str(live), dry_run=True)
+    assert len(plan.copies) == 2
+    assert os.listdir(live) == []
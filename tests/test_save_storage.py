@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+import shutil
+import sys
+import tarfile
+
+import pytest
+
+import AstroSaveScenario as scenario
+from cogs.AstroSaveContainer import AstroSaveContainer
+from cogs import AstroSaveStorage
+
+
+@pytest.fixture
+def wgs_folder(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'backup' / 'wgs' / 'PROFILE'
+    wgs.mkdir(parents=True)
+    make_xbox_save(wgs, 'ONE', size=300)
+    make_xbox_save(wgs, 'TWO', size=5000)
+    return wgs
+
+
+def archive_zip(wgs_folder, tmp_path):
+    return shutil.make_archive(str(tmp_path / 'saves'), 'zip', str(tmp_path / 'backup'))
+
+
+def archive_tar(wgs_folder, tmp_path):
+    archive_path = tmp_path / 'saves.tar.gz'
+    with tarfile.open(archive_path, 'w:gz') as archive:
+        archive.add(str(tmp_path / 'backup'), arcname='.')
+    return str(archive_path)
+
+
+@pytest.mark.parametrize('make_archive', [archive_zip, archive_tar])
+def test_saves_are_exported_straight_from_archives(tmp_path, wgs_folder, make_archive):
+    archive_path = make_archive(wgs_folder, tmp_path)
+    target = tmp_path / 'SaveGames'
+    target.mkdir()
+
+    for source in (archive_path, archive_path + '/wgs/PROFILE'):
+        containers = AstroSaveContainer.get_containers_list(source)
+        container = AstroSaveContainer(f'{source}/{containers[0]}')
+        for save in container.save_list:
+            export_path = scenario.export_save_to_steam(save, source, str(target))
+            with open(export_path, 'rb') as exported:
+                assert exported.read() == save.convert_to_steam(str(wgs_folder)).getvalue()
+
+
+def test_missing_inner_folder_is_reported(tmp_path, wgs_folder):
+    archive_path = archive_zip(wgs_folder, tmp_path)
+    with pytest.raises(FileNotFoundError):
+        AstroSaveStorage.open_storage(archive_path + '/nothing').open('container.1')
+
+
+def test_tar_members_read_from_several_threads(tmp_path, wgs_folder, make_xbox_save):
+    make_xbox_save(wgs_folder, 'BIG', size=200_000)
+    storage = AstroSaveStorage.open_storage(archive_tar(wgs_folder, tmp_path))
+    names = [name for name in storage.list_files() if not name.startswith('container.')]
+    expected = {name: (wgs_folder / name).read_bytes() for name in names}
+
+    def read(name):
+        with storage.open(name) as member_file:
+            return name, b''.join(iter(lambda: member_file.read(1024), b''))
+
+    # Switching threads as often as possible, for the reads to interleave
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(read, names * 10))
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert all(content == expected[name] for name, content in results)
+
+
+def test_save_read_from_tar_through_a_single_handle(tmp_path, wgs_folder, make_xbox_save, monkeypatch):
+    monkeypatch.setattr('cogs.AstroSave.XBOX_CHUNK_SIZE', 100)
+    save = make_xbox_save(wgs_folder, 'MANY', size=2000)
+    storage = AstroSaveStorage.open_storage(archive_tar(wgs_folder, tmp_path))
+    assert len(save.chunks_names) > 10
+
+    opened = []
+    tar_open = tarfile.open
+    monkeypatch.setattr(tarfile, 'open', lambda *args, **kwargs: opened.append(args) or tar_open(*args, **kwargs))
+
+    content = b''.join(save.iter_steam_blocks(storage))
+
+    assert content == (tmp_path / 'steam_source' / f'{save.name}.savegame').read_bytes()
+    assert len(opened) == 1
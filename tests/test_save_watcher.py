@@ -0,0 +1,41 @@
+import os
+
+from cogs.AstroSaveWatcher import AstroSaveWatcher
+
+
+def test_watcher_exports_only_changed_saves(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    target = tmp_path / 'SaveGames'
+    make_xbox_save(wgs, 'ONE')
+    make_xbox_save(wgs, 'TWO')
+
+    watcher = AstroSaveWatcher(str(wgs), str(target), debounce=1)
+    assert watcher.poll(now=0) == []
+    assert len(watcher.poll(now=2)) == 2
+    assert watcher.poll(now=3) == []
+
+    make_xbox_save(wgs, 'THREE')
+    container = next(wgs.glob('container.*'))
+    os.utime(container, (1, 1))
+    assert watcher.poll(now=4) == []
+    exported = watcher.poll(now=6)
+    assert [os.path.basename(p) for p in exported] == ['THREE$2024.01.01-00.00.00.savegame']
+
+
+def test_watcher_retries_after_a_truncated_container(tmp_path, make_xbox_save):
+    wgs = tmp_path / 'wgs'
+    make_xbox_save(wgs, 'ONE')
+    container = next(wgs.glob('container.*'))
+    content = container.read_bytes()
+    # Caught by the watcher while the game rewrites it
+    container.write_bytes(b'')
+
+    watcher = AstroSaveWatcher(str(wgs), str(tmp_path / 'SaveGames'), debounce=1)
+    assert watcher.poll(now=0) == []
+    assert watcher.poll(now=2) == []
+    assert watcher.poll(now=2.5) == []
+
+    container.write_bytes(content)
+    os.utime(container, (1, 1))
+    assert watcher.poll(now=3) == []
+    assert [os.path.basename(p) for p in watcher.poll(now=4)] == ['ONE$2024.01.01-00.00.00.savegame']
@@ -1,11 +1,28 @@
 """Miscellaneous utility helpers used across the project."""
 
+import errno
 import os
 import shutil
+import stat
 import sys
-import winpath
+import tempfile
 from io import StringIO
 from datetime import datetime
+from typing import Callable, Iterator, Optional, Tuple
+
+# Size of the blocks used to stream save files, see ``configure_io``
+IO_BUFFER_SIZE = 1024 * 1024
+# Called with the size of every block of save file read or written, see ``set_io_hook``
+IO_HOOK: Optional[Callable[[int], None]] = None
+# Called before the final prompt of ``wait_and_exit``, see ``set_exit_hook``
+EXIT_HOOK: Optional[Callable[[], None]] = None
+# Evict save files from the page cache once streamed, so that converting on a
+# live game host doesn't push the server's working set out of memory
+DROP_PAGE_CACHE = hasattr(os, 'posix_fadvise')
+# Permissions removed from the files created by the process, read once as
+# reading it means changing it for a moment
+UMASK = os.umask(0o022)
+os.umask(UMASK)
 
 
 def create_folder_name(prefix: str) -> str:
@@ -62,15 +79,139 @@ def join_paths(path1: str, path2: str) -> str:
     return os.path.join(path1, path2)
 
 
-def copy_files(source: str, target: str) -> None:
-    """Copy directory ``source`` to ``target``."""
+def copy_files(source: str, target: str) -> Tuple[int, int]:
+    """Copy directory ``source`` to ``target``.
+
+    Returns:
+        The number of bytes and the number of files copied.
+    """
     if os.path.isdir(target):
         shutil.rmtree(target)
-    shutil.copytree(source, target)
+    sizes = []
+    shutil.copytree(source, target, copy_function=lambda source_file, target_file: sizes.append(
+        copy_file(source_file, target_file)))
+    return sum(sizes), len(sizes)
+
+
+def copy_file(source: str, target: str) -> int:
+    """Copy a file and its metadata, streaming it through ``read_file_blocks``.
+
+    Returns:
+        int: Number of bytes copied.
+    """
+    copied = 0
+    with open(target, "wb") as target_file:
+        preallocate_file(target_file, os.path.getsize(source))
+        for block in read_file_blocks(source):
+            copied += write_throttled(target_file, block)
+        drop_file_cache(target_file, written=True)
+    shutil.copystat(source, target)
+    return copied
+
+
+def configure_io(buffer_size: int = None, drop_page_cache: bool = None) -> None:
+    """Tune how save files are streamed.
+
+    Args:
+        buffer_size: Size in bytes of the blocks read from save files.
+        drop_page_cache: Evict streamed files from the page cache. Ignored on
+            platforms without ``posix_fadvise``.
+    """
+    global IO_BUFFER_SIZE, DROP_PAGE_CACHE
+    if buffer_size is not None:
+        if buffer_size <= 0:
+            raise ValueError(f'Invalid I/O buffer size: {buffer_size}')
+        IO_BUFFER_SIZE = buffer_size
+    if drop_page_cache is not None:
+        DROP_PAGE_CACHE = drop_page_cache and hasattr(os, 'posix_fadvise')
+
+
+def set_io_hook(hook: Optional[Callable[[int], None]]) -> None:
+    """Call ``hook`` with the size of every block of save file read or written.
+
+    Lets ``cogs.AstroIOThrottle`` limit the bandwidth of the streams.
+
+    Args:
+        hook: Function receiving the size of the blocks, ``None`` to remove it.
+    """
+    global IO_HOOK
+    IO_HOOK = hook
+
+
+def set_exit_hook(hook: Optional[Callable[[], None]]) -> None:
+    """Call ``hook`` before ``wait_and_exit`` waits for the user.
+
+    Lets the profiler write its reports while the user reads the results.
+
+    Args:
+        hook: Function without argument, ``None`` to remove it.
+    """
+    global EXIT_HOOK
+    EXIT_HOOK = hook
+
+
+def advise_file(file, advice_name: str, offset: int = 0, length: int = 0) -> None:
+    """Give an access pattern hint about an open file to the kernel.
+
+    Args:
+        file: Open file object.
+        advice_name: Name of an ``os.POSIX_FADV_*`` constant.
+        offset: Start of the range the hint applies to.
+        length: Length of the range, ``0`` meaning up to the end of the file.
+    """
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(file.fileno(), offset, length, getattr(os, advice_name))
+
+
+def drop_file_cache(file, written: bool = False) -> None:
+    """Evict an open file from the page cache if ``DROP_PAGE_CACHE`` is set.
+
+    Only the clean pages are dropped: the pages of a written file that are
+    not on the disk yet are left to the kernel, which starts writing them
+    back, rather than waiting for them. Files that must be durable are
+    synced by their writer beforehand and are dropped entirely.
+    """
+    if not DROP_PAGE_CACHE:
+        return
+    if written:
+        file.flush()
+    advise_file(file, 'POSIX_FADV_DONTNEED')
+
+
+def read_file_blocks(path: str, offset: int = 0, length: int = None,
+                     buffer_size: int = None) -> Iterator[bytes]:
+    """Read a file sequentially, block by block.
+
+    Args:
+        path: File to read.
+        offset: Position of the first byte to read.
+        length: Number of bytes to read, up to the end of the file if ``None``.
+        buffer_size: Size of the blocks, ``IO_BUFFER_SIZE`` by default.
+
+    Yields:
+        bytes: Consecutive blocks of the file.
+    """
+    buffer_size = buffer_size or IO_BUFFER_SIZE
+    with open(path, "rb", buffering=0) as source_file:
+        advise_file(source_file, 'POSIX_FADV_SEQUENTIAL', offset, length or 0)
+        source_file.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            block = source_file.read(buffer_size if remaining is None else min(buffer_size, remaining))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            if IO_HOOK is not None:
+                IO_HOOK(len(block))
+            yield block
+        drop_file_cache(source_file)
 
 
 def get_windows_desktop_path() -> str:
     """Return the current user's desktop path."""
+    # Windows only, imported on demand
+    import winpath
     return winpath.get_desktop()
 
 
@@ -79,10 +220,139 @@ def rcontains(rgexp: str, string: str) -> bool:
     return string.rfind(rgexp) != -1
 
 
-def write_buffer_to_file(target: str, buffer: StringIO) -> None:
-    """Write an in-memory buffer to disk."""
+def write_buffer_to_file(target: str, buffer: StringIO, durable: bool = False) -> None:
+    """Write an in-memory buffer to disk.
+
+    Args:
+        target: Path of the file to write.
+        buffer: Buffer holding the content of the file.
+        durable: Flush the file to the disk before returning.
+    """
+    content = buffer.getvalue()
     with open(target, "wb") as target_save:
-        target_save.write(buffer.getvalue())
+        preallocate_file(target_save, len(content))
+        write_throttled(target_save, content)
+        if durable:
+            sync_file(target_save)
+        drop_file_cache(target_save, written=True)
+
+
+def write_blocks_to_file(target: str, blocks: Iterator[bytes], size: int) -> int:
+    """Stream blocks into a file whose final size is known in advance.
+
+    Args:
+        target: Path of the file to write.
+        blocks: Content of the file.
+        size: Expected size of the file, reserved before writing.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    written = 0
+    with open(target, "wb") as target_file:
+        preallocate_file(target_file, size)
+        for block in blocks:
+            written += write_throttled(target_file, block)
+        if written != size:
+            # The source changed since its size was read, don't keep reserved space
+            target_file.truncate(written)
+        drop_file_cache(target_file, written=True)
+    return written
+
+
+def preallocate_file(file, size: int) -> None:
+    """Reserve ``size`` bytes on the disk for an open, empty file.
+
+    Allocating the whole file at once avoids fragmentation and repeated
+    metadata updates while it grows. Does nothing where ``posix_fallocate``
+    is missing or unsupported by the file system.
+
+    Raises:
+        OSError: If there is not enough space left on the disk.
+    """
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(file.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        # EOPNOTSUPP, EINVAL...: the file will simply grow while being written
+
+
+def ensure_free_space(path: str, required: int, replaced_file: str = None) -> None:
+    """Fail fast if the disk holding ``path`` can't receive ``required`` bytes.
+
+    Args:
+        path: Existing folder where the data will be written.
+        required: Number of bytes about to be written.
+        replaced_file: File that will be overwritten, its space being reused.
+
+    Raises:
+        OSError: With ``errno.ENOSPC`` if there is not enough free space.
+    """
+    if replaced_file and os.path.isfile(replaced_file):
+        required -= os.path.getsize(replaced_file)
+
+    free_space = shutil.disk_usage(path).free
+    if required > free_space:
+        raise OSError(errno.ENOSPC,
+                      f'{required / 1024 / 1024:.2f} MB needed but only '
+                      f'{free_space / 1024 / 1024:.2f} MB free', path)
+
+
+def write_throttled(file, content: bytes) -> int:
+    """Write ``content`` to an open file within the I/O bandwidth limit.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    content = memoryview(content)
+    for start in range(0, len(content), IO_BUFFER_SIZE):
+        block = content[start:start + IO_BUFFER_SIZE]
+        if IO_HOOK is not None:
+            IO_HOOK(len(block))
+        file.write(block)
+    return len(content)
+
+
+def write_file_atomically(target: str, content: bytes) -> None:
+    """Replace ``target`` with ``content`` without ever exposing a partial file.
+
+    The content is written and flushed to a temporary file of the same folder
+    which is then renamed over ``target``.
+    """
+    temp_fd, temp_path = tempfile.mkstemp(prefix='.astrosaveconverter-', suffix='.tmp',
+                                          dir=get_dir_name(target) or None)
+    try:
+        with os.fdopen(temp_fd, "wb") as temp_file:
+            temp_file.write(content)
+            sync_file(temp_file)
+        set_replacement_mode(temp_path, target)
+        os.replace(temp_path, target)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def set_replacement_mode(temp_path: str, target: str) -> None:
+    """Give a temporary file about to replace ``target`` the permissions of ``target``.
+
+    ``tempfile.mkstemp`` creates files only their owner can read. A file
+    replacing an existing one keeps its permissions instead, and a new file
+    gets those of any file created by the process.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(target).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+    os.chmod(temp_path, mode)
+
+
+def sync_file(file) -> None:
+    """Flush an open file down to the disk."""
+    file.flush()
+    os.fsync(file.fileno())
 
 
 def append_buffer_to_file(target: str, buffer: StringIO) -> None:
@@ -93,5 +363,7 @@ def append_buffer_to_file(target: str, buffer: StringIO) -> None:
 
 def wait_and_exit(code: int) -> None:
     """Wait for user input then exit with ``code``."""
+    if EXIT_HOOK is not None:
+        EXIT_HOOK()
     input()
     sys.exit(code)